@@ -7,15 +7,52 @@ import sqlite3
 import pandas as pd
 
 from dataset import Dataset
+import grouped_aggregation
+from grouped_aggregation import LabelAggregation
+import key_tables
+import ligand_efficiency
 import sanity_checks
+import star_schema
 
 
 ########### Add Compound Properties Based on ChEMBL Data ###########
+def get_first_publication_cpd_date_query(limit_to_literature: bool) -> str:
+    """
+    Get the SQL query for the first publication year of the compounds
+    in the key table key_tables.COMPOUND_KEYS
+    (see :func:`get_first_publication_cpd_date`).
+
+    :param limit_to_literature: Include only literature sources if True.
+        Include all available sources otherwise.
+    :type limit_to_literature: bool
+    :return: SQL query
+    :rtype: str
+    """
+    # information about salts is aggregated in the parent
+    sql = f"""
+    SELECT mh.parent_molregno, MIN(docs.year) as first_publication_cpd
+    FROM {key_tables.COMPOUND_KEYS} ck
+    INNER JOIN molecule_hierarchy mh
+        ON mh.parent_molregno = ck.id
+    INNER JOIN compound_records cr
+        ON cr.molregno = mh.molregno   -- cr.molregno = salt_molregno
+    INNER JOIN docs
+        ON docs.doc_id = cr.doc_id
+    WHERE docs.year is not null
+    """
+    if limit_to_literature:
+        sql += """    and docs.src_id = 1
+    """
+    sql += """GROUP BY mh.parent_molregno"""
+
+    return sql
+
+
 def get_first_publication_cpd_date(
     chembl_con: sqlite3.Connection, limit_to_literature: bool
 ) -> pd.DataFrame:
     """
-    Query and calculate the first publication of a compound
+    Query the first publication of the compounds in the key table key_tables.COMPOUND_KEYS
     based on ChEMBL data (column name: first_publication_cpd).
     If limit_to_literature is True, this corresponds to the first appearance
     of the compound in the literature according to ChEMBL.
@@ -28,55 +65,55 @@ def get_first_publication_cpd_date(
     :return: Pandas DataFrame with parent_molregno and first_publication_cpd from ChEMBL.
     :rtype: pd.DataFrame
     """
-    # information about salts is aggregated in the parent
-    sql = """
-    SELECT DISTINCT docs.year, mh.parent_molregno
-    FROM docs
-    LEFT JOIN compound_records cr
-        ON docs.doc_id = cr.doc_id
-    INNER JOIN molecule_hierarchy mh 
-        ON cr.molregno = mh.molregno   -- cr.molregno = salt_molregno
-    WHERE docs.year is not null
-    """
-    if limit_to_literature:
-        sql += """    and docs.src_id = 1"""
+    sql = get_first_publication_cpd_date_query(limit_to_literature)
     df_docs = pd.read_sql_query(sql, con=chembl_con)
 
-    df_docs["first_publication_cpd"] = df_docs.groupby("parent_molregno")[
-        "year"
-    ].transform("min")
-    df_docs = df_docs[["parent_molregno", "first_publication_cpd"]].drop_duplicates()
-
     return df_docs
 
 
-def get_chembl_properties_and_structures(
-    chembl_con: sqlite3.Connection,
-) -> pd.DataFrame:
+def get_chembl_properties_and_structures_query() -> str:
     """
-    Get compound properties from the compound_properties table
-    (e.g., alogp, #hydrogen bond acceptors / donors, etc.).
-    Get InChI, InChI key and canonical smiles.
+    Get the SQL query for compound properties and structures
+    of the compounds in the key table key_tables.COMPOUND_KEYS
+    (see :func:`get_chembl_properties_and_structures`).
 
-    :param chembl_con: Sqlite3 connection to ChEMBL database.
-    :type chembl_con: sqlite3.Connection
-    :return: Pandas DataFrame with compound properties and structures for all compound ids in ChEMBL
-    :rtype: pd.DataFrame
+    :return: SQL query
+    :rtype: str
     """
-    sql = """
+    sql = f"""
     SELECT DISTINCT mh.parent_molregno, 
         cp.mw_freebase, cp.alogp, cp.hba, cp.hbd, cp.psa, cp.rtb, cp.ro3_pass, cp.num_ro5_violations, 
         cp.cx_most_apka, cp.cx_most_bpka, cp.cx_logp, cp.cx_logd, cp.molecular_species, cp.full_mwt, 
         cp.aromatic_rings, cp.heavy_atoms, cp.qed_weighted, cp.mw_monoisotopic, cp.full_molformula, 
         cp.hba_lipinski, cp.hbd_lipinski, cp.num_lipinski_ro5_violations, 
         struct.standard_inchi, struct.standard_inchi_key, struct.canonical_smiles
-    FROM compound_properties cp
+    FROM {key_tables.COMPOUND_KEYS} ck
+    INNER JOIN compound_properties cp
+        ON cp.molregno = ck.id
     INNER JOIN molecule_hierarchy mh
         ON cp.molregno = mh.parent_molregno
     INNER JOIN compound_structures struct
         ON mh.parent_molregno = struct.molregno
     """
 
+    return sql
+
+
+def get_chembl_properties_and_structures(
+    chembl_con: sqlite3.Connection,
+) -> pd.DataFrame:
+    """
+    Get compound properties from the compound_properties table
+    (e.g., alogp, #hydrogen bond acceptors / donors, etc.).
+    Get InChI, InChI key and canonical smiles.
+    Only compounds in the key table key_tables.COMPOUND_KEYS are taken into account.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :return: Pandas DataFrame with compound properties and structures
+    :rtype: pd.DataFrame
+    """
+    sql = get_chembl_properties_and_structures_query()
     df_cpd_props = pd.read_sql_query(sql, con=chembl_con)
 
     return df_cpd_props
@@ -106,83 +143,107 @@ def calculate_ligand_efficiency_metrics(dataset: Dataset):
     Once for the pchembl values based on binding + functional assays (BF)
     and once for the pchembl values based on binding assays only (B).
 
+    The formulas are taken from the registry in ligand_efficiency,
+    i.e., additionally registered metrics are calculated as well.
+    All metrics are calculated on NumPy arrays and the columns are appended in place.
+
     :param dataset: Dataset with compound-target pairs.
         Will be updated to include ligand efficiency metrics.
     :type dataset: Dataset
     """
-    for suffix in ["BF", "B"]:
-        dataset.df_result.loc[dataset.df_result["heavy_atoms"] != 0, f"LE_{suffix}"] = (
-            dataset.df_result[f"pchembl_value_mean_{suffix}"]
-            / dataset.df_result["heavy_atoms"]
-            * (2.303 * 298 * 0.00199)
-        )
-
-        dataset.df_result.loc[
-            dataset.df_result["mw_freebase"] != 0, f"BEI_{suffix}"
-        ] = (
-            dataset.df_result[f"pchembl_value_mean_{suffix}"]
-            * 1000
-            / dataset.df_result["mw_freebase"]
-        )
-
-        dataset.df_result.loc[dataset.df_result["psa"] != 0, f"SEI_{suffix}"] = (
-            dataset.df_result[f"pchembl_value_mean_{suffix}"]
-            * 100
-            / dataset.df_result["psa"]
-        )
-
-        dataset.df_result[f"LLE_{suffix}"] = (
-            dataset.df_result[f"pchembl_value_mean_{suffix}"]
-            - dataset.df_result["alogp"]
-        )
-
-        dataset.df_result = dataset.df_result.astype(
-            {
-                f"LE_{suffix}": "float64",
-                f"BEI_{suffix}": "float64",
-                f"SEI_{suffix}": "float64",
-                f"LLE_{suffix}": "float64",
-            }
-        )
+    # compound properties of the compound of every compound-target pair
+    df_props = star_schema.get_compound_values(
+        dataset, ligand_efficiency.get_property_columns()
+    )
+    for col, values in ligand_efficiency.calculate_metrics(
+        dataset.df_result, df_props
+    ).items():
+        dataset.df_result[col] = values
+
+
+def get_atc_classification_query() -> str:
+    """
+    Get the SQL query for ATC classifications (level 1)
+    of the compounds in the key table key_tables.COMPOUND_KEYS
+    (see :func:`get_atc_classification`).
+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = f"""
+    SELECT DISTINCT mh.parent_molregno, atc.level1, atc.level1_description
+    FROM {key_tables.COMPOUND_KEYS} ck
+    INNER JOIN molecule_hierarchy mh
+        ON mh.parent_molregno = ck.id
+    INNER JOIN molecule_atc_classification matc
+        ON matc.molregno = mh.molregno
+    INNER JOIN atc_classification atc
+        ON atc.level5 = matc.level5
+    """
+
+    return sql
 
 
 def get_atc_classification(chembl_con: sqlite3.Connection) -> pd.DataFrame:
     """
     Query ATC classifications (level 1) from the atc_classification and
-    molecule_atc_classification tables.
+    molecule_atc_classification tables
+    for the compounds in the key table key_tables.COMPOUND_KEYS.
     ATC level annotations for the same parent_molregno are combined into one description
     that concatenates all descriptions sorted alphabetically
     into one string with ' | ' as a separator.
 
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
-    :return: Pandas DataFrame with ATC annotations in ChEMBL.
+    :return: Pandas DataFrame with ATC annotations.
     :rtype: pd.DataFrame
     """
-    sql = """
-    SELECT DISTINCT mh.parent_molregno, atc.level1, atc.level1_description
-    FROM atc_classification atc
-    INNER JOIN molecule_atc_classification matc
-        ON atc.level5 = matc.level5
-    INNER JOIN molecule_hierarchy mh
-        ON matc.molregno = mh.molregno
-    """
-
+    sql = get_atc_classification_query()
     atc_levels = pd.read_sql_query(sql, con=chembl_con)
     atc_levels["l1_full"] = (
         atc_levels["level1"] + "_" + atc_levels["level1_description"]
     )
 
     # Combine ATC level annotations
-    between_str_join = " | "
-    atc_levels["atc_level1"] = atc_levels.groupby(["parent_molregno"])[
-        "l1_full"
-    ].transform(lambda x: between_str_join.join(sorted(x)))
-    atc_levels = atc_levels[["parent_molregno", "atc_level1"]].drop_duplicates()
+    atc_levels = grouped_aggregation.join_labels(
+        atc_levels, "parent_molregno", LabelAggregation("atc_level1", "l1_full", " | ")
+    )
 
     return atc_levels
 
 
+def get_compound_annotations(
+    chembl_con: sqlite3.Connection,
+    parent_molregnos: pd.Series,
+    limit_to_literature: bool,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Get the first publication date, the compound properties and structures
+    and the ATC classifications of the given compounds.
+    The compound ids are staged in a key table (see key_tables)
+    so that all queries only read the rows of these compounds.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param parent_molregnos: Compound ids
+    :type parent_molregnos: pd.Series
+    :param limit_to_literature: Base first_publication_cpd on literature sources only if True.
+        Base it on all available sources otherwise.
+    :type limit_to_literature: bool
+    :return: Pandas DataFrame with the first publication dates,
+        Pandas DataFrame with compound properties and structures,
+        Pandas DataFrame with ATC annotations
+    :rtype: tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+    """
+    key_tables.stage_keys(chembl_con, key_tables.COMPOUND_KEYS, parent_molregnos)
+    df_docs = get_first_publication_cpd_date(chembl_con, limit_to_literature)
+    df_cpd_props = get_chembl_properties_and_structures(chembl_con)
+    atc_levels = get_atc_classification(chembl_con)
+    key_tables.stage_keys(chembl_con, key_tables.COMPOUND_KEYS, [])
+
+    return df_docs, df_cpd_props, atc_levels
+
+
 def add_all_chembl_compound_properties(
     dataset: Dataset, chembl_con: sqlite3.Connection, limit_to_literature: bool
 ):
@@ -195,6 +256,10 @@ def add_all_chembl_compound_properties(
     - ligand efficiency metrics
     - ATC classifications
 
+    Compound properties are only queried for the compounds in the dataset and
+    are added to the compound dimension table (see star_schema) in one join,
+    ligand efficiency metrics are added to the compound-target pairs.
+
     :param dataset: Dataset with compound-target pairs.
         Will be updated to include compound properties.
     :type dataset: Dataset
@@ -204,24 +269,25 @@ def add_all_chembl_compound_properties(
         Base it on all available sources otherwise.
     :type limit_to_literature: bool
     """
-    df_docs = get_first_publication_cpd_date(chembl_con, limit_to_literature)
-    dataset.df_result = dataset.df_result.merge(
-        df_docs, on="parent_molregno", how="left"
+    df_docs, df_cpd_props, atc_levels = get_compound_annotations(
+        chembl_con, dataset.df_compounds["parent_molregno"], limit_to_literature
     )
-
-    df_cpd_props = get_chembl_properties_and_structures(chembl_con)
     dataset.df_cpd_props = df_cpd_props
-    dataset.df_result = dataset.df_result.merge(
-        df_cpd_props, on="parent_molregno", how="left"
+    dataset.atc_levels = atc_levels
+
+    df_annotations = df_docs.merge(
+        df_cpd_props, on="parent_molregno", how="outer"
+    ).merge(atc_levels, on="parent_molregno", how="outer")
+    dataset.df_compounds = dataset.df_compounds.merge(
+        df_annotations, on="parent_molregno", how="left"
     )
-    sanity_checks.check_compound_props(dataset.df_result, df_cpd_props)
+    sanity_checks.check_compound_props(dataset.df_compounds, df_cpd_props)
+    sanity_checks.check_atc(dataset.df_compounds, atc_levels)
 
     calculate_ligand_efficiency_metrics(dataset)
-    sanity_checks.check_ligand_efficiency_metrics(dataset.df_result)
-
-    atc_levels = get_atc_classification(chembl_con)
-    dataset.atc_levels = atc_levels
-    dataset.df_result = dataset.df_result.merge(
-        atc_levels, on="parent_molregno", how="left"
+    sanity_checks.check_ligand_efficiency_metrics(
+        dataset.df_result,
+        star_schema.get_compound_values(
+            dataset, ligand_efficiency.get_property_columns()
+        ),
     )
-    sanity_checks.check_atc(dataset.df_result, atc_levels)
@@ -10,23 +10,21 @@ import pandas as pd
 
 from arguments import OutputArgs, CalculationArgs
 from dataset import Dataset
+import grouped_aggregation
+from grouped_aggregation import LabelAggregation
 import output
 import sanity_checks
+import star_schema
 
 
 ########### Add Target Class Annotations Based on ChEMBL Data ###########
-def get_target_class_table(
-    chembl_con: sqlite3.Connection, current_tids: set[int]
-) -> pd.DataFrame:
+def get_target_classes_query() -> str:
     """
-    Get level 1 and level 2 target class annotations in ChEMBL.
+    Get the SQL query for the protein classifications of targets
+    (see :func:`get_target_class_table`).
 
-    :param chembl_con: Sqlite3 connection to ChEMBL database.
-    :type chembl_con: sqlite3.Connection
-    :param current_tids: Set of target ids to take into account
-    :type current_tids: set[int]
-    :return: Pandas DataFrame with target class information
-    :rtype: pd.DataFrame
+    :return: SQL query
+    :rtype: str
     """
     sql = """
     SELECT DISTINCT tc.tid, 
@@ -41,13 +39,17 @@ def get_target_class_table(
         ON cs.component_id = tc.component_id
     """
 
-    df_target_classes = pd.read_sql_query(sql, con=chembl_con)
+    return sql
 
-    # only interested in the target ids that are in the current dataset
-    df_target_classes = df_target_classes[df_target_classes["tid"].isin(current_tids)]
 
-    # Query the protein_classification table for the protein classification hierarchy
-    # and merge it with the target class information for specific tids.
+def get_target_class_hierarchy_query() -> str:
+    """
+    Get the SQL query for the protein classification hierarchy
+    (see :func:`get_target_class_table`).
+
+    :return: SQL query
+    :rtype: str
+    """
     sql = """
     WITH RECURSIVE pc_hierarchy AS (
         SELECT protein_class_id,
@@ -71,6 +73,31 @@ def get_target_class_table(
     FROM pc_hierarchy
     """
 
+    return sql
+
+
+def get_target_class_table(
+    chembl_con: sqlite3.Connection, current_tids: set[int]
+) -> pd.DataFrame:
+    """
+    Get level 1 and level 2 target class annotations in ChEMBL.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param current_tids: Set of target ids to take into account
+    :type current_tids: set[int]
+    :return: Pandas DataFrame with target class information
+    :rtype: pd.DataFrame
+    """
+    sql = get_target_classes_query()
+    df_target_classes = pd.read_sql_query(sql, con=chembl_con)
+
+    # only interested in the target ids that are in the current dataset
+    df_target_classes = df_target_classes[df_target_classes["tid"].isin(current_tids)]
+
+    # Query the protein_classification table for the protein classification hierarchy
+    # and merge it with the target class information for specific tids.
+    sql = get_target_class_hierarchy_query()
     target_class_hierarchy = pd.read_sql_query(sql, con=chembl_con)
     target_class_hierarchy[["l0", "l1", "l2", "l3", "l4", "l5", "l6"]] = (
         target_class_hierarchy["names"].str.split("|", expand=True)
@@ -103,49 +130,25 @@ def get_aggregated_target_classes(
     current_tids = set(dataset.df_result["tid"])
     df_target_classes = get_target_class_table(chembl_con, current_tids)
 
-    between_str_join = "|"
-
     # Summarise the information for a target id with
     # several assigned target classes of level 1 into one description.
     # If a target id has more than one assigned target class,
     # the target class 'Unclassified protein' is discarded.
-    level = "l1"
-    target_classes_level1 = df_target_classes[["tid", level]].drop_duplicates().dropna()
-
-    # remove 'Unclassified protein' from targets with more than one target class, level 1
-    nof_classes = target_classes_level1.groupby(["tid"])[level].count()
-    target_classes_level1 = target_classes_level1[
-        (
-            target_classes_level1["tid"].isin(
-                nof_classes[nof_classes == 1].index.tolist()
-            )
-        )
-        | (
-            (
-                target_classes_level1["tid"].isin(
-                    nof_classes[nof_classes > 1].index.tolist()
-                )
-            )
-            & (target_classes_level1["l1"] != "Unclassified protein")
-        )
-    ]
-
-    target_classes_level1["target_class_l1"] = target_classes_level1.groupby(["tid"])[
-        level
-    ].transform(lambda x: between_str_join.join(sorted(x)))
-    target_classes_level1 = target_classes_level1[
-        ["tid", "target_class_l1"]
-    ].drop_duplicates()
+    target_classes_level1 = grouped_aggregation.join_labels(
+        df_target_classes,
+        "tid",
+        LabelAggregation(
+            "target_class_l1",
+            "l1",
+            "|",
+            exclude_from_multiple=frozenset(["Unclassified protein"]),
+        ),
+    )
 
     # Repeat the summary step for target classes of level 2.
-    level = "l2"
-    target_classes_level2 = df_target_classes[["tid", level]].drop_duplicates().dropna()
-    target_classes_level2["target_class_l2"] = target_classes_level2.groupby(["tid"])[
-        level
-    ].transform(lambda x: between_str_join.join(sorted(x)))
-    target_classes_level2 = target_classes_level2[
-        ["tid", "target_class_l2"]
-    ].drop_duplicates()
+    target_classes_level2 = grouped_aggregation.join_labels(
+        df_target_classes, "tid", LabelAggregation("target_class_l2", "l2", "|")
+    )
 
     return target_classes_level1, target_classes_level2
 
@@ -165,9 +168,11 @@ def output_ambiguous_target_classes(
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
     """
-    more_than_one_level_1 = dataset.df_result[
-        (dataset.df_result["target_class_l1"].notnull())
-        & (dataset.df_result["target_class_l1"].str.contains("|", regex=False))
+    # targets in order of their first appearance in the compound-target pairs
+    df_targets = star_schema.get_ordered_targets(dataset)
+    more_than_one_level_1 = df_targets[
+        (df_targets["target_class_l1"].notnull())
+        & (df_targets["target_class_l1"].str.contains("|", regex=False))
     ][
         ["tid", "target_pref_name", "target_type", "target_class_l1", "target_class_l2"]
     ].drop_duplicates()
@@ -175,9 +180,9 @@ def output_ambiguous_target_classes(
         "Targets with more than one level 1 target class assignment: %s",
         len(more_than_one_level_1),
     )
-    more_than_one_level_2 = dataset.df_result[
-        (dataset.df_result["target_class_l2"].notnull())
-        & (dataset.df_result["target_class_l2"].str.contains("|", regex=False))
+    more_than_one_level_2 = df_targets[
+        (df_targets["target_class_l2"].notnull())
+        & (df_targets["target_class_l2"].str.contains("|", regex=False))
     ][
         ["tid", "target_pref_name", "target_type", "target_class_l1", "target_class_l2"]
     ].drop_duplicates()
@@ -212,7 +217,8 @@ def add_chembl_target_class_annotations(
     out: OutputArgs,
 ):
     """
-    Add level 1 and 2 target class annotations.
+    Add level 1 and 2 target class annotations to the target dimension table
+    (see star_schema).
     Assignments for target IDs with more than one target class assignment per level
     are summarised into one string with '|' as a separator
     between the different target class annotations.
@@ -238,16 +244,16 @@ def add_chembl_target_class_annotations(
         dataset, chembl_con
     )
 
-    dataset.df_result = dataset.df_result.merge(
+    dataset.df_targets = dataset.df_targets.merge(
         target_classes_level1, on="tid", how="left"
     )
 
-    dataset.df_result = dataset.df_result.merge(
+    dataset.df_targets = dataset.df_targets.merge(
         target_classes_level2, on="tid", how="left"
     )
 
     sanity_checks.check_target_classes(
-        dataset.df_result, target_classes_level1, target_classes_level2
+        dataset.df_targets, target_classes_level1, target_classes_level2
     )
 
     output_ambiguous_target_classes(dataset, args, out)
@@ -2,7 +2,105 @@
 Add DTI (Drug-Target Interaction) Annotations to the dataset.
 """
 
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
 from dataset import Dataset
+import star_schema
+
+
+########### DTI Rule Table ###########
+@dataclass(frozen=True)
+class DTIRule:
+    """
+    Row of the DTI rule table.
+    Conditions that are None match every value.
+
+    - in_dm_table:        Is the compound-target pair in the drug_mechanism table?
+    - max_phase:          Phase bucket of the compound (1-4, 0 for any other max_phase)
+    - therapeutic_target: Is the target in the drug_mechanism table?
+    - label:              DTI annotation
+    """
+
+    in_dm_table: Optional[bool]
+    max_phase: Optional[int]
+    therapeutic_target: Optional[bool]
+    label: str
+
+
+# see add_dti_annotations, the first matching rule is used
+DTI_RULES = [
+    DTIRule(True, 4, None, "D_DT"),
+    DTIRule(True, 3, None, "C3_DT"),
+    DTIRule(True, 2, None, "C2_DT"),
+    DTIRule(True, 1, None, "C1_DT"),
+    DTIRule(True, 0, None, "C0_DT"),
+    DTIRule(False, None, True, "DT"),
+    DTIRule(False, None, False, "NDT"),
+]
+# labels of compound-target pairs that are discarded
+DISCARDED_LABELS = {"NDT"}
+
+MAX_PHASE_BUCKETS = [0, 1, 2, 3, 4]
+
+
+def get_rule_lookup(rules: list[DTIRule]) -> tuple[np.ndarray, list[str]]:
+    """
+    Expand the rule table into a lookup array from the combined condition code
+    (see get_condition_codes) to the position of the label in the list of labels.
+
+    :param rules: Rule table
+    :type rules: list[DTIRule]
+    :return: Lookup array (-1 if no rule matches),
+        list of labels in the order of the rules
+    :rtype: tuple[np.ndarray, list[str]]
+    """
+    labels = list(dict.fromkeys(rule.label for rule in rules))
+    lookup = np.full(2 * len(MAX_PHASE_BUCKETS) * 2, -1, dtype="int8")
+    for in_dm_table in [False, True]:
+        for max_phase in MAX_PHASE_BUCKETS:
+            for therapeutic_target in [False, True]:
+                for rule in rules:
+                    if (
+                        rule.in_dm_table in (None, in_dm_table)
+                        and rule.max_phase in (None, max_phase)
+                        and rule.therapeutic_target in (None, therapeutic_target)
+                    ):
+                        lookup[
+                            get_condition_codes(
+                                in_dm_table, max_phase, therapeutic_target
+                            )
+                        ] = labels.index(rule.label)
+                        break
+    return lookup, labels
+
+
+def get_condition_codes(
+    in_dm_table: Union[bool, np.ndarray],
+    max_phase: Union[int, np.ndarray],
+    therapeutic_target: Union[bool, np.ndarray],
+) -> Union[int, np.ndarray]:
+    """
+    Combine the conditions of the rule table into one integer code.
+    Works for scalars and arrays.
+
+    :param in_dm_table: Is the compound-target pair in the drug_mechanism table?
+    :type in_dm_table: Union[bool, np.ndarray]
+    :param max_phase: Phase bucket of the compound, see MAX_PHASE_BUCKETS
+    :type max_phase: Union[int, np.ndarray]
+    :param therapeutic_target: Is the target in the drug_mechanism table?
+    :type therapeutic_target: Union[bool, np.ndarray]
+    :return: Combined condition code(s)
+    :rtype: Union[int, np.ndarray]
+    """
+    return (
+        np.multiply(in_dm_table, 2 * len(MAX_PHASE_BUCKETS))
+        + np.multiply(max_phase, 2)
+        + np.asarray(therapeutic_target, dtype="int64")
+    )
 
 
 ########### DTI (Drug-Target Interaction) Annotations ###########
@@ -19,7 +117,7 @@ def add_dti_annotations(
     - What is the max_phase of the compound? = Is it a drug / clinical compound?
     - Is the target in the drug_mechanisms table = Is it a therapeutic target?
 
-    The assigments are based on the following table:
+    The assigments are based on the following table (see DTI_RULES):
 
     +------------+----------+-----------+-----------+---------------------------------------------+
     |in DM table?|max_phase?|th. target?|DTI        |explanation                                  |
@@ -69,88 +167,32 @@ def add_dti_annotations(
         - set of targets in the drug_mechanism table
     :type dataset: Dataset
     """
-    # Add a new column *therapeutic_target* which is set to True
-    # if the target is in the drug_mechanism table
-    dataset.df_result["therapeutic_target"] = dataset.df_result["tid"].isin(
-        dataset.drug_mechanism_targets_set
+    # Membership tests are calculated once.
+    in_dm_table = (
+        dataset.df_result["cpd_target_pair"]
+        .isin(dataset.drug_mechanism_pairs_set)
+        .to_numpy()
     )
-
-    # Assign the annotations based on the table.
-    # Compound-target pairs from the drug mechanism table
-    dataset.df_result.loc[
-        (
-            dataset.df_result["cpd_target_pair"].isin(dataset.drug_mechanism_pairs_set)
-            & (dataset.df_result["max_phase"] == 4)
-        ),
-        "DTI",
-    ] = "D_DT"
-
-    dataset.df_result.loc[
-        (
-            dataset.df_result["cpd_target_pair"].isin(dataset.drug_mechanism_pairs_set)
-            & (dataset.df_result["max_phase"] == 3)
-        ),
-        "DTI",
-    ] = "C3_DT"
-
-    dataset.df_result.loc[
-        (
-            dataset.df_result["cpd_target_pair"].isin(dataset.drug_mechanism_pairs_set)
-            & (dataset.df_result["max_phase"] == 2)
-        ),
-        "DTI",
-    ] = "C2_DT"
-
-    dataset.df_result.loc[
-        (
-            dataset.df_result["cpd_target_pair"].isin(dataset.drug_mechanism_pairs_set)
-            & (dataset.df_result["max_phase"] == 1)
-        ),
-        "DTI",
-    ] = "C1_DT"
-
-    # Compounds that are in the drug_mechanism table but don't have a known phase between 1-4:
-    dataset.df_result.loc[
-        (
-            dataset.df_result["cpd_target_pair"].isin(dataset.drug_mechanism_pairs_set)
-            & (~dataset.df_result["max_phase"].isin([1, 2, 3, 4]))
-        ),
-        "DTI",
-    ] = "C0_DT"
-
-    # Target is in the drug mechanism table
-    dataset.df_result.loc[
-        (
-            (
-                ~dataset.df_result["cpd_target_pair"].isin(
-                    dataset.drug_mechanism_pairs_set
-                )
-            )
-            & (dataset.df_result["therapeutic_target"])
-        ),
-        "DTI",
-    ] = "DT"
-
-    # Other compound-target pairs
-    # if target is not a therapeutic target, 'cpd_target_pair' cannot be in DTIs_set
-    # (~dataset.df_result['cpd_target_pair'].isin(DTIs_set)) is included for clarity
-    dataset.df_result.loc[
-        (
-            (
-                ~dataset.df_result["cpd_target_pair"].isin(
-                    dataset.drug_mechanism_pairs_set
-                )
-            )
-            & ~(dataset.df_result["therapeutic_target"])
-        ),
-        "DTI",
-    ] = "NDT"
-
-    # Discard NDT rows
-    dataset.df_result = dataset.df_result[
-        (
-            dataset.df_result["DTI"].isin(
-                ["D_DT", "C3_DT", "C2_DT", "C1_DT", "C0_DT", "DT"]
-            )
-        )
+    therapeutic_target = (
+        dataset.df_result["tid"].isin(dataset.drug_mechanism_targets_set).to_numpy()
+    )
+    # max_phase of the compound of every compound-target pair
+    # (1-4, any other value is grouped into bucket 0)
+    max_phase = star_schema.get_compound_values(dataset, ["max_phase"])["max_phase"]
+    max_phase = max_phase.where(max_phase.isin([1, 2, 3, 4]), 0).to_numpy(dtype="int64")
+
+    # Assign the annotations based on the rule table in one lookup.
+    lookup, labels = get_rule_lookup(DTI_RULES)
+    label_codes = lookup[
+        get_condition_codes(in_dm_table, max_phase, therapeutic_target)
     ]
+    assert (label_codes >= 0).all(), "No DTI rule matches some compound-target pairs"
+
+    # Discard NDT rows while adding the annotations.
+    keep = ~np.isin(label_codes, [labels.index(label) for label in DISCARDED_LABELS])
+    dataset.df_result = dataset.df_result[keep].assign(
+        therapeutic_target=therapeutic_target[keep],
+        DTI=pd.Categorical.from_codes(label_codes[keep], categories=labels),
+    )
+    # Discard compounds and targets that were only part of NDT pairs
+    star_schema.prune_dimensions(dataset)
@@ -4,174 +4,362 @@ Add filtering columns for obtaining the different subsets to the dataset.
 
 import logging
 import os
+from dataclasses import dataclass
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
 from arguments import CalculationArgs, OutputArgs
 from dataset import Dataset
+import export_scheduler
 import get_stats
+import ligand_efficiency
 import output
+import sanity_checks
+import star_schema
 
+# DTI annotations of compound-target pairs with a known interaction
+KNOWN_INTERACTIONS = ["D_DT", "C3_DT", "C2_DT", "C1_DT", "C0_DT"]
+# DTI annotation of known drug-target interactions
+DRUG_TARGET_INTERACTIONS = ["D_DT"]
 
-def get_data_subsets(data: pd.DataFrame, min_nof_cpds: int, desc: str) -> tuple[
-    tuple[pd.DataFrame, str],
-    tuple[pd.DataFrame, str],
-    tuple[pd.DataFrame, str],
-    tuple[pd.DataFrame, str],
-]:
+
+@dataclass(frozen=True)
+class TargetCodes:
+    """
+    Integer codes of the targets (tid_mutation) of the compound-target pairs
+    and the DTI flags used to define the subsets.
+    All arrays are aligned with the rows of dataset.df_result.
+
+    - codes:                    Code of the target of every row (0, ..., nof_targets - 1)
+    - nof_targets:              Number of unique targets
+    - known_interaction:        True if the row is labelled as \
+                                    'D_DT', 'C3_DT', 'C2_DT', 'C1_DT' or 'C0_DT'
+    - drug_target_interaction:  True if the row is labelled as 'D_DT'
+    """
+
+    codes: np.ndarray
+    nof_targets: int
+    known_interaction: np.ndarray
+    drug_target_interaction: np.ndarray
+
+
+def get_target_codes(df_result: pd.DataFrame) -> TargetCodes:
+    """
+    Encode the targets of df_result as integer codes and flag the DTI annotations.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :return: Target codes and DTI flags of the rows of df_result
+    :rtype: TargetCodes
+    """
+    codes, targets = pd.factorize(df_result["tid_mutation"])
+    return TargetCodes(
+        codes,
+        len(targets),
+        df_result["DTI"].isin(KNOWN_INTERACTIONS).to_numpy(),
+        df_result["DTI"].isin(DRUG_TARGET_INTERACTIONS).to_numpy(),
+    )
+
+
+def count_per_target(target_codes: TargetCodes, rows: np.ndarray) -> np.ndarray:
+    """
+    Count the selected rows per target.
+
+    :param target_codes: Target codes of the rows of df_result
+    :type target_codes: TargetCodes
+    :param rows: Boolean mask of the selected rows of df_result
+    :type rows: np.ndarray
+    :return: Number of selected rows for every target code
+    :rtype: np.ndarray
     """
-    Calculate and return the different subsets of interest.
+    return np.bincount(target_codes.codes[rows], minlength=target_codes.nof_targets)
+
+
+@dataclass(frozen=True)
+class Subset:
+    """
+    Subset of the compound-target pairs in dataset.df_result.
+
+    - rows:          Boolean mask of the rows of dataset.df_result in the subset
+    - desc:          Description of the subset, used as name of the filtering column \
+                        and in file names (e.g., BF_100_d_dt)
+    - min_nof_cpds:  Minimum number of compounds per target, None for the BF / B subsets
+    - parent:        Boolean mask of the rows of the subset it is based on, \
+                        None for the BF / B subsets
+    """
+
+    rows: np.ndarray
+    desc: str
+    min_nof_cpds: Optional[int] = None
+    parent: Optional[np.ndarray] = None
+
 
-    - data: Pandas DataFrame with compound-target pairs \
-            without filtering columns and without \
-            the annotations for the opposite desc, \
-            e.g. if desc = "BF", the average pchembl value based on \
-            binding data only is dropped
-    - df_enough_cpds: Pandas DataFrame with targets \
-            with at least <min_nof_cpds> compounds with a pchembl value,
-    - df_c_dt_d_dt: As df_enough_cpds but with \
+def get_subsets(
+    df_result: pd.DataFrame,
+    target_codes: TargetCodes,
+    rows: np.ndarray,
+    min_nof_cpds: tuple[int, ...],
+    desc: str,
+) -> list[Subset]:
+    """
+    Calculate the boolean row masks of the different subsets of interest
+    for every threshold <n> in min_nof_cpds.
+
+    - rows: Compound-target pairs based on <desc> assays
+    - <desc>_<n>: As rows but restricted to targets \
+            with at least <n> compounds with a pchembl value,
+    - <desc>_<n>_c_dt_d_dt: As <desc>_<n> but with \
             at least one compound-target pair labelled as \
             'D_DT', 'C3_DT', 'C2_DT', 'C1_DT' or 'C0_DT' (i.e., known interaction),
-    - df_d_dt: As df_enough_cpds but with \
+    - <desc>_<n>_d_dt: As <desc>_<n> but with \
             at least one compound-target pair labelled as \
             'D_DT' (i.e., known drug-target interaction)
 
-    :param data: Pandas DataFrame with compound-target pairs
-    :type data: pd.DataFrame
-    :param min_nof_cpds: Miminum number of compounds per target
-    :type min_nof_cpds: int
-    :param desc: Types of assays current_df contains information about. \
+    The counts per target are calculated once,
+    every threshold only compares them to <n>.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :param target_codes: Target codes of the rows of df_result
+    :type target_codes: TargetCodes
+    :param rows: Boolean mask of the rows of df_result based on <desc> assays
+    :type rows: np.ndarray
+    :param min_nof_cpds: Thresholds for the miminum number of compounds per target
+    :type min_nof_cpds: tuple[int, ...]
+    :param desc: Types of assays the rows contain information about. \
         Options: "BF" (binding+functional), "B" (binding)
     :type desc: str
-    :return: List of dataset subsets and the string describing them.
-    :rtype: tuple[tuple[pd.DataFrame, str],
-           tuple[pd.DataFrame, str],
-           tuple[pd.DataFrame, str],
-           tuple[pd.DataFrame, str]]
+    :return: List of subsets, starting with the subset of all rows
+    :rtype: list[Subset]
+    """
+    codes = target_codes.codes
+    has_pchembl = df_result[f"pchembl_value_mean_{desc}"].notnull().to_numpy()
+    nof_cpds = count_per_target(target_codes, rows & has_pchembl)
+    # Since every subset contains all or none of the rows of a target,
+    # the targets with a known interaction (drug-target interaction) in a subset
+    # are the targets of the subset with a known interaction (drug-target interaction)
+    # in rows.
+    has_known_interaction = (
+        count_per_target(target_codes, rows & target_codes.known_interaction) > 0
+    )
+    has_drug_target_interaction = (
+        count_per_target(target_codes, rows & target_codes.drug_target_interaction) > 0
+    )
+
+    subsets = [Subset(rows, desc)]
+    for min_nof in min_nof_cpds:
+        # Restrict the dataset to targets with at least *min_nof* compounds
+        # with a pchembl value.
+        enough_cpds = nof_cpds >= min_nof
+        enough_cpds_rows = rows & enough_cpds[codes]
+        subsets += [
+            Subset(enough_cpds_rows, f"{desc}_{min_nof}", min_nof, rows),
+            # Restrict the dataset further to targets
+            # with at least one compound-target pair labelled as
+            # 'D_DT', 'C3_DT', 'C2_DT', 'C1_DT' or 'C0_DT',
+            # i.e., compound-target pairs with a known interactions.
+            Subset(
+                rows & (enough_cpds & has_known_interaction)[codes],
+                f"{desc}_{min_nof}_c_dt_d_dt",
+                min_nof,
+                enough_cpds_rows,
+            ),
+            # Restrict the dataset further to targets with
+            # at least one compound-target pair labelled as 'D_DT',
+            # i.e., known drug-target interactions.
+            Subset(
+                rows & (enough_cpds & has_drug_target_interaction)[codes],
+                f"{desc}_{min_nof}_d_dt",
+                min_nof,
+                enough_cpds_rows,
+            ),
+        ]
+    return subsets
+
+
+def get_subset_stats(
+    df_result: pd.DataFrame, target_codes: TargetCodes, subsets: list[Subset]
+) -> list[list]:
+    """
+    Count the targets, compounds and compound-target pairs
+    in every subset with a filtering column.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :param target_codes: Target codes of the rows of df_result
+    :type target_codes: TargetCodes
+    :param subsets: Subsets, see get_subsets
+    :type subsets: list[Subset]
+    :return: One row per subset with the filtering column, the threshold
+        and the counts
+    :rtype: list[list]
+    """
+    parent_molregno = df_result["parent_molregno"].to_numpy()
+    stats = []
+    for subset in subsets:
+        if subset.min_nof_cpds is None:
+            continue
+        stats.append(
+            [
+                subset.desc,
+                subset.min_nof_cpds,
+                int((count_per_target(target_codes, subset.rows) > 0).sum()),
+                len(np.unique(parent_molregno[subset.rows])),
+                int(subset.rows.sum()),
+            ]
+        )
+    return stats
+
+
+def get_subset_columns(columns: list[str], desc: str) -> list[str]:
+    """
+    Get the columns of the <desc> subsets,
+    i.e., all columns without filtering columns and without
+    the annotations for the opposite desc,
+    e.g. if desc = "BF", the average pchembl value based on
+    binding data only is dropped.
+
+    :param columns: Columns of the dataset, e.g.,
+        the columns of the wide table (see star_schema.get_columns)
+        or the columns of the fact table
+    :type columns: list[str]
+    :param desc: Assay description, \
+        either "BF" (binding+functional) or "B" (binding)
+    :type desc: str
+    :return: List of columns in the order of columns
+    :rtype: list[str]
     """
     if desc == "B":
         drop_desc = "BF"
     else:
         drop_desc = "B"
-    data = data.drop(
-        columns=[
+    drop_columns = set(
+        [
             f"pchembl_value_mean_{drop_desc}",
             f"pchembl_value_max_{drop_desc}",
             f"pchembl_value_median_{drop_desc}",
             f"first_publication_cpd_target_pair_{drop_desc}",
             f"first_publication_cpd_target_pair_w_pchembl_{drop_desc}",
-            f"LE_{drop_desc}",
-            f"BEI_{drop_desc}",
-            f"SEI_{drop_desc}",
-            f"LLE_{drop_desc}",
         ]
-        + [  # exclude columns related to the other assay types
-            col for col in data.columns if col.startswith("B_") or col.startswith("BF_")
-        ]  # exclude filtering columns
-    ).drop_duplicates()
-
-    # Restrict the dataset to targets with at least *min_nof_cpds* compounds with a pchembl value.
-    comparator_counts = (
-        data[data[f"pchembl_value_mean_{desc}"].notnull()]
-        .groupby(["tid_mutation"])["parent_molregno"]
-        .count()
-    )
-    # pylint: disable-next=unused-variable
-    targets_w_enough_cpds = comparator_counts[
-        comparator_counts >= min_nof_cpds
-    ].index.tolist()
-    df_enough_cpds = data.query("tid_mutation in @targets_w_enough_cpds")
-
-    # Restrict the dataset further to targets
-    # with at least one compound-target pair labelled as
-    # 'D_DT', 'C3_DT', 'C2_DT', 'C1_DT' or 'C0_DT',
-    # i.e., compound-target pairs with a known interactions.
-    # pylint: disable-next=unused-variable
-    c_dt_d_dt_targets = set(
-        df_enough_cpds[
-            df_enough_cpds["DTI"].isin(["D_DT", "C3_DT", "C2_DT", "C1_DT", "C0_DT"])
-        ].tid_mutation.to_list()
-    )
-    df_c_dt_d_dt = df_enough_cpds.query("tid_mutation in @c_dt_d_dt_targets")
-
-    # Restrict the dataset further to targets with
-    # at least one compound-target pair labelled as 'D_DT',
-    # i.e., known drug-target interactions.
-    # pylint: disable-next=unused-variable
-    d_dt_targets = set(
-        df_enough_cpds[df_enough_cpds["DTI"] == "D_DT"].tid_mutation.to_list()
+        + ligand_efficiency.get_metric_columns(drop_desc)
     )
-    df_d_dt = df_enough_cpds.query("tid_mutation in @d_dt_targets")
-
     return [
-        [data, f"{desc}"],
-        [df_enough_cpds, f"{desc}_{min_nof_cpds}"],
-        [df_c_dt_d_dt, f"{desc}_{min_nof_cpds}_c_dt_d_dt"],
-        [df_d_dt, f"{desc}_{min_nof_cpds}_d_dt"],
+        col
+        for col in columns
+        if col not in drop_columns
+        # exclude filtering columns
+        and not (col.startswith("B_") or col.startswith("BF_"))
     ]
 
 
-def add_subset_filtering_columns(
-    df_combined_subset: pd.DataFrame,
+def get_assay_rows(df_result: pd.DataFrame, desc: str) -> np.ndarray:
+    """
+    Get the rows of df_result based on <desc> assays.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :param desc: Assay description, \
+        either "BF" (binding+functional) or "B" (binding)
+    :type desc: str
+    :return: Boolean mask of the rows
+    :rtype: np.ndarray
+    """
+    if desc == "BF":
+        return np.ones(len(df_result), dtype=bool)
+    # binding data only
+    return df_result["keep_for_binding"].to_numpy(dtype=bool)
+
+
+def write_subsets(
     dataset: Dataset,
-    desc: str,
+    subsets: dict[str, list[Subset]],
     args: CalculationArgs,
     out: OutputArgs,
 ):
+    """
+    Write the BF subsets (if out.write_bf) and the B subsets (if out.write_b).
+    Writing, checking and the stats of all subsets are run
+    with out.export_workers threads (see export_scheduler).
+    All tasks are finished when the function returns,
+    i.e., dataset.df_result is not modified while the subsets are written.
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :param subsets: Dictionary from the assay description (BF / B) to its subsets
+    :type subsets: dict[str, list[Subset]]
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
+    :param out: Arguments related to how to output the dataset
+    :type out: OutputArgs
+    """
+    with export_scheduler.ExportScheduler(out.export_workers) as scheduler:
+        for desc, desc_subsets in subsets.items():
+            if not ((desc == "BF" and out.write_bf) or (desc == "B" and out.write_b)):
+                continue
+            subset_columns = get_subset_columns(star_schema.get_columns(dataset), desc)
+            for subset in desc_subsets:
+                name_subset = os.path.join(
+                    out.output_path,
+                    f"ChEMBL{args.chembl_version}_"
+                    f"CTI_{args.limited_flag}_"
+                    f"{subset.desc}",
+                )
+                output.schedule_write_and_check_output(
+                    scheduler,
+                    dataset,
+                    name_subset,
+                    out,
+                    (subset.rows, subset_columns),
+                )
+
+
+def add_subset_filtering_columns(
+    dataset: Dataset,
+    target_codes: TargetCodes,
+    subsets: list[Subset],
+    desc: str,
+) -> list[list]:
     """
     Add filtering column for binding + functional vs binding
+    for every threshold in args.min_nof_cpds.
 
-    :param df_combined_subset: Subset with binding+functional (BF) \
-        or binding (B) assay-based data \
-        in df_combined
-    :type df_combined_subset: pd.DataFrame
     :param dataset: Dataset with compound-target pairs. \
         Will be updated to only include filtering columns.
     :type dataset: Dataset
+    :param target_codes: Target codes of the rows of dataset.df_result
+    :type target_codes: TargetCodes
+    :param subsets: Subsets based on <desc> assays, see get_subsets
+    :type subsets: list[Subset]
     :param desc: Assay description, \
         either "BF" (binding+functional) or "B" (binding)
     :type desc: str
-    :param args: Arguments related to how to calculate the dataset
-    :type args: CalculationArgs
-    :param out: Arguments related to how to output the dataset
-    :type out: OutputArgs
+    :return: Counts per filtering column, see get_subset_stats
+    :rtype: list[list]
     """
-    subsets = get_data_subsets(
-        df_combined_subset,
-        args.min_nof_cpds_bf if desc == "BF" else args.min_nof_cpds_b,
-        desc,
-    )
-
-    # write subsets if required
-    if (desc == "BF" and out.write_bf) or (desc == "B" and out.write_b):
-        for [df_subset, subset_desc] in subsets:
-            name_subset = os.path.join(
-                out.output_path,
-                f"ChEMBL{args.chembl_version}_"
-                f"CTI_{args.limited_flag}_"
-                f"{subset_desc}",
-            )
-            output.write_and_check_output(
-                df_subset,
-                name_subset,
-                desc,
-                args,
-                out,
-            )
+    # the debugging info only needs the columns of the fact table
+    subset_columns = get_subset_columns(dataset.df_result.columns, desc)
 
     # add filtering columns to df_combined
     # do not add a filtering column for BF / B (-> [1:])
-    for [df, col_name] in subsets[1:]:
-        dataset.df_result[col_name] = False
-        dataset.df_result.loc[(dataset.df_result.index.isin(df.index)), col_name] = True
+    for subset in subsets[1:]:
+        dataset.df_result[subset.desc] = subset.rows
         # check that filtering works
-        assert dataset.df_result[dataset.df_result[col_name]][df.columns].equals(
-            df
-        ), f"Filtering is not accurate for {col_name}."
+        sanity_checks.check_filtering_column(
+            target_codes.codes,
+            subset.parent,
+            dataset.df_result[subset.desc].to_numpy(),
+            subset.desc,
+        )
 
     if logging.DEBUG >= logging.root.level:
-        for [df_subset, subset_desc] in subsets:
-            get_stats.add_debugging_info(dataset, df_subset, subset_desc)
+        for subset in subsets:
+            get_stats.add_debugging_info(
+                dataset, dataset.df_result.loc[subset.rows, subset_columns], subset.desc
+            )
+
+    return get_subset_stats(dataset.df_result, target_codes, subsets)
 
 
 def add_filtering_columns(
@@ -181,6 +369,15 @@ def add_filtering_columns(
 ):
     """
     Add filtering columns to main dataset and save subsets if required.
+    The subsets are calculated as boolean row masks of dataset.df_result
+    based on integer target codes (see get_target_codes),
+    i.e., they are not copied to add the filtering columns
+    and written to file chunk by chunk if possible (see output.write_and_check_dataset).
+    The subsets of all assay descriptions are written concurrently
+    before the filtering columns are added (see write_subsets).
+    The number of targets, compounds and compound-target pairs
+    per filtering column (i.e., per threshold in args.min_nof_cpds)
+    are written to <output_path>/ChEMBL<version>_CTI_<limited_flag>_min_nof_cpds_stats.
 
     :param dataset: Dataset with compound-target pairs. \
         Will be updated to only include filtering columns.
@@ -190,27 +387,49 @@ def add_filtering_columns(
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
     """
-    # consider binding and functional assays
-    # assay description = binding+functional
-    desc = "BF"
-    # df_combined without binding only data
-    df_combined_subset = dataset.df_result.copy()
-    add_subset_filtering_columns(
-        df_combined_subset,
-        dataset,
-        desc,
-        args,
-        out,
-    )
+    target_codes = get_target_codes(dataset.df_result)
+
+    # consider binding and functional assays (assay description = binding+functional)
+    # and only binding assays (assay description = binding)
+    subsets = {
+        desc: get_subsets(
+            dataset.df_result,
+            target_codes,
+            get_assay_rows(dataset.df_result, desc),
+            args.min_nof_cpds,
+            desc,
+        )
+        for desc in ["BF", "B"]
+    }
+    write_subsets(dataset, subsets, args, out)
+
+    stats = []
+    for desc, desc_subsets in subsets.items():
+        stats += add_subset_filtering_columns(dataset, target_codes, desc_subsets, desc)
 
-    # consider only binding assays
-    # assay description = binding
-    desc = "B"
-    df_combined_subset = dataset.df_result[dataset.df_result["keep_for_binding"]].copy()
-    add_subset_filtering_columns(
-        df_combined_subset,
-        dataset,
-        desc,
-        args,
+    df_stats = pd.DataFrame(
+        stats,
+        columns=[
+            "filtering_column",
+            "min_nof_cpds",
+            "targets",
+            "compounds",
+            "cpd_target_pairs",
+        ],
+    )
+    for _, row in df_stats.iterrows():
+        logging.debug(
+            "%-25s %8d targets %8d compounds %10d pairs",
+            row["filtering_column"],
+            row["targets"],
+            row["compounds"],
+            row["cpd_target_pairs"],
+        )
+    output.write_output(
+        df_stats,
+        os.path.join(
+            out.output_path,
+            f"ChEMBL{args.chembl_version}_CTI_{args.limited_flag}_min_nof_cpds_stats",
+        ),
         out,
     )
@@ -23,57 +23,57 @@ def add_built_in_descriptors(dataset: Dataset):
     """
     # add a column with RDKit molecules, used to calculate the descriptors
     PandasTools.AddMoleculeColumnToFrame(
-        dataset.df_result, "canonical_smiles", "mol", includeFingerprints=False
+        dataset.df_compounds, "canonical_smiles", "mol", includeFingerprints=False
     )
 
-    dataset.df_result.loc[:, "fraction_csp3"] = dataset.df_result["mol"].apply(
+    dataset.df_compounds.loc[:, "fraction_csp3"] = dataset.df_compounds["mol"].apply(
         Descriptors.FractionCSP3
     )
-    dataset.df_result.loc[:, "ring_count"] = dataset.df_result["mol"].apply(
+    dataset.df_compounds.loc[:, "ring_count"] = dataset.df_compounds["mol"].apply(
         Descriptors.RingCount
     )
-    dataset.df_result.loc[:, "num_aliphatic_rings"] = dataset.df_result["mol"].apply(
-        Descriptors.NumAliphaticRings
-    )
-    dataset.df_result.loc[:, "num_aliphatic_carbocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_aliphatic_rings"] = dataset.df_compounds[
+        "mol"
+    ].apply(Descriptors.NumAliphaticRings)
+    dataset.df_compounds.loc[:, "num_aliphatic_carbocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumAliphaticCarbocycles)
-    dataset.df_result.loc[:, "num_aliphatic_heterocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_aliphatic_heterocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumAliphaticHeterocycles)
-    dataset.df_result.loc[:, "num_aromatic_rings"] = dataset.df_result["mol"].apply(
-        Descriptors.NumAromaticRings
-    )
-    dataset.df_result.loc[:, "num_aromatic_carbocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_aromatic_rings"] = dataset.df_compounds[
+        "mol"
+    ].apply(Descriptors.NumAromaticRings)
+    dataset.df_compounds.loc[:, "num_aromatic_carbocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumAromaticCarbocycles)
-    dataset.df_result.loc[:, "num_aromatic_heterocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_aromatic_heterocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumAromaticHeterocycles)
-    dataset.df_result.loc[:, "num_saturated_rings"] = dataset.df_result["mol"].apply(
-        Descriptors.NumSaturatedRings
-    )
-    dataset.df_result.loc[:, "num_saturated_carbocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_saturated_rings"] = dataset.df_compounds[
+        "mol"
+    ].apply(Descriptors.NumSaturatedRings)
+    dataset.df_compounds.loc[:, "num_saturated_carbocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumSaturatedCarbocycles)
-    dataset.df_result.loc[:, "num_saturated_heterocycles"] = dataset.df_result[
+    dataset.df_compounds.loc[:, "num_saturated_heterocycles"] = dataset.df_compounds[
         "mol"
     ].apply(Descriptors.NumSaturatedHeterocycles)
-    dataset.df_result.loc[:, "num_stereocentres"] = dataset.df_result["mol"].apply(
-        Chem.rdMolDescriptors.CalcNumAtomStereoCenters
-    )
-    dataset.df_result.loc[:, "num_heteroatoms"] = dataset.df_result["mol"].apply(
+    dataset.df_compounds.loc[:, "num_stereocentres"] = dataset.df_compounds[
+        "mol"
+    ].apply(Chem.rdMolDescriptors.CalcNumAtomStereoCenters)
+    dataset.df_compounds.loc[:, "num_heteroatoms"] = dataset.df_compounds["mol"].apply(
         Descriptors.NumHeteroatoms
     )
 
     # add scaffolds
-    PandasTools.AddMurckoToFrame(dataset.df_result, "mol", "scaffold_w_stereo")
+    PandasTools.AddMurckoToFrame(dataset.df_compounds, "mol", "scaffold_w_stereo")
     # remove stereo information of the molecule to add scaffolds without stereo information
-    dataset.df_result["mol"].apply(Chem.RemoveStereochemistry)
-    PandasTools.AddMurckoToFrame(dataset.df_result, "mol", "scaffold_wo_stereo")
+    dataset.df_compounds["mol"].apply(Chem.RemoveStereochemistry)
+    PandasTools.AddMurckoToFrame(dataset.df_compounds, "mol", "scaffold_wo_stereo")
 
     # drop the column with RDKit molecules
-    dataset.df_result = dataset.df_result.drop(["mol"], axis=1)
+    dataset.df_compounds = dataset.df_compounds.drop(["mol"], axis=1)
 
 
 def calculate_aromatic_atoms(
@@ -142,28 +142,30 @@ def add_aromaticity_descriptors(dataset: Dataset):
     :type dataset: Dataset
     """
     # use df_combined_w_smiles to exclude null values
-    smiles_set = set(dataset.df_result["canonical_smiles"])
+    smiles_set = set(dataset.df_compounds["canonical_smiles"])
     aromatic_atoms_dict, aromatic_c_dict, aromatic_n_dict, aromatic_hetero_dict = (
         calculate_aromatic_atoms(smiles_set)
     )
 
-    dataset.df_result["aromatic_atoms"] = dataset.df_result["canonical_smiles"].map(
-        aromatic_atoms_dict
-    )
-    dataset.df_result["aromatic_c"] = dataset.df_result["canonical_smiles"].map(
+    dataset.df_compounds["aromatic_atoms"] = dataset.df_compounds[
+        "canonical_smiles"
+    ].map(aromatic_atoms_dict)
+    dataset.df_compounds["aromatic_c"] = dataset.df_compounds["canonical_smiles"].map(
         aromatic_c_dict
     )
-    dataset.df_result["aromatic_n"] = dataset.df_result["canonical_smiles"].map(
+    dataset.df_compounds["aromatic_n"] = dataset.df_compounds["canonical_smiles"].map(
         aromatic_n_dict
     )
-    dataset.df_result["aromatic_hetero"] = dataset.df_result["canonical_smiles"].map(
-        aromatic_hetero_dict
-    )
+    dataset.df_compounds["aromatic_hetero"] = dataset.df_compounds[
+        "canonical_smiles"
+    ].map(aromatic_hetero_dict)
 
 
 def add_rdkit_compound_descriptors(dataset: Dataset):
     """
-    Add RDKit-based compound descriptors (built-in and numbers of aromatic atoms).
+    Add RDKit-based compound descriptors (built-in and numbers of aromatic atoms)
+    to the compound dimension table (see star_schema),
+    i.e., descriptors are calculated once per compound.
 
     :param dataset: Dataset with compound-target pairs.
         Will be updated to only include
@@ -173,4 +175,4 @@ def add_rdkit_compound_descriptors(dataset: Dataset):
     """
     add_built_in_descriptors(dataset)
     add_aromaticity_descriptors(dataset)
-    sanity_checks.check_rdkit_props(dataset.df_result)
+    sanity_checks.check_rdkit_props(dataset.df_compounds)
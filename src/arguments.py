@@ -6,9 +6,15 @@ specifically arguments related to how to calculate or output the dataset.
 import argparse
 
 from dataclasses import dataclass
+from typing import Optional
+
+import parquet_files
+import sanity_checks
+import target_relations
 
 
 @dataclass(frozen=True)
+# pylint: disable-next=too-many-instance-attributes
 class CalculationArgs:
     """
     Collection of arguments related to how to calculate the dataset.
@@ -17,19 +23,43 @@ class CalculationArgs:
     - calculate_rdkit:        True if RDKit-based compound properties should be calculated
     - limit_to_literature:    Include only literature sources if True
     - limited_flag:           String version of limit_to_literature used in file names
-    - min_nof_cpds_bf:        Minimum number of compounds per target for the BF subset
-    - min_nof_cpds_b:         Minimum number of compounds per target for the B subset
+    - min_nof_cpds:           Thresholds for the minimum number of compounds per target \
+                                in the BF and B subsets (sorted, without duplicates)
+    - aggregation_mode:       How to aggregate the activities per compound-target pair \
+                                ("pandas": in memory, "streaming": in chunks, \
+                                "sql": inside SQLite)
+    - chunk_size:             Number of activities read at once if aggregation_mode is "streaming"
+    - check_aggregation:      True if the aggregated compound-target pairs of the \
+                                "streaming" and "sql" aggregation modes should be compared to \
+                                the in-memory aggregation (see sanity_checks)
+    - target_relation_rules:  (target type, relationship, target type) rules for mapping \
+                                drug_mechanism targets to related targets
+    - target_relation_hops:   Maximum number of target relations between \
+                                a drug_mechanism target and a mapped target
+    - target_relation_cache:  Directory to cache the target relation graph in, \
+                                not cached if None
+    - checks:                 How thoroughly the dataset is checked \
+                                ("off", "sample" or "full", see sanity_checks)
+    - checks_sample_size:     Number of rows that are checked if checks is "sample"
     """
 
     chembl_version: str
     calculate_rdkit: bool
     limit_to_literature: bool
     limited_flag: str
-    min_nof_cpds_bf: int
-    min_nof_cpds_b: int
+    min_nof_cpds: tuple[int, ...]
+    aggregation_mode: str
+    chunk_size: int
+    check_aggregation: bool
+    target_relation_rules: tuple[target_relations.EdgeRule, ...]
+    target_relation_hops: int
+    target_relation_cache: Optional[str]
+    checks: str
+    checks_sample_size: int
 
 
 @dataclass(frozen=True)
+# pylint: disable-next=too-many-instance-attributes
 class OutputArgs:
     """
     Collection of arguments related to how to output the dataset.
@@ -38,19 +68,47 @@ class OutputArgs:
     - delimiter:          Delimiter in csv-output
     - write_to_csv:       True if output should be written to csv
     - write_to_excel:     True if output should be written to excel
+    - write_to_parquet:   True if the dataset and subsets should be written to parquet
+    - parquet_partition:  Column to partition the parquet output by, \
+                            not partitioned if None (see parquet_files)
     - write_full_dataset: True if the full dataset should be written to output
     - write_bf:           True if subsets based on binding+functional data \
                             should be written to output
     - write_b:            True if subsets based on binding data only should be written to output
+    - verification:       How written files are verified \
+                            ("reread": read back and compared, \
+                            "hash": content hashes compared, see content_hashes)
+    - export_workers:     Number of threads that write, check and summarise \
+                            the dataset files concurrently (see export_scheduler)
     """
 
     output_path: str
     delimiter: str
     write_to_csv: bool
     write_to_excel: bool
+    write_to_parquet: bool
+    parquet_partition: Optional[str]
     write_full_dataset: bool
     write_bf: bool
     write_b: bool
+    verification: str
+    export_workers: int
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a positive integer argument.
+
+    :param value: Argument value
+    :type value: str
+    :raises ValueError: If value is not a positive integer
+    :return: Parsed integer
+    :rtype: int
+    """
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"{value} is not a positive integer.")
+    return number
 
 
 def parse_args() -> argparse.Namespace:
@@ -89,6 +147,21 @@ def parse_args() -> argparse.Namespace:
             ChEMBL is downloaded as an SQLite database \
             and handled by chembl_downloader if None. (default: None)",
     )
+    parser.add_argument(
+        "--index_working_copy",
+        dest="working_copy_path",
+        metavar="<path>",
+        type=str,
+        default=None,
+        help="Opt-in: path to a local working copy of ChEMBL. \
+            ChEMBL is copied to this path if it does not exist yet \
+            or was copied from a different ChEMBL database or version, \
+            indexes that are missing for the queries of the pipeline are built \
+            on the working copy and the dataset is calculated based on the working copy. \
+            The original database is never modified. \
+            Query times before and after adding the indexes are written \
+            to index_advisor_report. (default: None)",
+    )
     parser.add_argument(
         "--output",
         "-o",
@@ -113,6 +186,119 @@ def parse_args() -> argparse.Namespace:
             This includes data from BindingDB which may skew the results. \
             Default (not set): the dataset is calculated based on only literature data.",
     )
+    parser.add_argument(
+        "--aggregation",
+        dest="aggregation_mode",
+        choices=["pandas", "streaming", "sql"],
+        default="pandas",
+        help="How to aggregate the activities into compound-target pairs. \
+            pandas: read all activities into memory at once. \
+            streaming: read the activities in chunks of --chunk_size rows \
+            and keep running aggregates per compound-target pair. \
+            sql: aggregate the activities inside SQLite. \
+            (default: pandas)",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        metavar="<rows>",
+        type=positive_int,
+        default=100000,
+        help="Number of activities read at once with --aggregation streaming. \
+            (default: 100000)",
+    )
+    parser.add_argument(
+        "--check_aggregation",
+        action="store_true",
+        help="If this is set, the compound-target pairs aggregated \
+            with --aggregation streaming or sql are compared to the pairs \
+            aggregated in memory, i.e., the activities are additionally read \
+            into memory at once. Skipped with --checks off. \
+            Default (not set): the aggregation is not compared.",
+    )
+    parser.add_argument(
+        "--target_relation_rule",
+        dest="target_relation_rules",
+        metavar="<type,relationship,type>",
+        type=target_relations.parse_edge_rule,
+        action="append",
+        default=None,
+        help="Rule for mapping drug_mechanism targets to related targets \
+            in the target_relations table, \
+            e.g., 'PROTEIN FAMILY,SUPERSET OF,SINGLE PROTEIN'. \
+            Can be given several times. \
+            Default (not set): protein families, protein complexes, protein complex groups, \
+            chimeric proteins and protein-protein interactions -[SUPERSET OF]-> \
+            single proteins and single proteins -[EQUIVALENT TO]-> single proteins.",
+    )
+    parser.add_argument(
+        "--target_relation_hops",
+        metavar="<hops>",
+        type=positive_int,
+        default=1,
+        help="Maximum number of target relations between a drug_mechanism target \
+            and a mapped target. (default: 1)",
+    )
+    parser.add_argument(
+        "--target_relation_cache",
+        metavar="<path>",
+        type=str,
+        default=None,
+        help="Directory to cache the target relation graph in. \
+            The graph is built once per ChEMBL version and configuration \
+            and loaded from the cache afterwards. (default: None)",
+    )
+    parser.add_argument(
+        "--min_cpds",
+        "--min-cpds",
+        dest="min_nof_cpds",
+        metavar="<n>",
+        type=positive_int,
+        nargs="+",
+        default=[100],
+        help="Minimum number(s) of compounds with a pchembl value per target \
+            for the BF_<n> and B_<n> subsets. \
+            If several thresholds are given (e.g., --min_cpds 20 50 100 200 500), \
+            the filtering columns and subsets are calculated for every threshold \
+            in one pass. (default: 100)",
+    )
+    parser.add_argument(
+        "--checks",
+        choices=sanity_checks.CHECK_LEVELS,
+        default="full",
+        help="How thoroughly the dataset is checked. \
+            off: no sanity checks. \
+            sample: check a deterministic random sample of --checks_sample_size rows. \
+            full: check all rows. \
+            The time every check took is logged. (default: full)",
+    )
+    parser.add_argument(
+        "--checks_sample_size",
+        metavar="<rows>",
+        type=positive_int,
+        default=10000,
+        help="Number of rows that are checked with --checks sample. (default: 10000)",
+    )
+    parser.add_argument(
+        "--verification",
+        choices=["reread", "hash"],
+        default="reread",
+        help="How written dataset files are verified. \
+            reread: read the file back and compare it to the dataset. \
+            hash: compare per-row content hashes calculated while writing \
+            to the hashes of the file read back in chunks (constant memory). \
+            Content hashes are added to manifest.json in both cases. \
+            (default: reread)",
+    )
+    parser.add_argument(
+        "--export_workers",
+        metavar="<n>",
+        type=positive_int,
+        default=1,
+        help="Number of threads that write, check and summarise \
+            the subsets and the full dataset concurrently. \
+            The written files are identical for any number of threads. \
+            (default: 1)",
+    )
     parser.add_argument(
         "--rdkit",
         dest="calculate_rdkit",
@@ -125,6 +311,22 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Write the results to excel. Note: this may fail if the output is too large.",
     )
+    parser.add_argument(
+        "--parquet",
+        dest="write_to_parquet",
+        action="store_true",
+        help="Write the full dataset and the subsets to parquet \
+            with typed, dictionary encoded columns and row group statistics. \
+            Requires pyarrow (pip install .[parquet]).",
+    )
+    parser.add_argument(
+        "--parquet_partition",
+        choices=parquet_files.PARTITION_COLUMNS,
+        default=None,
+        help="Partition the parquet output by this column, \
+            i.e., write one directory per value. Requires --parquet. \
+            Default (not set): one parquet file per dataset.",
+    )
     parser.add_argument(
         "--BF",
         dest="write_bf",
@@ -138,6 +340,10 @@ def parse_args() -> argparse.Namespace:
         "--debug", action="store_true", help="Log additional debugging information."
     )
     args = parser.parse_args()
+    if args.write_to_parquet and not parquet_files.PYARROW_AVAILABLE:
+        parser.error("--parquet requires pyarrow (pip install .[parquet]).")
+    if args.parquet_partition is not None and not args.write_to_parquet:
+        parser.error("--parquet_partition requires --parquet.")
 
     return args
 
@@ -159,8 +365,19 @@ def get_args() -> tuple[argparse.Namespace, CalculationArgs, OutputArgs]:
         limit_to_literature=not args.all_sources,
         # used in file names
         limited_flag="literature_only" if not args.all_sources else "all_sources",
-        min_nof_cpds_bf=100,
-        min_nof_cpds_b=100,
+        min_nof_cpds=tuple(sorted(set(args.min_nof_cpds))),
+        aggregation_mode=args.aggregation_mode,
+        chunk_size=args.chunk_size,
+        check_aggregation=args.check_aggregation,
+        target_relation_rules=(
+            tuple(args.target_relation_rules)
+            if args.target_relation_rules
+            else target_relations.DEFAULT_EDGE_RULES
+        ),
+        target_relation_hops=args.target_relation_hops,
+        target_relation_cache=args.target_relation_cache,
+        checks=args.checks,
+        checks_sample_size=args.checks_sample_size,
     )
 
     output_args = OutputArgs(
@@ -169,11 +386,15 @@ def get_args() -> tuple[argparse.Namespace, CalculationArgs, OutputArgs]:
         # Always write the results to csv.
         write_to_csv=True,
         write_to_excel=args.write_to_excel,
+        write_to_parquet=args.write_to_parquet,
+        parquet_partition=args.parquet_partition,
         # Always write the full dataset plus filtering columns
         # for binding vs. binding+functional data.
         write_full_dataset=True,
         write_bf=args.write_bf,
         write_b=args.write_b,
+        verification=args.verification,
+        export_workers=args.export_workers,
     )
 
     return args, calc_args, output_args
@@ -0,0 +1,177 @@
+"""
+Benchmark the final sanity checks (see sanity_checks.sanity_checks)
+against the previous implementation, which converted every column to str
+and compared Python sets of all values.
+
+Run on a written dataset file with a schema sidecar (see column_schema)::
+
+    python benchmark_sanity_checks.py <filename without file extension>
+"""
+
+import argparse
+import time
+from typing import Callable
+
+import pandas as pd
+
+import column_schema
+import dtype_policy
+import sanity_checks
+
+
+########### Previous Implementation ###########
+def check_null_values_with_sets(df_result: pd.DataFrame) -> set[str]:
+    """
+    Get the columns with nan or null values which aren't recognised as null values
+    by converting every column to str.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :return: Set of columns with hidden null values
+    :rtype: set[str]
+    """
+    columns = set()
+    for col in df_result.columns:
+        col_as_str = set(df_result[df_result[col].notnull()][col].astype(str))
+        if "nan" in col_as_str or "null" in col_as_str:
+            columns.add(col)
+    return columns
+
+
+def check_for_mixed_types_with_sets(df_result: pd.DataFrame) -> set[str]:
+    """
+    Get the columns with dtype=object (or categorical columns) and mixed types
+    by comparing the set of values to the set of their string representations.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :return: Set of columns with mixed types
+    :rtype: set[str]
+    """
+    columns = set()
+    for col, dtype in df_result.dtypes.to_dict().items():
+        if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+            column = df_result[col].astype(object)
+            col_original = set(column[column.notnull()])
+            col_as_str = set(column[column.notnull()].astype(str))
+            if col_original != col_as_str:
+                columns.add(col)
+    return columns
+
+
+########### Benchmark ###########
+def time_check(check: Callable, df: pd.DataFrame, repeats: int) -> float:
+    """
+    Get the best time of a check over several repeats.
+
+    :param check: Check that is called with df
+    :type check: Callable
+    :param df: Pandas DataFrame with compound-target pairs
+    :type df: pd.DataFrame
+    :param repeats: Number of repeats
+    :type repeats: int
+    :return: Best time in seconds
+    :rtype: float
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        check(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_results(df: pd.DataFrame):
+    """
+    Check that the previous and the vectorized sanity checks
+    find the same problematic columns in df.
+
+    :param df: Pandas DataFrame with compound-target pairs
+    :type df: pd.DataFrame
+    """
+    df_null_values = sanity_checks.check_null_values(df)
+    assert check_null_values_with_sets(df) == set(
+        df_null_values[df_null_values["hidden_null_values"] > 0]["column"]
+    ), "The implementations find different columns with hidden null values."
+    df_mixed_types = sanity_checks.check_for_mixed_types(df)
+    assert check_for_mixed_types_with_sets(df) == set(
+        df_mixed_types[df_mixed_types["mixed_types"]]["column"]
+    ), "The implementations find different columns with mixed types."
+
+
+def get_categorical_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the text columns that are categoricals in the pipeline
+    (see dtype_policy.CATEGORY_COLUMNS) to categoricals.
+
+    :param df: Pandas DataFrame with compound-target pairs as read from file
+    :type df: pd.DataFrame
+    :return: Copy of df with categorical columns
+    :rtype: pd.DataFrame
+    """
+    return df.astype(
+        {col: "category" for col in dtype_policy.CATEGORY_COLUMNS if col in df.columns}
+    )
+
+
+def benchmark(df: pd.DataFrame, repeats: int = 3) -> pd.DataFrame:
+    """
+    Time the previous and the vectorized sanity checks on df
+    and check that both find the same problematic columns,
+    both with text columns as objects (as read from file)
+    and with categorical columns (as in the pipeline, see dtype_policy).
+
+    :param df: Pandas DataFrame with compound-target pairs
+    :type df: pd.DataFrame
+    :param repeats: Number of repeats per check, defaults to 3
+    :type repeats: int, optional
+    :return: Pandas DataFrame with the best time per check, data types and implementation
+    :rtype: pd.DataFrame
+    """
+    checks = {
+        "null_values": (check_null_values_with_sets, sanity_checks.check_null_values),
+        "mixed_types": (
+            check_for_mixed_types_with_sets,
+            sanity_checks.check_for_mixed_types,
+        ),
+    }
+    report = []
+    for dtypes, df_dtypes in [
+        ("object", df),
+        ("categorical", get_categorical_columns(df)),
+    ]:
+        compare_results(df_dtypes)
+        for check_name, (previous_check, vectorized_check) in checks.items():
+            previous_time = time_check(previous_check, df_dtypes, repeats)
+            vectorized_time = time_check(vectorized_check, df_dtypes, repeats)
+            report.append(
+                [
+                    check_name,
+                    dtypes,
+                    previous_time,
+                    vectorized_time,
+                    previous_time / vectorized_time,
+                ]
+            )
+    return pd.DataFrame(
+        report, columns=["check", "dtypes", "previous_s", "vectorized_s", "speedup"]
+    )
+
+
+def main():
+    """
+    Run the benchmark on a dataset file and print the report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "filename", help="Dataset file with a schema sidecar, without file extension"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Repeats per check")
+    args = parser.parse_args()
+
+    df = column_schema.read_csv(args.filename)
+    print(benchmark(df, args.repeats).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,97 @@ import sqlite3
 
 import pandas as pd
 
+import column_schema
 from dataset import Dataset
+import key_tables
+import pair_keys
+import star_schema
 
 
 ########### Remove Irrelevant Compounds ###########
+def get_mixture_validation_query() -> str:
+    """
+    Get the SQL query for the checks of compounds with a smiles containing a dot
+    (see :func:`get_mixture_violations`).
+    The compounds are read from the compound key table (see key_tables.COMPOUND_KEYS).
+
+    - is_parent:          The compound occurs as a parent_molregno in the molecule_hierarchy
+    - has_other_parent:   The compound occurs as a salt with a different parent \
+                            in the molecule_hierarchy
+    - chembl_smiles:      Canonical smiles of the compound in ChEMBL
+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = f"""
+    SELECT ck.id as parent_molregno,
+        EXISTS (
+            SELECT 1 FROM molecule_hierarchy mh
+            WHERE mh.parent_molregno = ck.id
+        ) as is_parent,
+        EXISTS (
+            SELECT 1 FROM molecule_hierarchy mh
+            WHERE mh.molregno = ck.id AND mh.parent_molregno <> ck.id
+        ) as has_other_parent,
+        struct.canonical_smiles as chembl_smiles
+    FROM {key_tables.COMPOUND_KEYS} ck
+    LEFT JOIN compound_structures struct
+        ON ck.id = struct.molregno
+    """
+
+    return sql
+
+
+def get_mixture_violations(
+    df_smiles_with_dot: pd.DataFrame, chembl_con: sqlite3.Connection
+) -> pd.DataFrame:
+    """
+    Double-check that compounds with a smiles containing a dot are parent structures,
+    i.e., there was no error in using salt information instead of parent information,
+    and that their smiles is the smiles of the parent structure in ChEMBL.
+    Only the compounds in df_smiles_with_dot are checked.
+
+    :param df_smiles_with_dot: Pandas DataFrame with the columns
+        parent_molregno and canonical_smiles
+    :type df_smiles_with_dot: pd.DataFrame
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :return: Pandas DataFrame with one row per violated check of a compound
+        (columns parent_molregno, canonical_smiles, chembl_smiles, violation),
+        empty if all checks passed
+    :rtype: pd.DataFrame
+    """
+    df_checks = key_tables.read_keyed_query(
+        chembl_con,
+        get_mixture_validation_query(),
+        key_tables.COMPOUND_KEYS,
+        df_smiles_with_dot["parent_molregno"],
+    )
+    df_checks = df_smiles_with_dot[["parent_molregno", "canonical_smiles"]].merge(
+        df_checks, on="parent_molregno", how="left"
+    )
+
+    violations = {
+        "not a parent_molregno in the molecule_hierarchy": (
+            df_checks["is_parent"] != 1
+        ),
+        "salt with a different parent in the molecule_hierarchy": (
+            df_checks["has_other_parent"] == 1
+        ),
+        "smiles differs from the smiles in ChEMBL": (
+            df_checks["canonical_smiles"] != df_checks["chembl_smiles"]
+        ),
+    }
+    columns = ["parent_molregno", "canonical_smiles", "chembl_smiles"]
+    return pd.concat(
+        [
+            df_checks.loc[mask, columns].assign(violation=violation)
+            for violation, mask in violations.items()
+        ],
+        ignore_index=True,
+    )
+
+
 def remove_compounds_without_smiles_and_mixtures(
     dataset: Dataset, chembl_con: sqlite3.Connection
 ):
@@ -22,6 +109,8 @@ def remove_compounds_without_smiles_and_mixtures(
 
     Since compound information is aggregated for the parents of salts,
     the number of smiles with a dot is relatively low.
+    Compounds with a smiles containing a dot are validated
+    against ChEMBL before they are removed (see :func:`get_mixture_violations`).
 
     :param dataset: Dataset with compound-target pairs.
         Will be updated to only include
@@ -30,289 +119,142 @@ def remove_compounds_without_smiles_and_mixtures(
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
     """
-    # Double-check that rows with a SMILES containing a '.' are the parent structures,
-    # i.e., there was no error in using salt information instead of parent information.
-    sql = """
-    SELECT DISTINCT mh.molregno as salt_molregno, mh.parent_molregno
-    FROM molecule_hierarchy mh
-    """
-    df_hierarchy = pd.read_sql_query(sql, con=chembl_con)
-
-    smiles_with_dot = dataset.df_result[
-        dataset.df_result["canonical_smiles"].notnull()
-        & dataset.df_result["canonical_smiles"].str.contains(".", regex=False)
-    ][["canonical_smiles", "parent_molregno"]].drop_duplicates()
-
-    for parent_molregno in set(smiles_with_dot["parent_molregno"]):
-        assert (
-            len(df_hierarchy[df_hierarchy["parent_molregno"] == parent_molregno]) > 0
-        ), f"The compound with the parent_moregno {parent_molregno} does not occur \
-                as a parent_molregno in the molecule_hierarchy."
-        df_salt_molregno = df_hierarchy[
-            df_hierarchy["salt_molregno"] == parent_molregno
-        ]
-        assert df_salt_molregno["salt_molregno"].equals(
-            df_salt_molregno["parent_molregno"]
-        ), f"The compound with the parent_moregno {parent_molregno} occurs as a salt \
-                but has a different parent in the molecule_hierarchy."
-
-    # Double-check that the SMILES is indeed the SMILES for the parent structure.
-    sql = """
-    SELECT DISTINCT mh.parent_molregno, struct.canonical_smiles
-    FROM molecule_hierarchy mh
-    INNER JOIN compound_structures struct
-        ON mh.parent_molregno = struct.molregno
-    """
-    df_parent_smiles = pd.read_sql_query(sql, con=chembl_con)
-
-    for parent_molregno in set(smiles_with_dot["parent_molregno"]):
-        parent_smiles_in_chembl = df_parent_smiles[
-            df_parent_smiles["parent_molregno"] == parent_molregno
-        ]["canonical_smiles"].item()
-        parent_smiles_in_df = smiles_with_dot[
-            smiles_with_dot["parent_molregno"] == parent_molregno
-        ]["canonical_smiles"].item()
-        assert (
-            parent_smiles_in_chembl == parent_smiles_in_df
-        ), f"The smiles for the compound {parent_molregno} ({parent_smiles_in_df}) \
-                in the dataframe is not the same as \
-                the smiles for the compound in ChEMBL ({parent_smiles_in_chembl})."
+    df_smiles_with_dot = dataset.df_compounds[
+        dataset.df_compounds["canonical_smiles"].notnull()
+        & dataset.df_compounds["canonical_smiles"].str.contains(".", regex=False)
+    ]
+
+    df_violations = get_mixture_violations(df_smiles_with_dot, chembl_con)
+    assert (
+        df_violations.empty
+    ), "Compounds with a smiles containing a dot failed the checks:\n" + (
+        df_violations.to_string(index=False)
+    )
 
     # Remove rows that contain a SMILES with a dot or that don't have a SMILES.
-    len_missing_smiles = len(
-        dataset.df_result[dataset.df_result["canonical_smiles"].isnull()]
+    canonical_smiles = star_schema.get_compound_values(dataset, ["canonical_smiles"])[
+        "canonical_smiles"
+    ]
+    has_smiles_with_dot = dataset.df_result["parent_molregno"].isin(
+        df_smiles_with_dot["parent_molregno"]
     )
-    len_smiles_w_dot = len(
-        dataset.df_result[
-            dataset.df_result["parent_molregno"].isin(
-                set(smiles_with_dot["parent_molregno"])
-            )
-        ]
+    logging.debug(
+        "#Compounds without a SMILES: %s", int(canonical_smiles.isnull().sum())
     )
-    logging.debug("#Compounds without a SMILES: %s", len_missing_smiles)
-    logging.debug("#SMILES with a dot: %s", len_smiles_w_dot)
+    logging.debug("#SMILES with a dot: %s", int(has_smiles_with_dot.sum()))
 
     dataset.df_result = dataset.df_result[
-        (dataset.df_result["canonical_smiles"].notnull())
-        & ~(
-            dataset.df_result["parent_molregno"].isin(
-                set(smiles_with_dot["parent_molregno"])
-            )
-        )
+        canonical_smiles.notnull() & ~has_smiles_with_dot
     ]
+    star_schema.prune_dimensions(dataset)
 
 
 ########### General Cleaning Steps ###########
+def clean_none_value_column(column: pd.Series) -> pd.Series:
+    """
+    Change nan values and empty strings in a text column to None.
+    Numeric and nullable columns are returned as they are.
+
+    :param column: Column of the dataset
+    :type column: pd.Series
+    :return: Column with None instead of nan values and empty strings
+    :rtype: pd.Series
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        if "" in column.cat.categories:
+            return column.cat.remove_categories([""])
+        return column
+    if not pd.api.types.is_object_dtype(column.dtype):
+        return column
+    is_none = column.isnull() | column.eq("")
+    if not is_none.any():
+        return column
+    column = column.copy()
+    column[is_none.to_numpy()] = None
+    return column
+
+
 def clean_none_values(dataset: Dataset):
     """
     Change nan values and empty strings to None for consistency.
+
+    The columns of the fact and dimension tables (see star_schema)
+    are updated in place one at a time,
+    i.e., numeric and nullable columns keep their data types
+    and only text columns with nan values or empty strings are copied.
     """
-    # Change all None / nan values to None
-    dataset.df_result = dataset.df_result.where(pd.notnull(dataset.df_result), None)
-    # replace empty strings with None
-    dataset.df_result = dataset.df_result.replace("", None).reset_index(drop=True)
+    for df in [dataset.df_result, dataset.df_compounds, dataset.df_targets]:
+        for col in df.columns:
+            column = df[col]
+            cleaned_column = clean_none_value_column(column)
+            if cleaned_column is not column:
+                df[col] = cleaned_column
+        df.reset_index(drop=True, inplace=True)
 
 
-def set_types_to_int(dataset, calculate_rdkit):
+def apply_column_schema_to_table(
+    df: pd.DataFrame, columns: list[column_schema.ColumnSpec]
+) -> pd.DataFrame:
     """
-    Set the type of relevant columns to Int64.
+    Apply the column schema to the fact or a dimension table (see star_schema), i.e.,
+
+    - reorder the columns (in one projection)
+    - set the data types of numeric columns (in one astype)
+    - round float columns.
+
+    :param df: Fact or dimension table
+    :type df: pd.DataFrame
+    :param columns: Specifications of the columns of the dataset
+    :type columns: list[column_schema.ColumnSpec]
+    :return: Table with the columns in the order of the column schema
+    :rtype: pd.DataFrame
     """
-    dataset.df_result = dataset.df_result.astype(
+    columns = [column for column in columns if column.name in df.columns]
+    df = df[[column.name for column in columns]]
+
+    # ids and categoricals keep their memory-lean types until the output,
+    # see dtype_policy
+    df = df.astype(
         {
-            "first_approval": "Int64",
-            "usan_year": "Int64",
-            "first_publication_cpd_target_pair_BF": "Int64",
-            "first_publication_cpd_target_pair_w_pchembl_BF": "Int64",
-            "first_publication_cpd_target_pair_B": "Int64",
-            "first_publication_cpd_target_pair_w_pchembl_B": "Int64",
-            "first_publication_cpd": "Int64",
-            "hba": "Int64",
-            "hbd": "Int64",
-            "rtb": "Int64",
-            "num_ro5_violations": "Int64",
-            "aromatic_rings": "Int64",
-            "heavy_atoms": "Int64",
-            "hba_lipinski": "Int64",
-            "hbd_lipinski": "Int64",
-            "num_lipinski_ro5_violations": "Int64",
+            column.name: column.dtype
+            for column in columns
+            if column.dtype in ("Int64", "float64")
+            and df[column.name].dtype != column.dtype
         }
     )
-
-    if calculate_rdkit:
-        dataset.df_result = dataset.df_result.astype(
-            {
-                "num_aliphatic_carbocycles": "Int64",
-                "num_aliphatic_heterocycles": "Int64",
-                "num_aliphatic_rings": "Int64",
-                "num_aromatic_carbocycles": "Int64",
-                "num_aromatic_heterocycles": "Int64",
-                "num_aromatic_rings": "Int64",
-                "num_heteroatoms": "Int64",
-                "num_saturated_carbocycles": "Int64",
-                "num_saturated_heterocycles": "Int64",
-                "num_saturated_rings": "Int64",
-                "ring_count": "Int64",
-                "num_stereocentres": "Int64",
-                "aromatic_atoms": "Int64",
-                "aromatic_c": "Int64",
-                "aromatic_n": "Int64",
-                "aromatic_hetero": "Int64",
-            }
-        )
-
-
-def round_floats(dataset, decimal_places=4):
-    """
-    Round float columns to <decimal_places> decimal places.
-    This does not apply to max_phase.
-    """
-    for _, (col, dtype) in enumerate(dataset.df_result.dtypes.to_dict().items()):
-        if (dtype in ("float64", "Float64")) and col != "max_phase":
-            dataset.df_result[col] = dataset.df_result[col].round(
-                decimals=decimal_places
-            )
-
-    return dataset.df_result
+    return df.round(
+        {column.name: column.decimals for column in columns if column.decimals}
+    )
 
 
-def reorder_columns(dataset, calculate_rdkit):
-    """
-    Reorder the columns in the DataFrame.
+def apply_column_schema(dataset: Dataset, calculate_rdkit: bool):
     """
-    len_columns_before = len(dataset.df_result.columns)
-
-    compound_target_pair_columns = [
-        "parent_molregno",
-        "parent_chemblid",
-        "parent_pref_name",
-        "max_phase",
-        "first_approval",
-        "usan_year",
-        "black_box_warning",
-        "prodrug",
-        "oral",
-        "parenteral",
-        "topical",
-        "tid",
-        "mutation",
-        "target_chembl_id",
-        "target_pref_name",
-        "target_type",
-        "organism",
-        "tid_mutation",
-        "cpd_target_pair",
-        "cpd_target_pair_mutation",
-    ]
-    aggregated_values = [
-        "pchembl_value_mean_BF",
-        "pchembl_value_max_BF",
-        "pchembl_value_median_BF",
-        "first_publication_cpd_target_pair_BF",
-        "first_publication_cpd_target_pair_w_pchembl_BF",
-        "pchembl_value_mean_B",
-        "pchembl_value_max_B",
-        "pchembl_value_median_B",
-        "first_publication_cpd_target_pair_B",
-        "first_publication_cpd_target_pair_w_pchembl_B",
-    ]
-    dti_annotations = ["therapeutic_target", "DTI"]
-    first_publication_cpd = ["first_publication_cpd"]
-    chembl_compound_props = [
-        "mw_freebase",
-        "alogp",
-        "hba",
-        "hbd",
-        "psa",
-        "rtb",
-        "ro3_pass",
-        "num_ro5_violations",
-        "cx_most_apka",
-        "cx_most_bpka",
-        "cx_logp",
-        "cx_logd",
-        "molecular_species",
-        "full_mwt",
-        "aromatic_rings",
-        "heavy_atoms",
-        "qed_weighted",
-        "mw_monoisotopic",
-        "full_molformula",
-        "hba_lipinski",
-        "hbd_lipinski",
-        "num_lipinski_ro5_violations",
-    ]
-    chembl_structures = ["standard_inchi", "standard_inchi_key", "canonical_smiles"]
-    ligand_efficieny_metrics = [
-        "LE_B",
-        "BEI_B",
-        "SEI_B",
-        "LLE_B",
-        "LE_BF",
-        "BEI_BF",
-        "SEI_BF",
-        "LLE_BF",
-    ]
-    chembl_target_annotations = ["atc_level1", "target_class_l1", "target_class_l2"]
-    rdkit_columns = [
-        "fraction_csp3",
-        "ring_count",
-        "num_aliphatic_rings",
-        "num_aliphatic_carbocycles",
-        "num_aliphatic_heterocycles",
-        "num_aromatic_rings",
-        "num_aromatic_carbocycles",
-        "num_aromatic_heterocycles",
-        "num_saturated_rings",
-        "num_saturated_carbocycles",
-        "num_saturated_heterocycles",
-        "num_stereocentres",
-        "num_heteroatoms",
-        "aromatic_atoms",
-        "aromatic_c",
-        "aromatic_n",
-        "aromatic_hetero",
-        "scaffold_w_stereo",
-        "scaffold_wo_stereo",
-    ]
-    filtering_columns = [
-        "pair_mutation_in_dm_table",
-        "pair_in_dm_table",
-        "keep_for_binding",
-    ]
+    Apply the column schema (see column_schema) to the fact and dimension tables
+    (see apply_column_schema_to_table).
+    The columns of the tables are checked against the column schema.
 
-    if calculate_rdkit:
-        columns = (
-            compound_target_pair_columns
-            + aggregated_values
-            + dti_annotations
-            + first_publication_cpd
-            + chembl_compound_props
-            + chembl_structures
-            + ligand_efficieny_metrics
-            + chembl_target_annotations
-            + rdkit_columns
-            + filtering_columns
-        )
-        dataset.df_result = dataset.df_result[columns]
-    else:
-        columns = (
-            compound_target_pair_columns
-            + aggregated_values
-            + dti_annotations
-            + first_publication_cpd
-            + chembl_compound_props
-            + chembl_structures
-            + ligand_efficieny_metrics
-            + chembl_target_annotations
-            + filtering_columns
-        )
-        dataset.df_result = dataset.df_result[columns]
-
-    len_columns_after = len(dataset.df_result.columns)
+    :param dataset: Dataset with compound-target pairs.
+        Will be updated to comply with the column schema.
+    :type dataset: Dataset
+    :param calculate_rdkit: True if the DataFrame contains RDKit-based compound properties
+    :type calculate_rdkit: bool
+    """
+    columns = column_schema.get_columns(calculate_rdkit)
+    schema_columns = {column.name for column in columns}
+    dataset_columns = (
+        set(dataset.df_result.columns)
+        | set(dataset.df_compounds.columns)
+        | set(dataset.df_targets.columns)
+    )
     assert (
-        len_columns_before == len_columns_after
-    ), f"Different number of columns after reordering \
-        (before: {len_columns_before}, after: {len_columns_after})."
+        dataset_columns == schema_columns
+    ), f"Different columns in the dataset and the column schema \
+        (not in schema: {sorted(dataset_columns - schema_columns)}, \
+        not in dataset: {sorted(schema_columns - dataset_columns)})."
+
+    dataset.df_result = apply_column_schema_to_table(dataset.df_result, columns)
+    dataset.df_compounds = apply_column_schema_to_table(dataset.df_compounds, columns)
+    dataset.df_targets = apply_column_schema_to_table(dataset.df_targets, columns)
 
 
 def clean_dataset(dataset: Dataset, calculate_rdkit: bool) -> pd.DataFrame:
@@ -320,11 +262,14 @@ def clean_dataset(dataset: Dataset, calculate_rdkit: bool) -> pd.DataFrame:
     Clean the dataset by
 
     - changing nan values and empty strings to None
-    - setting the type of relevant columns to Int64
-    - rounding floats to 4 decimal places (with the exception of max_phase which is not rounded)
-    - reordering columns
+    - reordering columns, setting the data types of numeric columns \
+      and rounding floats according to the column schema (see column_schema)
     - sorting rows by cpd_target_pair_mutation
 
+    The compound and target attributes stay in the dimension tables
+    and are only joined onto the compound-target pairs
+    when the dataset is written (see star_schema).
+
     :param dataset: Dataset with compound-target pairs.
         Will be updated to clean version with the updates described above.
     :type dataset: Dataset
@@ -332,9 +277,8 @@ def clean_dataset(dataset: Dataset, calculate_rdkit: bool) -> pd.DataFrame:
     :type calculate_rdkit: bool
     """
     clean_none_values(dataset)
-    set_types_to_int(dataset, calculate_rdkit)
-    round_floats(dataset, decimal_places=4)
-    reorder_columns(dataset, calculate_rdkit)
-    dataset.df_result = dataset.df_result.sort_values(
-        by=["cpd_target_pair_mutation"]
-    ).reset_index(drop=True)
+    apply_column_schema(dataset, calculate_rdkit)
+    # sort by the string representation of the int64 keys, see pair_keys
+    dataset.df_result = dataset.df_result.iloc[
+        pair_keys.get_cpd_target_pair_mutation_order(dataset.df_result)
+    ].reset_index(drop=True)
@@ -0,0 +1,341 @@
+"""
+Registry of the columns of the final dataset.
+
+Every column has a data type, a group that determines the column order,
+the number of decimal places it is rounded to
+and a flag for columns that are only calculated with RDKit.
+The registry is used to clean the dataset (see clean_dataset.apply_column_schema),
+to check RDKit-based columns and to write and read the output files.
+Every dataset file is written with a schema sidecar (<filename>.schema.json)
+so that it can be read without inferring the data types.
+"""
+
+from dataclasses import dataclass
+import json
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import ligand_efficiency
+
+# number of decimal places of rounded float columns
+DECIMALS = 4
+
+# groups of columns in the order of the columns in the dataset
+COMPOUND_TARGET_PAIR = "compound_target_pair"
+AGGREGATED_VALUES = "aggregated_values"
+DTI_ANNOTATIONS = "dti_annotations"
+FIRST_PUBLICATION_CPD = "first_publication_cpd"
+CHEMBL_COMPOUND_PROPS = "chembl_compound_props"
+CHEMBL_STRUCTURES = "chembl_structures"
+LIGAND_EFFICIENCY_METRICS = "ligand_efficiency_metrics"
+CHEMBL_ANNOTATIONS = "chembl_annotations"
+RDKIT_PROPS = "rdkit_props"
+FILTERING = "filtering"
+SUBSET_FILTERING = "subset_filtering"
+GROUPS = [
+    COMPOUND_TARGET_PAIR,
+    AGGREGATED_VALUES,
+    DTI_ANNOTATIONS,
+    FIRST_PUBLICATION_CPD,
+    CHEMBL_COMPOUND_PROPS,
+    CHEMBL_STRUCTURES,
+    LIGAND_EFFICIENCY_METRICS,
+    CHEMBL_ANNOTATIONS,
+    RDKIT_PROPS,
+    FILTERING,
+    SUBSET_FILTERING,
+]
+
+# filtering columns for subsets (e.g., BF_100_d_dt), see add_filtering_columns
+SUBSET_COLUMN_PREFIXES = ("BF_", "B_")
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """
+    Specification of a column of the dataset.
+
+    - name:         Name of the column
+    - dtype:        Data type in the output files (str for text columns)
+    - group:        Group of the column, see GROUPS
+    - decimals:     Number of decimal places the column is rounded to, \
+                    not rounded if None
+    - rdkit_only:   True if the column is only calculated with RDKit
+    """
+
+    name: str
+    dtype: str
+    group: str
+    decimals: Optional[int] = None
+    rdkit_only: bool = False
+
+
+COLUMNS = [
+    # compound-target pairs
+    ColumnSpec("parent_molregno", "int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("parent_chemblid", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("parent_pref_name", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("max_phase", "float64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("first_approval", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("usan_year", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("black_box_warning", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("prodrug", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("oral", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("parenteral", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("topical", "Int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("tid", "int64", COMPOUND_TARGET_PAIR),
+    ColumnSpec("mutation", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("target_chembl_id", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("target_pref_name", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("target_type", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("organism", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("tid_mutation", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("cpd_target_pair", "str", COMPOUND_TARGET_PAIR),
+    ColumnSpec("cpd_target_pair_mutation", "str", COMPOUND_TARGET_PAIR),
+    # aggregated values
+    ColumnSpec("pchembl_value_mean_BF", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("pchembl_value_max_BF", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("pchembl_value_median_BF", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("first_publication_cpd_target_pair_BF", "Int64", AGGREGATED_VALUES),
+    ColumnSpec(
+        "first_publication_cpd_target_pair_w_pchembl_BF", "Int64", AGGREGATED_VALUES
+    ),
+    ColumnSpec("pchembl_value_mean_B", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("pchembl_value_max_B", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("pchembl_value_median_B", "float64", AGGREGATED_VALUES, DECIMALS),
+    ColumnSpec("first_publication_cpd_target_pair_B", "Int64", AGGREGATED_VALUES),
+    ColumnSpec(
+        "first_publication_cpd_target_pair_w_pchembl_B", "Int64", AGGREGATED_VALUES
+    ),
+    # DTI annotations
+    ColumnSpec("therapeutic_target", "bool", DTI_ANNOTATIONS),
+    ColumnSpec("DTI", "str", DTI_ANNOTATIONS),
+    # first publication of the compound
+    ColumnSpec("first_publication_cpd", "Int64", FIRST_PUBLICATION_CPD),
+    # ChEMBL compound properties
+    ColumnSpec("mw_freebase", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("alogp", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("hba", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("hbd", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("psa", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("rtb", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("ro3_pass", "str", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("num_ro5_violations", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("cx_most_apka", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("cx_most_bpka", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("cx_logp", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("cx_logd", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("molecular_species", "str", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("full_mwt", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("aromatic_rings", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("heavy_atoms", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("qed_weighted", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("mw_monoisotopic", "float64", CHEMBL_COMPOUND_PROPS, DECIMALS),
+    ColumnSpec("full_molformula", "str", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("hba_lipinski", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("hbd_lipinski", "Int64", CHEMBL_COMPOUND_PROPS),
+    ColumnSpec("num_lipinski_ro5_violations", "Int64", CHEMBL_COMPOUND_PROPS),
+    # ChEMBL structures
+    ColumnSpec("standard_inchi", "str", CHEMBL_STRUCTURES),
+    ColumnSpec("standard_inchi_key", "str", CHEMBL_STRUCTURES),
+    ColumnSpec("canonical_smiles", "str", CHEMBL_STRUCTURES),
+    # ligand efficiency metrics are taken from the registry in ligand_efficiency,
+    # see get_ligand_efficiency_columns
+    # ChEMBL compound and target annotations
+    ColumnSpec("atc_level1", "str", CHEMBL_ANNOTATIONS),
+    ColumnSpec("target_class_l1", "str", CHEMBL_ANNOTATIONS),
+    ColumnSpec("target_class_l2", "str", CHEMBL_ANNOTATIONS),
+    # RDKit-based compound properties
+    ColumnSpec("fraction_csp3", "float64", RDKIT_PROPS, DECIMALS, rdkit_only=True),
+    ColumnSpec("ring_count", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aliphatic_rings", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aliphatic_carbocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aliphatic_heterocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aromatic_rings", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aromatic_carbocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_aromatic_heterocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_saturated_rings", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_saturated_carbocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_saturated_heterocycles", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_stereocentres", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("num_heteroatoms", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("aromatic_atoms", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("aromatic_c", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("aromatic_n", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("aromatic_hetero", "Int64", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("scaffold_w_stereo", "str", RDKIT_PROPS, rdkit_only=True),
+    ColumnSpec("scaffold_wo_stereo", "str", RDKIT_PROPS, rdkit_only=True),
+    # filtering columns
+    ColumnSpec("pair_mutation_in_dm_table", "bool", FILTERING),
+    ColumnSpec("pair_in_dm_table", "bool", FILTERING),
+    ColumnSpec("keep_for_binding", "bool", FILTERING),
+]
+
+
+########### Columns ###########
+def get_ligand_efficiency_columns() -> list[ColumnSpec]:
+    """
+    Get the specifications of the registered ligand efficiency metrics
+    (see ligand_efficiency.METRICS).
+
+    :return: List of column specifications, first for binding and then for
+        binding+functional assays
+    :rtype: list[ColumnSpec]
+    """
+    return [
+        ColumnSpec(name, "float64", LIGAND_EFFICIENCY_METRICS, DECIMALS)
+        for suffix in ["B", "BF"]
+        for name in ligand_efficiency.get_metric_columns(suffix)
+    ]
+
+
+def get_columns(calculate_rdkit: bool) -> list[ColumnSpec]:
+    """
+    Get the specifications of the columns of the cleaned dataset in the output order.
+    Filtering columns for subsets are added later (see add_filtering_columns)
+    and are not included.
+
+    :param calculate_rdkit: True if the dataset contains RDKit-based compound properties
+    :type calculate_rdkit: bool
+    :return: List of column specifications
+    :rtype: list[ColumnSpec]
+    """
+    columns = COLUMNS + get_ligand_efficiency_columns()
+    return [
+        column
+        for group in GROUPS
+        for column in columns
+        if column.group == group and (calculate_rdkit or not column.rdkit_only)
+    ]
+
+
+def get_dtypes(columns: list[str]) -> dict[str, str]:
+    """
+    Get the data types of columns in the output files.
+
+    :param columns: Names of the columns
+    :type columns: list[str]
+    :raises ValueError: If a column is not in the registry
+    :return: Dictionary from the column name to the data type
+    :rtype: dict[str, str]
+    """
+    registered_dtypes = {
+        column.name: column.dtype for column in get_columns(calculate_rdkit=True)
+    }
+    dtypes = {}
+    for name in columns:
+        if name in registered_dtypes:
+            dtypes[name] = registered_dtypes[name]
+        elif name.startswith(SUBSET_COLUMN_PREFIXES):
+            dtypes[name] = "bool"
+        else:
+            raise ValueError(f"Column {name} is not in the column schema.")
+    return dtypes
+
+
+########### Schema Sidecar ###########
+def get_schema_file(filename: str) -> str:
+    """
+    Get the name of the schema sidecar of a dataset file.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: Name of the schema sidecar
+    :rtype: str
+    """
+    return f"{filename}.schema.json"
+
+
+def write_schema(columns: list[str], filename: str, delimiter: str):
+    """
+    Write the schema sidecar with the data types of the columns.
+
+    :param columns: Columns of the DataFrame that is written to <filename>
+    :type columns: list[str]
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param delimiter: Delimiter of the CSV file
+    :type delimiter: str
+    """
+    schema = {
+        "delimiter": delimiter,
+        "columns": [
+            {"name": name, "dtype": dtype}
+            for name, dtype in get_dtypes(columns).items()
+        ],
+    }
+    with open(get_schema_file(filename), "w", encoding="utf-8") as schema_file:
+        json.dump(schema, schema_file, indent=2)
+
+
+def read_schema(filename: str) -> tuple[dict[str, str], str]:
+    """
+    Read the schema sidecar of a dataset file.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: Dictionary from the column name to the data type,
+        delimiter of the CSV file
+    :rtype: tuple[dict[str, str], str]
+    """
+    with open(get_schema_file(filename), encoding="utf-8") as schema_file:
+        schema = json.load(schema_file)
+    return {column["name"]: column["dtype"] for column in schema["columns"]}, schema[
+        "delimiter"
+    ]
+
+
+def get_skiprows(rows: Optional[np.ndarray]) -> Optional[Callable[[int], bool]]:
+    """
+    Get a function for the skiprows argument of the pandas readers
+    that only keeps the header and the given data rows.
+
+    :param rows: Sorted positions of the data rows that should be read,
+        all rows are read if None
+    :type rows: Optional[np.ndarray]
+    :return: Function that is True for the line numbers that are skipped,
+        None if all rows are read
+    :rtype: Optional[Callable[[int], bool]]
+    """
+    if rows is None:
+        return None
+    # line 0 is the header
+    lines = set((np.asarray(rows) + 1).tolist())
+    return lambda line: line != 0 and line not in lines
+
+
+def read_csv(filename: str, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Read a dataset CSV file with the data types in its schema sidecar,
+    i.e., without inferring the data types.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param rows: Sorted positions of the data rows that should be read,
+        all rows are read if None, defaults to None
+    :type rows: Optional[np.ndarray], optional
+    :return: Pandas DataFrame with the dataset
+    :rtype: pd.DataFrame
+    """
+    dtypes, delimiter = read_schema(filename)
+    return pd.read_csv(
+        f"{filename}.csv", sep=delimiter, dtype=dtypes, skiprows=get_skiprows(rows)
+    )
+
+
+def read_excel(filename: str, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Read a dataset Excel file with the data types in its schema sidecar.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param rows: Sorted positions of the data rows that should be read,
+        all rows are read if None, defaults to None
+    :type rows: Optional[np.ndarray], optional
+    :return: Pandas DataFrame with the dataset
+    :rtype: pd.DataFrame
+    """
+    dtypes, _ = read_schema(filename)
+    return pd.read_excel(f"{filename}.xlsx", dtype=dtypes, skiprows=get_skiprows(rows))
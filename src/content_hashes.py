@@ -0,0 +1,211 @@
+"""
+Content hashes of the dataset files.
+
+Every row of a dataset is hashed based on its values
+(independent of the file format, null values are hashed as nulls).
+The row hashes are combined in order into one content hash per file.
+The content hash is calculated while the dataset is written
+and recalculated by reading the file back in chunks (see get_csv_content_hash),
+i.e., without keeping a second copy of the dataset in memory.
+Content hashes and checksums of the written files are collected in a manifest
+(manifest.json in the output directory) for downstream integrity checks.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import column_schema
+
+# number of rows that are written / read and hashed at once
+CHUNK_SIZE = 100000
+MANIFEST_FILE = "manifest.json"
+# serializes updates of the manifest
+MANIFEST_LOCK = threading.Lock()
+
+
+########### Row Hashes ###########
+def get_row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Get a canonical hash of every row of df.
+    Text columns are hashed as objects, independent of their pandas data type,
+    and None and nan are hashed as the same null value.
+
+    :param df: Pandas DataFrame
+    :type df: pd.DataFrame
+    :return: Array with one uint64 hash per row
+    :rtype: np.ndarray
+    """
+    text_columns = {
+        col: "object"
+        for col in df.columns
+        if isinstance(df[col].dtype, pd.CategoricalDtype)
+        or pd.api.types.is_string_dtype(df[col].dtype)
+    }
+    if text_columns:
+        df = df.astype(text_columns)
+    # values are categorized before hashing, i.e., all null values get the same hash
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class ContentHash:
+    """
+    Order-sensitive hash over the row hashes of a dataset
+    that is updated chunk by chunk.
+    Additionally, the sum of the row hashes (modulo 2^64) is kept
+    as order-independent digest for files that do not keep the order of the rows
+    (e.g., partitioned parquet files, see parquet_files).
+    """
+
+    def __init__(self):
+        self.nof_rows = 0
+        self._sha256 = hashlib.sha256()
+        self._row_hash_sum = 0
+
+    def update(self, df_chunk: pd.DataFrame):
+        """
+        Add the rows of the next chunk of the dataset.
+
+        :param df_chunk: Next rows of the dataset
+        :type df_chunk: pd.DataFrame
+        """
+        row_hashes = get_row_hashes(df_chunk)
+        self.nof_rows += len(df_chunk)
+        self._sha256.update(row_hashes.astype("<u8").tobytes())
+        # the sum over the uint64 array wraps around
+        self._row_hash_sum = (
+            self._row_hash_sum + int(row_hashes.sum(dtype="uint64"))
+        ) % 2**64
+
+    def hexdigest(self) -> str:
+        """
+        Get the content hash of all rows added so far.
+
+        :return: Hexadecimal SHA-256 digest
+        :rtype: str
+        """
+        return self._sha256.hexdigest()
+
+    def unordered_hexdigest(self) -> str:
+        """
+        Get the order-independent digest of all rows added so far.
+
+        :return: Hexadecimal sum of the row hashes
+        :rtype: str
+        """
+        return f"{self._row_hash_sum:016x}"
+
+
+########### Verification ###########
+def get_csv_content_hash(filename: str, chunk_size: int = CHUNK_SIZE) -> ContentHash:
+    """
+    Calculate the content hash of a dataset CSV file
+    by reading it in chunks with the data types in its schema sidecar
+    (see column_schema).
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param chunk_size: Number of rows read at once, defaults to CHUNK_SIZE
+    :type chunk_size: int, optional
+    :return: Content hash of the file
+    :rtype: ContentHash
+    """
+    dtypes, delimiter = column_schema.read_schema(filename)
+    content_hash = ContentHash()
+    with pd.read_csv(
+        f"{filename}.csv", sep=delimiter, dtype=dtypes, chunksize=chunk_size
+    ) as reader:
+        for df_chunk in reader:
+            content_hash.update(df_chunk)
+    return content_hash
+
+
+def get_excel_content_hash(filename: str) -> ContentHash:
+    """
+    Calculate the content hash of a dataset Excel file.
+    Excel files can not be read in chunks, i.e., the whole file is read at once.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: Content hash of the file
+    :rtype: ContentHash
+    """
+    content_hash = ContentHash()
+    content_hash.update(column_schema.read_excel(filename))
+    return content_hash
+
+
+def get_file_checksum(path: str) -> str:
+    """
+    Get the SHA-256 checksum of the bytes of a file, read in blocks.
+    For a directory (e.g., a partitioned parquet dataset),
+    the relative paths and bytes of all files in it are hashed in sorted order.
+
+    :param path: Path to the file or directory
+    :type path: str
+    :return: Hexadecimal SHA-256 digest
+    :rtype: str
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.relpath(os.path.join(directory, name), path)
+            for directory, _, names in os.walk(path)
+            for name in names
+        )
+    else:
+        files = [""]
+    sha256 = hashlib.sha256()
+    for file_path in files:
+        sha256.update(file_path.encode("utf-8"))
+        with open(os.path.join(path, file_path) if file_path else path, "rb") as file:
+            for block in iter(functools.partial(file.read, 1 << 20), b""):
+                sha256.update(block)
+    return sha256.hexdigest()
+
+
+########### Manifest ###########
+def add_to_manifest(
+    filename: str, file_type_list: list[str], content_hash: ContentHash
+):
+    """
+    Add the written files of a dataset to the manifest in their directory.
+    Existing entries for the same files are replaced.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param file_type_list: List of file extensions that were written.
+        Options: csv, xlsx, parquet
+    :type file_type_list: list[str]
+    :param content_hash: Content hash calculated while writing the dataset
+    :type content_hash: ContentHash
+    """
+    # checksums are calculated before the manifest is locked
+    entries = {
+        os.path.basename(f"{filename}.{file_type}"): {
+            "rows": content_hash.nof_rows,
+            "content_hash": content_hash.hexdigest(),
+            "unordered_content_hash": content_hash.unordered_hexdigest(),
+            "sha256": get_file_checksum(f"{filename}.{file_type}"),
+            "schema": os.path.basename(column_schema.get_schema_file(filename)),
+        }
+        for file_type in file_type_list
+    }
+
+    manifest_path = os.path.join(os.path.dirname(filename), MANIFEST_FILE)
+    # datasets may be written concurrently (see export_scheduler)
+    with MANIFEST_LOCK:
+        manifest = {"files": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+
+        manifest["files"].update(entries)
+        manifest["files"] = dict(sorted(manifest["files"].items()))
+
+        with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
@@ -5,28 +5,43 @@ and related data.
 
 from dataclasses import dataclass
 
+import numpy as np
 import pandas as pd
 
 
 @dataclass
+# pylint: disable-next=too-many-instance-attributes
 class Dataset:
     """
     Calculated compound-target pairs dataset (df_results) and related data.
     
-    - df_result:                  Pandas DataFrame with the full dataset
-    - drug_mechanism_pairs_set:   Set of compound-target pairs in the drug_mechanism table, \
+    - df_result:                  Pandas DataFrame with one row per compound-target pair \
+                                (fact table, compound and target attributes \
+                                are joined for the output, see star_schema)
+    - df_compounds:               Pandas DataFrame with one row per compound \
+                                and the compound attributes
+    - df_targets:                 Pandas DataFrame with one row per target \
+                                and the target attributes
+    - drug_mechanism_pairs_set:   Sorted array of unique compound-target pair keys \
+                                (see pair_keys) in the drug_mechanism table, \
                                 used for DTI assignments
-    - drug_mechanism_targets_set: Set of targets in the drug_mechanism table, \
+    - drug_mechanism_targets_set: Sorted array of unique targets in the drug_mechanism table, \
                                 used for DTI assigments
     - df_sizes_all:               Pandas DataFrame of intermediate sizes of the dataset, \
                                 used for debugging
     - df_sizes_pchembl:           Pandas DataFrame of intermediate sizes of the dataset, \
                                 restricted to entries with a pchembl value, \
                                 used for debugging
+    - df_memory_usage:            Pandas DataFrame of the memory usage of columns \
+                                before and after applying the data type policy, \
+                                used for debugging
     """
 
     df_result: pd.DataFrame
-    drug_mechanism_pairs_set: set
-    drug_mechanism_targets_set: set
+    df_compounds: pd.DataFrame
+    df_targets: pd.DataFrame
+    drug_mechanism_pairs_set: np.ndarray
+    drug_mechanism_targets_set: np.ndarray
     df_sizes_all: pd.DataFrame
     df_sizes_pchembl: pd.DataFrame
+    df_memory_usage: pd.DataFrame
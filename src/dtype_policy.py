@@ -0,0 +1,179 @@
+"""
+Memory-lean data types for the compound-target pairs dataset.
+
+Repeated text (e.g., target_type or DTI) is stored as categoricals and
+integer ids are downcast to 32 bit integers.
+Null values are kept (nullable integer types are used for ids with null values).
+Before writing the output, the columns are converted back
+to the types that are read back from the output files.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from dataset import Dataset
+
+# low-cardinality text columns stored as categoricals
+CATEGORY_COLUMNS = [
+    "target_type",
+    "organism",
+    "assay_type",
+    "molecular_species",
+    "DTI",
+    "ro3_pass",
+    "atc_level1",
+    "target_class_l1",
+    "target_class_l2",
+]
+
+# integer ids downcast to 32 bit integers
+ID_COLUMNS = [
+    "parent_molregno",
+    "tid",
+]
+
+# tables of the dataset the policy is applied to, see star_schema
+DATASET_TABLES = [
+    "df_result",
+    "df_compounds",
+    "df_targets",
+]
+
+
+########### Applying the Policy ###########
+def downcast_ids(column: pd.Series) -> pd.Series:
+    """
+    Downcast an integer id column to int32 (Int32 if it contains null values).
+    Columns with values that do not fit into 32 bits are returned as they are.
+
+    :param column: Column with integer ids
+    :type column: pd.Series
+    :return: Downcast column
+    :rtype: pd.Series
+    """
+    if column.isnull().all():
+        return column
+    int32_info = np.iinfo("int32")
+    if column.min() < int32_info.min or column.max() > int32_info.max:
+        return column
+    if column.hasnans:
+        return column.astype("Int32")
+    return column.astype("int32")
+
+
+def get_policy_types(df: pd.DataFrame) -> dict:
+    """
+    Get the data types of the columns of df that do not comply with the policy yet.
+
+    :param df: Pandas DataFrame
+    :type df: pd.DataFrame
+    :return: Dictionary from column to the data type according to the policy
+    :rtype: dict
+    """
+    policy_types = {}
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            policy_types[col] = "category"
+    for col in ID_COLUMNS:
+        if col in df.columns and df[col].dtype not in ("int32", "Int32"):
+            policy_types[col] = "int32"
+    return policy_types
+
+
+def apply_dtype_policy(dataset: Dataset, label: str):
+    """
+    Apply the data type policy to the fact and dimension tables of the dataset
+    (dataset.df_result, dataset.df_compounds, dataset.df_targets).
+    Only columns which do not comply with the policy yet are converted.
+    If debugging information is logged,
+    the memory usage of the converted columns before and after is added to
+    dataset.df_memory_usage.
+
+    :param dataset: Dataset with compound-target pairs.
+        Will be updated to use the policy data types.
+    :type dataset: Dataset
+    :param label: Description of pipeline step (e.g., initial query).
+    :type label: str
+    """
+    for table in DATASET_TABLES:
+        df = getattr(dataset, table)
+        policy_types = get_policy_types(df)
+        if not policy_types:
+            continue
+
+        df_before = df[list(policy_types)]
+        for col, policy_type in policy_types.items():
+            if policy_type == "category":
+                df[col] = df[col].astype("category")
+            else:
+                df[col] = downcast_ids(df[col])
+
+        if logging.DEBUG >= logging.root.level:
+            add_memory_usage(
+                dataset, df_before, df[list(policy_types)], f"{label} ({table})"
+            )
+
+
+def get_output_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the policy data types back to the types that are read
+    from the output files, i.e., categoricals to objects (with None for null values)
+    and downcast ids to int64.
+
+    :param df: Pandas DataFrame with policy data types
+    :type df: pd.DataFrame
+    :return: Copy of df with the output data types
+        (df itself if no column has to be converted)
+    :rtype: pd.DataFrame
+    """
+    output_columns = {}
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            column = df[col].astype("object")
+            output_columns[col] = column.where(column.notnull(), None)
+    for col in ID_COLUMNS:
+        if col in df.columns and df[col].dtype == "int32":
+            output_columns[col] = df[col].astype("int64")
+        elif col in df.columns and df[col].dtype == "Int32":
+            output_columns[col] = df[col].astype("Int64")
+    if not output_columns:
+        return df
+    return df.assign(**output_columns)
+
+
+########### Memory Usage ###########
+def add_memory_usage(
+    dataset: Dataset, df_before: pd.DataFrame, df_after: pd.DataFrame, label: str
+):
+    """
+    Add the memory usage per column before and after applying the policy
+    to dataset.df_memory_usage and log the total savings.
+
+    :param dataset: Dataset with compound-target pairs and debugging information.
+    :type dataset: Dataset
+    :param df_before: Converted columns before applying the policy
+    :type df_before: pd.DataFrame
+    :param df_after: Converted columns after applying the policy
+    :type df_after: pd.DataFrame
+    :param label: Description of pipeline step (e.g., initial query).
+    :type label: str
+    """
+    df_usage = pd.DataFrame(
+        {
+            "step": label,
+            "column": df_before.columns,
+            "dtype_before": df_before.dtypes.astype("str").values,
+            "dtype_after": df_after.dtypes.astype("str").values,
+            "bytes_before": df_before.memory_usage(index=False, deep=True).values,
+            "bytes_after": df_after.memory_usage(index=False, deep=True).values,
+        }
+    )
+    logging.debug(
+        "Memory usage of converted columns (%s): %s bytes before, %s bytes after",
+        label,
+        df_usage["bytes_before"].sum(),
+        df_usage["bytes_after"].sum(),
+    )
+    dataset.df_memory_usage = pd.concat([dataset.df_memory_usage, df_usage])
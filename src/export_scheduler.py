@@ -0,0 +1,77 @@
+"""
+Bounded thread pool for writing independent output files concurrently.
+
+Writing, verifying and summarising the dataset files are mostly I/O-
+and serialization-bound (e.g., DataFrame.to_csv, parquet encoding, hashing),
+i.e., they release the GIL for large parts of the work.
+Every task writes its own files, so the written files do not depend on
+the number of workers or the order in which the tasks finish.
+Shared files (the manifest, see content_hashes) are only updated under a lock.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+
+class ExportScheduler:
+    """
+    Run export tasks in a bounded thread pool.
+    With one worker, tasks are run immediately in the calling thread,
+    i.e., in the same order and thread as without a scheduler.
+
+    Use as context manager, all tasks are finished when the context is left::
+
+        with ExportScheduler(workers) as scheduler:
+            scheduler.submit(output.write_and_check_dataset, dataset, filename, out)
+
+    Exceptions of tasks (e.g., failed sanity checks) are raised
+    when the context is left, in the order in which the tasks were submitted.
+    """
+
+    def __init__(self, workers: int):
+        """
+        :param workers: Maximum number of tasks that run at the same time
+        :type workers: int
+        """
+        assert workers >= 1, "At least one worker is required."
+        self.workers = workers
+        self._executor = None
+        self._futures: list[Future] = []
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="export"
+            )
+        return self
+
+    def submit(self, task: Callable, *args, **kwargs):
+        """
+        Run task(*args, **kwargs) in the thread pool.
+
+        :param task: Export task, its return value is ignored
+        :type task: Callable
+        """
+        if self._executor is None:
+            task(*args, **kwargs)
+        else:
+            self._futures.append(self._executor.submit(task, *args, **kwargs))
+
+    def wait(self):
+        """
+        Wait for all submitted tasks and raise the first exception
+        (in the order of submission), if any.
+        """
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._executor is None:
+            return
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            # tasks that have not started yet are not run after an exception
+            self._executor.shutdown(wait=True, cancel_futures=True)
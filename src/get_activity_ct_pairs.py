@@ -4,20 +4,24 @@ for the dataset.
 """
 
 import sqlite3
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 
+from arguments import CalculationArgs
 from dataset import Dataset
+import grouped_aggregation
+import pair_keys
+from grouped_aggregation import Aggregation
+import sanity_checks
+import star_schema
 
 
 ########### Get Initial Compound-Target Data From ChEMBL ###########
-def get_compound_target_pairs_with_pchembl(
-    chembl_con: sqlite3.Connection,
-    limit_to_literature: bool,
-) -> pd.DataFrame:
+def get_compound_target_pairs_with_pchembl_query(limit_to_literature: bool) -> str:
     """
-    Query ChEMBL activities and related assay for compound-target pairs
+    Get the SQL query for ChEMBL activities and related assay for compound-target pairs
     with an associated pchembl value.
     Compound-target pairs are required to have a pchembl value.
     Salt forms of compounds are mapped to their parent form.
@@ -25,13 +29,11 @@ def get_compound_target_pairs_with_pchembl(
     Otherwise, all sources are included.
     Includes information about targets, mutations and year of publication (based on docs).
 
-    :param chembl_con: Sqlite3 connection to ChEMBL database.
-    :type chembl_con: sqlite3.Connection
     :param limit_to_literature: Include only literature sources if True.
         Include all available sources otherwise.
     :type limit_to_literature: bool
-    :return: Pandas DataFrame with compound-target pairs with a pchembl value.
-    :rtype: pd.DataFrame
+    :return: SQL query for compound-target pairs with a pchembl value.
+    :rtype: str
     """
     # NOTE: DO NOT USE DISTINCT
     # This query does not capture act.activity_id.
@@ -69,27 +71,109 @@ def get_compound_target_pairs_with_pchembl(
     if limit_to_literature:
         sql += """    and docs.src_id = 1"""
 
-    df_mols = pd.read_sql_query(sql, con=chembl_con)
+    return sql
+
 
+def add_ct_pair_columns(df_mols: pd.DataFrame, mutation_ids: dict[str, int]):
+    """
+    Add the columns tid_mutation, cpd_target_pair and cpd_target_pair_mutation
+    based on parent_molregno, tid and mutation.
+    The columns contain int64 keys (see :mod:`pair_keys`)
+    which are only converted to strings when writing the output.
+
+    :param df_mols: Pandas DataFrame with compound-target pairs.
+        Will be updated to include the combined columns.
+    :type df_mols: pd.DataFrame
+    :param mutation_ids: Dictionary from mutation to mutation id.
+        Use the same dictionary to get consistent keys for several DataFrames.
+    :type mutation_ids: dict[str, int]
+    """
     # Set relevant combinations of columns for easier processing later
-    # target_id_mutation
-    df_mols["tid_mutation"] = np.where(
-        df_mols["mutation"].notnull(),
-        df_mols["tid"].astype("str") + "_" + df_mols["mutation"],
-        df_mols["tid"].astype("str"),
-    )
-    df_mols["cpd_target_pair"] = [
-        f"{a}_{b}" for a, b in zip(df_mols["parent_molregno"], df_mols["tid"])
-    ]
-    df_mols["cpd_target_pair_mutation"] = [
-        f"{a}_{b}" for a, b in zip(df_mols["parent_molregno"], df_mols["tid_mutation"])
-    ]
+    pair_keys.add_key_columns(df_mols, mutation_ids)
+
+
+def get_compound_target_pairs_with_pchembl(
+    chembl_con: sqlite3.Connection,
+    limit_to_literature: bool,
+) -> pd.DataFrame:
+    """
+    Query ChEMBL activities and related assay for compound-target pairs
+    with an associated pchembl value
+    (see :func:`get_compound_target_pairs_with_pchembl_query`).
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param limit_to_literature: Include only literature sources if True.
+        Include all available sources otherwise.
+    :type limit_to_literature: bool
+    :return: Pandas DataFrame with compound-target pairs with a pchembl value.
+    :rtype: pd.DataFrame
+    """
+    sql = get_compound_target_pairs_with_pchembl_query(limit_to_literature)
+    df_mols = pd.read_sql_query(sql, con=chembl_con)
+    add_ct_pair_columns(df_mols, {})
 
     return df_mols
 
 
 ########### Calculate Mean, Median, Max pchembl Values for Each Compound-Target Pair ###########
-def get_average_info(df: pd.DataFrame, suffix: str) -> pd.DataFrame:
+def add_assay_type_masks(df_mols: pd.DataFrame):
+    """
+    Add the boolean columns used to restrict the aggregations in :func:`get_average_info`:
+    with_pchembl (activity has a pchembl value),
+    binding (activity is based on a binding assay)
+    and binding_w_pchembl (both).
+
+    :param df_mols: Pandas DataFrame with compound-target pairs.
+        Will be updated to include the masks.
+    :type df_mols: pd.DataFrame
+    """
+    df_mols["with_pchembl"] = df_mols["pchembl_value"].notnull()
+    df_mols["binding"] = df_mols["assay_type"] == "B"
+    df_mols["binding_w_pchembl"] = df_mols["binding"] & df_mols["with_pchembl"]
+
+
+def get_aggregations(
+    suffix: str, where: Optional[str], where_w_pchembl: str
+) -> list[Aggregation]:
+    """
+    Get the aggregations of the pchembl values and publication years
+    of a compound-target pair (see :func:`get_average_info`).
+
+    :param suffix: Suffix of the aggregated columns,
+        e.g., B for binding assays, BF for binding+functional assays.
+    :type suffix: str
+    :param where: Boolean column with the activities that should be aggregated,
+        all activities if None
+    :type where: Optional[str]
+    :param where_w_pchembl: Boolean column with the activities that should be aggregated
+        and have a pchembl value
+    :type where_w_pchembl: str
+    :return: List of aggregations
+    :rtype: list[Aggregation]
+    """
+    return [
+        # pchembl mean, max, median
+        Aggregation(f"pchembl_value_mean_{suffix}", "pchembl_value", "mean", where),
+        Aggregation(f"pchembl_value_max_{suffix}", "pchembl_value", "max", where),
+        Aggregation(f"pchembl_value_median_{suffix}", "pchembl_value", "median", where),
+        # first publication of pair
+        Aggregation(
+            f"first_publication_cpd_target_pair_{suffix}", "year", "min", where
+        ),
+        # first publication of pair with pchembl value
+        Aggregation(
+            f"first_publication_cpd_target_pair_w_pchembl_{suffix}",
+            "year",
+            "min",
+            where_w_pchembl,
+        ),
+    ]
+
+
+def get_average_info(
+    df: pd.DataFrame, first_columns: Optional[list[str]] = None
+) -> pd.DataFrame:
     """
     Aggregate the information about compound-target pairs for which
     there is more than one entry into one entry.
@@ -110,48 +194,210 @@ def get_average_info(df: pd.DataFrame, suffix: str) -> pd.DataFrame:
     | first_publication_cpd_target_pair_w_pchembl   | first publication in ChEMBL with this compound-target pair and an associated pchembl value    |
     +-----------------------------------------------+-----------------------------------------------------------------------------------------------+
 
+    Each value is aggregated for all given activities (suffix '_BF')
+    and for activities based on binding assays (suffix '_B').
+    Both are calculated in one pass over the sorted compound-target pairs,
+    the values for binding assays are restricted with an assay_type mask.
+
     :param df: Pandas DataFrame with compound-target pairs for which
-        the information should be aggregated.
+        the information should be aggregated
+        (activities based on binding and functional assays)
+        including the masks added by :func:`add_assay_type_masks`.
     :type df: pd.DataFrame
+    :param first_columns: Columns that are constant for a compound-target pair
+        and should be included in the output, defaults to None
+    :type first_columns: Optional[list[str]], optional
+    :return: Pandas DataFrame with 'parent_molregno', 'tid_mutation',
+        the aggregated columns and the first_columns.
+    :rtype: pd.DataFrame
+    """
+    return grouped_aggregation.aggregate(
+        df,
+        ["parent_molregno", "tid_mutation"],
+        get_aggregations("BF", None, "with_pchembl")
+        + get_aggregations("B", "binding", "binding_w_pchembl"),
+        first_columns,
+    )
+
+
+########### Get Aggregated Compound-Target Pair Information ###########
+def get_aggregated_compound_target_pairs_with_pchembl(
+    chembl_con: sqlite3.Connection,
+    limit_to_literature: bool,
+) -> pd.DataFrame:
+    """
+    Get dataset of compound target-pairs with an associated pchembl value
+    with pchembl and publication dates aggregated into one entry per pair.
+
+    Values are aggregated for
+
+    - a subset of the initial dataset based on binding and functional assays (suffix '_BF') and
+    - a subset of the initial dataset set on only binding assays (suffix '_B').
+
+    Therefore, there are two columns for pchembl_value_mean, _max, _median,
+    first_publication_cpd_target_pair and first_publication_cpd_target_pair_w_pchembl,
+    one with the suffix '_BF' based on binding + functional data
+    and one with the suffix '_B' based on only binding data.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param limit_to_literature: Include only literature sources if True.
+        Include all available sources otherwise.
+    :type limit_to_literature: bool
+    :return: Pandas Dataframe with compound-target pairs
+        based on ChEMBL activity data aggregated into one entry per compound-target pair.
+    :rtype: pd.DataFrame
+    """
+    df_mols = get_compound_target_pairs_with_pchembl(
+        chembl_con,
+        limit_to_literature,
+    )
+
+    # other information about the compound-target pairs (compound and target info),
+    # constant per pair and taken from the first activity of the pair
+    info_columns = [
+        col
+        for col in df_mols.columns
+        if col
+        not in (
+            "parent_molregno",
+            "tid_mutation",
+            "pchembl_value",
+            "year",
+            "assay_type",
+        )
+    ]
+    # Masks are added before filtering so that the filtered DataFrame is not copied again.
+    add_assay_type_masks(df_mols)
+
+    # Summarise the information for binding and functional assays (suffix '_BF')
+    # and for only binding assays (suffix '_B') in one pass.
+    return get_average_info(
+        df_mols[df_mols["assay_type"].isin(["B", "F"])], info_columns
+    )
+
+
+########### Get Aggregated Compound-Target Pair Information in Chunks ###########
+# Data types of the columns of get_compound_target_pairs_with_pchembl_query
+# that can be null. Chunks in which such a column is null in every row
+# are read with the same data type as all other chunks.
+# The remaining columns (ids and flags) are never null.
+NULLABLE_ACTIVITY_DTYPES = {
+    "pchembl_value": "float64",
+    "parent_chemblid": "object",
+    "parent_pref_name": "object",
+    "max_phase": "float64",
+    "first_approval": "float64",
+    "usan_year": "float64",
+    "assay_type": "object",
+    "mutation": "object",
+    "target_chembl_id": "object",
+    "target_pref_name": "object",
+    "target_type": "object",
+    "organism": "object",
+    "year": "float64",
+}
+
+
+def get_pchembl_value_counts(df_mols: pd.DataFrame) -> pd.DataFrame:
+    """
+    Count how often each pchembl value occurs for a compound-target pair and assay type.
+    The earliest publication year is kept for each of these entries.
+
+    :param df_mols: Pandas DataFrame with compound-target pairs with a pchembl value.
+    :type df_mols: pd.DataFrame
+    :return: Pandas DataFrame with 'parent_molregno', 'tid_mutation', 'assay_type',
+        'pchembl_value', the number of activities with this value (count)
+        and the earliest year of publication (year).
+    :rtype: pd.DataFrame
+    """
+    df_counts = (
+        df_mols.groupby(
+            ["parent_molregno", "tid_mutation", "assay_type", "pchembl_value"],
+            sort=False,
+        )
+        .agg(count=("count", "sum"), year=("year", "min"))
+        .reset_index()
+    )
+    return df_counts
+
+
+def get_first_pair_rows(df_info: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep the first row of every compound-target pair.
+    The other information about a compound-target pair (compound and target info)
+    is constant per pair, i.e., only the keys need to be compared.
+
+    :param df_info: Pandas DataFrame with compound-target pairs
+        and the other information about them.
+    :type df_info: pd.DataFrame
+    :return: Pandas DataFrame with the first row of every compound-target pair.
+    :rtype: pd.DataFrame
+    """
+    return df_info.drop_duplicates(subset=["parent_molregno", "tid_mutation"])
+
+
+def get_average_info_from_counts(df_counts: pd.DataFrame, suffix: str) -> pd.DataFrame:
+    """
+    Aggregate the pchembl value counts of compound-target pairs into one entry per pair.
+    This calculates the same values as :func:`get_average_info`
+    based on the output of :func:`get_pchembl_value_counts`.
+    The mean is equal up to floating-point rounding since it is calculated
+    from the sum of each distinct pchembl value multiplied by its count.
+    The maximum, median and first publication year are exact.
+
+    :param df_counts: Pandas DataFrame with pchembl value counts
+        for the compound-target pairs that should be aggregated.
+    :type df_counts: pd.DataFrame
     :param suffix: Suffix indicating the type of the given DataFrame,
         e.g., _B for binding assays, _BF for binding+functional assays.
     :type suffix: str
     :return: Pandas DataFrame with 'parent_molregno', 'tid_mutation', and the aggregated columns.
     :rtype: pd.DataFrame
     """
-    # pchembl mean, max, median
-    df[f"pchembl_value_mean_{suffix}"] = df.groupby(
-        ["parent_molregno", "tid_mutation"]
-    )["pchembl_value"].transform("mean")
-    df[f"pchembl_value_max_{suffix}"] = df.groupby(["parent_molregno", "tid_mutation"])[
-        "pchembl_value"
-    ].transform("max")
-    df[f"pchembl_value_median_{suffix}"] = df.groupby(
-        ["parent_molregno", "tid_mutation"]
-    )["pchembl_value"].transform("median")
-
-    # first publication of pair
-    df[f"first_publication_cpd_target_pair_{suffix}"] = df.groupby(
-        ["parent_molregno", "tid_mutation"]
-    )["year"].transform("min")
-
-    # first publication of pair with pchembl value
-    df_mols_all_first_publication_pchembl = (
-        df[df["pchembl_value"].notnull()]
-        .groupby(["parent_molregno", "tid_mutation"])["year"]
-        .min()
+    # sorted by compound-target pair and pchembl value
+    df_counts = (
+        df_counts.groupby(["parent_molregno", "tid_mutation", "pchembl_value"])
+        .agg(count=("count", "sum"), year=("year", "min"))
         .reset_index()
-        .rename(
-            columns={"year": f"first_publication_cpd_target_pair_w_pchembl_{suffix}"}
-        )
     )
-    df = df.merge(
-        df_mols_all_first_publication_pchembl,
-        on=["parent_molregno", "tid_mutation"],
-        how="left",
+    df_counts["weighted_value"] = df_counts["pchembl_value"] * df_counts["count"]
+    df = (
+        df_counts.groupby(["parent_molregno", "tid_mutation"], sort=False)
+        .agg(
+            nof_values=("count", "sum"),
+            weighted_sum=("weighted_value", "sum"),
+            pchembl_value_max=("pchembl_value", "max"),
+            first_publication=("year", "min"),
+        )
+        .reset_index()
     )
 
-    # return relevant summarised information without duplicates
+    # The median is based on the middle position(s) of the sorted values of a pair.
+    # Position p of all values is covered by the first entry with a cumulative count > p.
+    cumulative_counts = df_counts["count"].cumsum().to_numpy()
+    nof_values = df["nof_values"].to_numpy()
+    pair_start = np.cumsum(nof_values) - nof_values
+    values = df_counts["pchembl_value"].to_numpy()
+    lower_median = values[
+        np.searchsorted(
+            cumulative_counts, pair_start + (nof_values - 1) // 2, side="right"
+        )
+    ]
+    upper_median = values[
+        np.searchsorted(cumulative_counts, pair_start + nof_values // 2, side="right")
+    ]
+
+    df[f"pchembl_value_mean_{suffix}"] = df["weighted_sum"] / df["nof_values"]
+    df[f"pchembl_value_max_{suffix}"] = df["pchembl_value_max"]
+    df[f"pchembl_value_median_{suffix}"] = (lower_median + upper_median) / 2
+    # all entries have a pchembl value,
+    # i.e., the first publication of the pair is also the first one with a pchembl value
+    df[f"first_publication_cpd_target_pair_{suffix}"] = df["first_publication"]
+    df[f"first_publication_cpd_target_pair_w_pchembl_{suffix}"] = df[
+        "first_publication"
+    ]
+
     df = df[
         [
             "parent_molregno",
@@ -162,99 +408,349 @@ def get_average_info(df: pd.DataFrame, suffix: str) -> pd.DataFrame:
             f"first_publication_cpd_target_pair_{suffix}",
             f"first_publication_cpd_target_pair_w_pchembl_{suffix}",
         ]
-    ].drop_duplicates()
+    ]
 
     return df
 
 
-########### Get Aggregated Compound-Target Pair Information ###########
-def get_aggregated_compound_target_pairs_with_pchembl(
+def get_aggregated_compound_target_pairs_with_pchembl_streaming(
     chembl_con: sqlite3.Connection,
     limit_to_literature: bool,
+    chunk_size: int,
 ) -> pd.DataFrame:
     """
-    Get dataset of compound target-pairs with an associated pchembl value
-    with pchembl and publication dates aggregated into one entry per pair.
-
-    Values are aggregated for
-
-    - a subset of the initial dataset based on binding and functional assays (suffix '_BF') and
-    - a subset of the initial dataset set on only binding assays (suffix '_B').
-
-    Therefore, there are two columns for pchembl_value_mean, _max, _median,
-    first_publication_cpd_target_pair and first_publication_cpd_target_pair_w_pchembl,
-    one with the suffix '_BF' based on binding + functional data
-    and one with the suffix '_B' based on only binding data.
+    Get the same dataset as :func:`get_aggregated_compound_target_pairs_with_pchembl`
+    but read the activities in chunks of <chunk_size> rows.
+    The mean pchembl values are equal up to floating-point rounding
+    (see :func:`get_average_info_from_counts`).
+
+    For every chunk, the activities are reduced to counts of pchembl values
+    per compound-target pair and assay type and to the first row of every pair.
+    The reduced chunks are combined once they outnumber the already combined rows,
+    so that the work is linear in the number of chunks.
+    Therefore, memory scales with the number of
+    compound-target pairs (and distinct pchembl values per pair)
+    rather than with the number of activities.
 
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
     :param limit_to_literature: Include only literature sources if True.
         Include all available sources otherwise.
     :type limit_to_literature: bool
+    :param chunk_size: Number of activities to read at once.
+    :type chunk_size: int
     :return: Pandas Dataframe with compound-target pairs
         based on ChEMBL activity data aggregated into one entry per compound-target pair.
     :rtype: pd.DataFrame
     """
-    df_mols = get_compound_target_pairs_with_pchembl(
-        chembl_con,
-        limit_to_literature,
-    )
+    sql = get_compound_target_pairs_with_pchembl_query(limit_to_literature)
+
+    # Reduced chunks are collected and only combined once the rows added since
+    # the last combination outnumber the combined rows (or one chunk),
+    # i.e., every row is combined a bounded number of times on average.
+    counts_chunks = []
+    info_chunks = []
+    nof_combined = 0
+    nof_added = 0
+    # shared between chunks to get the same keys for the same mutations
+    mutation_ids = {}
+    for df_chunk in pd.read_sql_query(
+        sql, con=chembl_con, chunksize=chunk_size, dtype=NULLABLE_ACTIVITY_DTYPES
+    ):
+        # Only binding and functional assays are aggregated.
+        df_chunk = df_chunk[df_chunk["assay_type"].isin(["B", "F"])].copy()
+        if df_chunk.empty:
+            # empty chunks would not be combined with consistent data types
+            continue
+        add_ct_pair_columns(df_chunk, mutation_ids)
+        df_chunk["count"] = 1
+
+        counts_chunks.append(get_pchembl_value_counts(df_chunk))
+        info_chunks.append(
+            get_first_pair_rows(
+                df_chunk.drop(columns=["pchembl_value", "year", "assay_type", "count"])
+            )
+        )
+        nof_added += len(counts_chunks[-1])
+        if nof_added > max(nof_combined, chunk_size):
+            counts_chunks = [get_pchembl_value_counts(pd.concat(counts_chunks))]
+            info_chunks = [get_first_pair_rows(pd.concat(info_chunks))]
+            nof_combined = len(counts_chunks[0])
+            nof_added = 0
+
+    if not counts_chunks:
+        # no binding or functional activities, use the in-memory version to get the expected columns
+        return get_aggregated_compound_target_pairs_with_pchembl(
+            chembl_con, limit_to_literature
+        )
+    df_counts = get_pchembl_value_counts(pd.concat(counts_chunks))
+    df_info = get_first_pair_rows(pd.concat(info_chunks, ignore_index=True))
 
     # Summarise the information for binding and functional assays
-    suffix = "BF"
-    df_mols_bf = df_mols[
-        (df_mols["assay_type"] == "B") | (df_mols["assay_type"] == "F")
-    ].copy()
-    df_mols_bf = get_average_info(df_mols_bf, suffix)
+    df_mols_bf = get_average_info_from_counts(df_counts, "BF")
 
     # Summarise the information for only binding assays
-    suffix = "B"
-    df_mols_b = df_mols[df_mols["assay_type"] == "B"].copy()
-    df_mols_b = get_average_info(df_mols_b, suffix)
+    df_mols_b = get_average_info_from_counts(
+        df_counts[df_counts["assay_type"] == "B"], "B"
+    )
 
     # Combine both into one table with two columns per value
-    # (one with suffix '_BF' for binding+functional and one with suffix '_B' for binding).
-    # df_mols_B is a subset of the compound-target pairs of df_mols_BF
+    # and merge with the other information about the compound-target pairs
+    # (see get_aggregated_compound_target_pairs_with_pchembl).
     df_combined = df_mols_bf.merge(
         df_mols_b, on=["parent_molregno", "tid_mutation"], how="left"
     )
-    # Merge with other information from df_mols
-    # left merge because df_mols may contain assays that are
-    # of other types than binding / functional
     df_combined = df_combined.merge(
-        df_mols.drop(columns=["pchembl_value", "year", "assay_type"]).drop_duplicates(),
+        df_info,
         on=["parent_molregno", "tid_mutation"],
         how="left",
     )
+    # Keep the compound-target pairs in the order in which they were read.
+    df_combined = df_info[["parent_molregno", "tid_mutation"]].merge(
+        df_combined, on=["parent_molregno", "tid_mutation"], how="inner"
+    )
 
     return df_combined
 
 
-def get_aggregated_activity_ct_pairs(
+########### Get Aggregated Compound-Target Pair Information With SQLite ###########
+def get_aggregated_compound_target_pairs_with_pchembl_query(
+    limit_to_literature: bool,
+) -> str:
+    """
+    Get the SQL query that aggregates the activities inside SQLite
+    (see :func:`get_aggregated_compound_target_pairs_with_pchembl_sql`).
+
+    :param limit_to_literature: Include only literature sources if True.
+        Include all available sources otherwise.
+    :type limit_to_literature: bool
+    :return: SQL query
+    :rtype: str
+    """
+    # see get_compound_target_pairs_with_pchembl_query for the restrictions,
+    # limited to binding and functional assays
+    sql_activities = """
+    SELECT act.activity_id, act.pchembl_value, mh.parent_molregno, ass.assay_type, ass.tid, vs.mutation, docs.year
+    FROM activities act
+    INNER JOIN molecule_hierarchy mh 
+        ON act.molregno = mh.molregno         -- act.molregno = salt_molregno
+    INNER JOIN assays ass 
+        ON  act.assay_id = ass.assay_id
+    LEFT JOIN variant_sequences vs
+        ON ass.variant_id = vs.variant_id
+    INNER JOIN target_dictionary td
+        ON ass.tid = td.tid
+    LEFT JOIN docs
+        ON act.doc_id = docs.doc_id
+    WHERE act.pchembl_value is not null
+        and act.potential_duplicate = 0
+        and act.standard_relation = '='
+        and act.data_validity_comment is null
+        and td.tid <>22226                    -- exclude unchecked targets
+        and td.target_type like '%PROTEIN%'
+        and ass.assay_type in ('B', 'F')
+    """
+    if limit_to_literature:
+        sql_activities += """    and docs.src_id = 1"""
+
+    # rank_bf / nof_bf: rank and number of values of the pair (binding+functional)
+    # rank_type / nof_type: rank and number of values of the pair and assay type,
+    # used for the binding-only median.
+    # The median is the average of the values ranked (n+1)/2 and (n+2)/2
+    # (integer division), i.e., the middle value if n is odd
+    # and the two middle values if n is even.
+    # first_activity_id: first activity of the pair, the pairs are returned
+    # in the order of their first activity (as in the in-memory version)
+    # rather than in the order of the GROUP BY.
+    sql = f"""
+    WITH activities_bf AS ({sql_activities}),
+    ranked_activities AS (
+        SELECT *,
+            ROW_NUMBER() OVER pair_w AS rank_bf,
+            COUNT(*) OVER (PARTITION BY parent_molregno, tid, mutation) AS nof_bf,
+            ROW_NUMBER() OVER pair_type_w AS rank_type,
+            COUNT(*) OVER (PARTITION BY parent_molregno, tid, mutation, assay_type) AS nof_type
+        FROM activities_bf
+        WINDOW pair_w AS (
+                PARTITION BY parent_molregno, tid, mutation ORDER BY pchembl_value
+            ),
+            pair_type_w AS (
+                PARTITION BY parent_molregno, tid, mutation, assay_type ORDER BY pchembl_value
+            )
+    ),
+    aggregated_activities AS (
+        SELECT parent_molregno, tid, mutation,
+            MIN(activity_id) AS first_activity_id,
+            AVG(pchembl_value) AS pchembl_value_mean_BF,
+            MAX(pchembl_value) AS pchembl_value_max_BF,
+            AVG(CASE WHEN rank_bf IN ((nof_bf + 1) / 2, (nof_bf + 2) / 2)
+                THEN pchembl_value END) AS pchembl_value_median_BF,
+            MIN(year) AS first_publication_cpd_target_pair_BF,
+            MIN(year) AS first_publication_cpd_target_pair_w_pchembl_BF,
+            AVG(CASE WHEN assay_type = 'B' 
+                THEN pchembl_value END) AS pchembl_value_mean_B,
+            MAX(CASE WHEN assay_type = 'B' 
+                THEN pchembl_value END) AS pchembl_value_max_B,
+            AVG(CASE WHEN assay_type = 'B' AND rank_type IN ((nof_type + 1) / 2, (nof_type + 2) / 2)
+                THEN pchembl_value END) AS pchembl_value_median_B,
+            MIN(CASE WHEN assay_type = 'B' 
+                THEN year END) AS first_publication_cpd_target_pair_B,
+            MIN(CASE WHEN assay_type = 'B' 
+                THEN year END) AS first_publication_cpd_target_pair_w_pchembl_B
+        FROM ranked_activities
+        GROUP BY parent_molregno, tid, mutation
+    )
+    SELECT agg.*,
+        md.chembl_id as parent_chemblid, md.pref_name as parent_pref_name,
+        md.max_phase, md.first_approval, md.usan_year, md.black_box_warning, 
+        md.prodrug, md.oral, md.parenteral, md.topical, 
+        td.chembl_id as target_chembl_id, td.pref_name as target_pref_name, td.target_type, td.organism
+    FROM aggregated_activities agg
+    INNER JOIN molecule_dictionary md
+        ON agg.parent_molregno = md.molregno
+    INNER JOIN target_dictionary td
+        ON agg.tid = td.tid
+    ORDER BY agg.first_activity_id
+    """
+
+    return sql
+
+
+def get_aggregated_compound_target_pairs_with_pchembl_sql(
     chembl_con: sqlite3.Connection,
     limit_to_literature: bool,
-) -> Dataset:
+) -> pd.DataFrame:
     """
-    Wrapper for get_aggregated_compound_target_pairs_with_pchembl,
-    initialising a dataset.
+    Get the same dataset as :func:`get_aggregated_compound_target_pairs_with_pchembl`
+    but aggregate the activities inside SQLite.
+    The aggregated pchembl values are equal up to floating-point rounding
+    since SQLite sums the values in a different order.
+
+    Mean, max and first publication are calculated with a GROUP BY
+    over the compound-target pairs (parent_molregno, tid, mutation).
+    The median is calculated with window functions by ranking the pchembl values
+    of a compound-target pair and averaging the middle value(s).
+    Values based on binding assays only (suffix '_B') are calculated in the same query
+    by restricting the aggregations to binding assays.
+    Only one row per compound-target pair is returned by the query.
+    The pairs are ordered by their first activity (activity_id),
+    i.e., in the order of their first appearance as in the in-memory version.
+
+    Note: Window functions require SQLite 3.25 or newer.
 
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
     :param limit_to_literature: Include only literature sources if True.
         Include all available sources otherwise.
     :type limit_to_literature: bool
+    :return: Pandas Dataframe with compound-target pairs
+        based on ChEMBL activity data aggregated into one entry per compound-target pair.
+    :rtype: pd.DataFrame
+    """
+    sql = get_aggregated_compound_target_pairs_with_pchembl_query(limit_to_literature)
+    df_combined = pd.read_sql_query(sql, con=chembl_con)
+    add_ct_pair_columns(df_combined, {})
+    # aggregated values are float64 as in get_average_info,
+    # SQLite returns integer years if no pair is without a year
+    aggregated_columns = [
+        aggregation.name
+        for aggregation in get_aggregations("BF", None, "with_pchembl")
+        + get_aggregations("B", "binding", "binding_w_pchembl")
+    ]
+    df_combined[aggregated_columns] = df_combined[aggregated_columns].astype("float64")
+
+    # same column order as get_aggregated_compound_target_pairs_with_pchembl
+    df_combined = df_combined[
+        [
+            "parent_molregno",
+            "tid_mutation",
+            "pchembl_value_mean_BF",
+            "pchembl_value_max_BF",
+            "pchembl_value_median_BF",
+            "first_publication_cpd_target_pair_BF",
+            "first_publication_cpd_target_pair_w_pchembl_BF",
+            "pchembl_value_mean_B",
+            "pchembl_value_max_B",
+            "pchembl_value_median_B",
+            "first_publication_cpd_target_pair_B",
+            "first_publication_cpd_target_pair_w_pchembl_B",
+            "parent_chemblid",
+            "parent_pref_name",
+            "max_phase",
+            "first_approval",
+            "usan_year",
+            "black_box_warning",
+            "prodrug",
+            "oral",
+            "parenteral",
+            "topical",
+            "tid",
+            "mutation",
+            "target_chembl_id",
+            "target_pref_name",
+            "target_type",
+            "organism",
+            "cpd_target_pair",
+            "cpd_target_pair_mutation",
+        ]
+    ]
+
+    return df_combined
+
+
+def get_aggregated_activity_ct_pairs(
+    chembl_con: sqlite3.Connection,
+    args: CalculationArgs,
+) -> Dataset:
+    """
+    Wrapper for get_aggregated_compound_target_pairs_with_pchembl
+    (or get_aggregated_compound_target_pairs_with_pchembl_streaming
+    if args.aggregation_mode is "streaming",
+    get_aggregated_compound_target_pairs_with_pchembl_sql
+    if args.aggregation_mode is "sql"),
+    initialising a dataset.
+    If args.check_aggregation is True, the aggregated values of the
+    streaming and sql modes are compared to the in-memory version.
+    This is opt-in since it reads all activities into memory at once.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
     :return: Dataset with a pandas Dataframe with compound-target pairs
         based on ChEMBL activity data aggregated into one entry per compound-target pair.
     :rtype: Dataset
     """
-    df_result = get_aggregated_compound_target_pairs_with_pchembl(
-        chembl_con, limit_to_literature
-    )
+    if args.aggregation_mode == "streaming":
+        df_result = get_aggregated_compound_target_pairs_with_pchembl_streaming(
+            chembl_con, args.limit_to_literature, args.chunk_size
+        )
+    elif args.aggregation_mode == "sql":
+        df_result = get_aggregated_compound_target_pairs_with_pchembl_sql(
+            chembl_con, args.limit_to_literature
+        )
+    else:
+        df_result = get_aggregated_compound_target_pairs_with_pchembl(
+            chembl_con, args.limit_to_literature
+        )
 
+    if args.check_aggregation and args.aggregation_mode != "pandas":
+        # compare the aggregated values to the in-memory version
+        sanity_checks.check_aggregated_pchembl_values(
+            df_result,
+            get_aggregated_compound_target_pairs_with_pchembl(
+                chembl_con, args.limit_to_literature
+            ),
+        )
+
+    df_result, df_compounds, df_targets = star_schema.split_dimensions(df_result)
     dataset = Dataset(
         df_result,
-        set(),
-        set(),
+        df_compounds,
+        df_targets,
+        np.array([], dtype="int64"),
+        np.array([], dtype="int64"),
+        pd.DataFrame(),
         pd.DataFrame(),
         pd.DataFrame(),
     )
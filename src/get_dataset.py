@@ -14,6 +14,7 @@ import get_drug_mechanism_ct_pairs
 import add_dti_annotations
 import add_rdkit_compound_descriptors
 import clean_dataset
+import dtype_policy
 import get_stats
 import output
 import sanity_checks
@@ -32,24 +33,28 @@ def get_ct_pair_dataset(
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
     """
+    sanity_checks.configure_checks(args.checks, args.checks_sample_size)
+
     logging.info("get_aggregated_activity_ct_pairs")
-    dataset = get_activity_ct_pairs.get_aggregated_activity_ct_pairs(
-        chembl_con, args.limit_to_literature
-    )
+    dataset = get_activity_ct_pairs.get_aggregated_activity_ct_pairs(chembl_con, args)
+    dtype_policy.apply_dtype_policy(dataset, "activity ct-pairs")
     get_stats.add_debugging_info(dataset, dataset.df_result, "activity ct-pairs")
 
     logging.info("add_cti_from_drug_mechanisms")
-    get_drug_mechanism_ct_pairs.add_drug_mechanism_ct_pairs(dataset, chembl_con)
+    get_drug_mechanism_ct_pairs.add_drug_mechanism_ct_pairs(dataset, chembl_con, args)
+    dtype_policy.apply_dtype_policy(dataset, "dm ct-pairs")
     get_stats.add_debugging_info(dataset, dataset.df_result, "dm ct-pairs")
 
     logging.info("add_cti_annotations")
     add_dti_annotations.add_dti_annotations(dataset)
+    dtype_policy.apply_dtype_policy(dataset, "DTI annotations")
     get_stats.add_debugging_info(dataset, dataset.df_result, "DTI annotations")
 
     logging.info("add_all_chembl_compound_properties")
     add_chembl_compound_properties.add_all_chembl_compound_properties(
         dataset, chembl_con, args.limit_to_literature
     )
+    dtype_policy.apply_dtype_policy(dataset, "ChEMBL props")
     get_stats.add_debugging_info(dataset, dataset.df_result, "ChEMBL props")
 
     logging.info("remove_compounds_without_smiles_and_mixtures")
@@ -63,6 +68,7 @@ def get_ct_pair_dataset(
         args,
         out,
     )
+    dtype_policy.apply_dtype_policy(dataset, "tclass annotations")
     get_stats.add_debugging_info(dataset, dataset.df_result, "tclass annotations")
 
     if args.calculate_rdkit:
@@ -6,13 +6,41 @@ in the drug_mechanism table.
 import logging
 import sqlite3
 
+import numpy as np
 import pandas as pd
 
+from arguments import CalculationArgs
 from dataset import Dataset
+import key_tables
+import pair_keys
 import sanity_checks
+import star_schema
+import target_relations
 
 
 ########### Extract Drug-Target Interactions From the drug_mechanism Table ###########
+def get_drug_mechanisms_interactions_query() -> str:
+    """
+    Get the SQL query for compound-target pairs in the drug_mechanism table
+    (see :func:`get_drug_mechanisms_interactions`).
+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = """
+    SELECT DISTINCT mh.parent_molregno, dm.tid
+    FROM drug_mechanism dm
+    INNER JOIN molecule_hierarchy mh
+        ON dm.molregno = mh.molregno
+    INNER JOIN molecule_dictionary md
+        ON mh.parent_molregno = md.molregno
+    WHERE dm.disease_efficacy = 1
+        and dm.tid is not null
+    """
+
+    return sql
+
+
 def get_drug_mechanisms_interactions(chembl_con: sqlite3.Connection) -> pd.DataFrame:
     """
     Extract the known compound-target interactions from the ChEMBL drug_mechanisms table.
@@ -33,115 +61,51 @@ def get_drug_mechanisms_interactions(chembl_con: sqlite3.Connection) -> pd.DataF
         from the drug_mechanism table with disease relevance.
     :rtype: pd.DataFrame
     """
-    sql = """
-    SELECT DISTINCT mh.parent_molregno, dm.tid
-    FROM drug_mechanism dm
-    INNER JOIN molecule_hierarchy mh
-        ON dm.molregno = mh.molregno
-    INNER JOIN molecule_dictionary md
-        ON mh.parent_molregno = md.molregno
-    WHERE dm.disease_efficacy = 1
-        and dm.tid is not null
-    """
-
+    sql = get_drug_mechanisms_interactions_query()
     df_dti = pd.read_sql_query(sql, con=chembl_con)
 
     return df_dti
 
 
-def get_relevant_tid_mappings(chembl_con: sqlite3.Connection) -> pd.DataFrame:
+def get_compound_info_query() -> str:
     """
-    Get DataFrame with mappings from target id to their related target ids
-    based on the target_relations table.
-    The following mappings are considered:
+    Get the SQL query for compound information from the molecule_dictionary
+    for the compounds in the key table key_tables.COMPOUND_KEYS
+    (see :func:`add_annotations_to_drug_mechanisms_cti`).
 
-    +-------------------------------+-----------------------+----------------+
-    |protein family                 | -[superset of]->      | single protein |
-    +-------------------------------+-----------------------+----------------+
-    |protein complex                | -[superset of]->      | single protein |
-    +-------------------------------+-----------------------+----------------+
-    |protein complex group          | -[superset of]->      | single protein |
-    +-------------------------------+-----------------------+----------------+
-    |single protein                 | -[equivalent to]->    | single protein |
-    +-------------------------------+-----------------------+----------------+
-    |chimeric protein               | -[superset of]->      | single protein |
-    +-------------------------------+-----------------------+----------------+
-    |protein-protein interaction    | -[superset of]->      | single protein |
-    +-------------------------------+-----------------------+----------------+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = f"""
+    SELECT md.molregno as parent_molregno, 
+        md.chembl_id as parent_chemblid, md.pref_name as parent_pref_name,
+        md.max_phase, md.first_approval, md.usan_year, md.black_box_warning, 
+        md.prodrug, md.oral, md.parenteral, md.topical
+    FROM {key_tables.COMPOUND_KEYS} ck
+    INNER JOIN molecule_dictionary md
+        ON md.molregno = ck.id
+    """
 
-    These mappings can be used to increase the number of target ids
-    for which there is data in the drug_mechanisms table.
-    For example, for *protein family -[superset of]-> single protein* this means:
-    If there is a known relevant interaction between a compound and a protein family,
-    interactions between the compound and single proteins of that protein family
-    are considered to be known interactions as well.
+    return sql
 
-    :param chembl_con: Sqlite3 connection to ChEMBL database.
-    :type chembl_con: sqlite3.Connection
-    :return: Pandas DataFrame with mappings from tid to related tid
-        for the defined subset of target relations.
-    :rtype: pd.DataFrame
+
+def get_target_info_query() -> str:
     """
-    sql = """
-    SELECT DISTINCT tr.tid, tr.relationship, tr.related_tid, 
-        td1.pref_name as pref_name_1, td1.target_type as target_type_1, td1.organism as organism_1, 
-        td2.pref_name as pref_name_2, td2.target_type as target_type_2, td2.organism as organism_2 
-    FROM target_relations tr
-    INNER JOIN target_dictionary td1
-        ON tr.tid = td1.tid
-    INNER JOIN target_dictionary td2
-        ON tr.related_tid = td2.tid
+    Get the SQL query for target information from the target_dictionary
+    for the targets in the key table key_tables.TARGET_KEYS
+    (see :func:`add_annotations_to_drug_mechanisms_cti`).
+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = f"""
+    SELECT td.tid, td.chembl_id as target_chembl_id, td.pref_name as target_pref_name, td.target_type, td.organism
+    FROM {key_tables.TARGET_KEYS} tk
+    INNER JOIN target_dictionary td
+        ON td.tid = tk.id
     """
-    df_related_targets = pd.read_sql_query(sql, con=chembl_con)
-
-    protein_family_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "PROTEIN FAMILY")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "SUPERSET OF")
-    ]
-
-    protein_complex_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "PROTEIN COMPLEX")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "SUPERSET OF")
-    ]
-
-    protein_complex_group_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "PROTEIN COMPLEX GROUP")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "SUPERSET OF")
-    ]
-
-    single_protein_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "SINGLE PROTEIN")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "EQUIVALENT TO")
-    ]
-
-    chimeric_protein_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "CHIMERIC PROTEIN")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "SUPERSET OF")
-    ]
-
-    ppi_mapping = df_related_targets[
-        (df_related_targets["target_type_1"] == "PROTEIN-PROTEIN INTERACTION")
-        & (df_related_targets["target_type_2"] == "SINGLE PROTEIN")
-        & (df_related_targets["relationship"] == "SUPERSET OF")
-    ]
-
-    relevant_tid_mappings = pd.concat(
-        [
-            protein_family_mapping,
-            protein_complex_mapping,
-            protein_complex_group_mapping,
-            single_protein_mapping,
-            chimeric_protein_mapping,
-            ppi_mapping,
-        ]
-    )
 
-    return relevant_tid_mappings
+    return sql
 
 
 def add_annotations_to_drug_mechanisms_cti(
@@ -162,44 +126,37 @@ def add_annotations_to_drug_mechanisms_cti(
     ##### Set columns existing in the df_results table. #####
     # None of the targets from the drug mechanism table have any mutation annotation,
     # hence tid_mutation = tid
-    cpd_target_pairs["tid_mutation"] = cpd_target_pairs["tid"].astype("str")
-
-    cpd_target_pairs["cpd_target_pair"] = [
-        f"{a}_{b}"
-        for a, b in zip(cpd_target_pairs["parent_molregno"], cpd_target_pairs["tid"])
-    ]
-    cpd_target_pairs["cpd_target_pair_mutation"] = [
-        f"{a}_{b}"
-        for a, b in zip(
-            cpd_target_pairs["parent_molregno"], cpd_target_pairs["tid_mutation"]
-        )
-    ]
+    cpd_target_pairs["tid_mutation"] = pair_keys.get_tid_mutation_keys(
+        cpd_target_pairs["tid"], 0
+    )
+    cpd_target_pairs["cpd_target_pair"] = pair_keys.get_cpd_target_pair_keys(
+        cpd_target_pairs["parent_molregno"], cpd_target_pairs["tid_mutation"]
+    )
+    cpd_target_pairs["cpd_target_pair_mutation"] = cpd_target_pairs["cpd_target_pair"]
 
     # New column: is the compound target pair in the drug_mechanism table?
     cpd_target_pairs["pair_mutation_in_dm_table"] = True
     cpd_target_pairs["pair_in_dm_table"] = True
 
     ##### Query and combine compound information with compound-target pairs #####
-    sql = """
-    SELECT md.molregno as parent_molregno, 
-        md.chembl_id as parent_chemblid, md.pref_name as parent_pref_name,
-        md.max_phase, md.first_approval, md.usan_year, md.black_box_warning, 
-        md.prodrug, md.oral, md.parenteral, md.topical
-    FROM molecule_dictionary md
-    """
-
-    df_compound_info = pd.read_sql_query(sql, con=chembl_con)
+    # only the compounds and targets of the pairs are looked up, see key_tables
+    df_compound_info = key_tables.read_keyed_query(
+        chembl_con,
+        get_compound_info_query(),
+        key_tables.COMPOUND_KEYS,
+        cpd_target_pairs["parent_molregno"],
+    )
     cpd_target_pairs = cpd_target_pairs.merge(
         df_compound_info, on="parent_molregno", how="left"
     )
 
     ##### Query and combine target information with compound-target pairs #####
-    sql = """
-    SELECT td.tid, td.chembl_id as target_chembl_id, td.pref_name as target_pref_name, td.target_type, td.organism
-    FROM target_dictionary td
-    """
-
-    df_target_info = pd.read_sql_query(sql, con=chembl_con)
+    df_target_info = key_tables.read_keyed_query(
+        chembl_con,
+        get_target_info_query(),
+        key_tables.TARGET_KEYS,
+        cpd_target_pairs["tid"],
+    )
     # Fix problems with null not being recognised as None
     df_target_info.loc[df_target_info["organism"].astype(str) == "null", "organism"] = (
         None
@@ -209,32 +166,68 @@ def add_annotations_to_drug_mechanisms_cti(
     return cpd_target_pairs
 
 
-def get_drug_mechanism_ct_pairs(chembl_con: sqlite3.Connection) -> pd.DataFrame:
+def get_drug_mechanism_ct_pairs(
+    chembl_con: sqlite3.Connection, args: CalculationArgs
+) -> pd.DataFrame:
     """
     Get compound-target pairs from the drug_mechanism table
     with all the columns that are present in the compound-target pairs based on activities.
-    Relevant mappings of target ids to related target ids are taken into account.
+    Relevant mappings of target ids to related target ids are taken into account
+    (see target_relations).
+
+    By default, the following mappings are considered:
+
+    +-------------------------------+-----------------------+----------------+
+    |protein family                 | -[superset of]->      | single protein |
+    +-------------------------------+-----------------------+----------------+
+    |protein complex                | -[superset of]->      | single protein |
+    +-------------------------------+-----------------------+----------------+
+    |protein complex group          | -[superset of]->      | single protein |
+    +-------------------------------+-----------------------+----------------+
+    |single protein                 | -[equivalent to]->    | single protein |
+    +-------------------------------+-----------------------+----------------+
+    |chimeric protein               | -[superset of]->      | single protein |
+    +-------------------------------+-----------------------+----------------+
+    |protein-protein interaction    | -[superset of]->      | single protein |
+    +-------------------------------+-----------------------+----------------+
+
+    These mappings can be used to increase the number of target ids
+    for which there is data in the drug_mechanisms table.
+    For example, for *protein family -[superset of]-> single protein* this means:
+    If there is a known relevant interaction between a compound and a protein family,
+    interactions between the compound and single proteins of that protein family
+    are considered to be known interactions as well.
 
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
     :return: Pandas DataFrame with compound-target interactions from the drug_mechanism table.
     :rtype: pd.DataFrame
     """
     # get known compound-target interactions (CTI) from the drug_mechanisms table
     df_dti = get_drug_mechanisms_interactions(chembl_con)
 
-    # Query target_relations for related target ids
+    # Use the graph of related targets
     # to increase the number of target ids for which there is data in the drug_mechanisms table.
-    relevant_tid_mappings = get_relevant_tid_mappings(chembl_con)
-    # table with mapped target ids
-    df_dti_mapped_targets = df_dti.merge(relevant_tid_mappings, on="tid", how="inner")
+    graph = target_relations.get_target_relation_graph(
+        chembl_con,
+        args.chembl_version,
+        args.target_relation_rules,
+        args.target_relation_hops,
+        args.target_relation_cache,
+    )
+    rows, related_tids = graph.get_related_tids(df_dti["tid"].to_numpy())
 
     # combine CTIs from drug_mechanism table with mapped CTIs
     cpd_target_pairs = pd.concat(
         [
             df_dti[["parent_molregno", "tid"]],
-            df_dti_mapped_targets[["parent_molregno", "related_tid"]].rename(
-                columns={"related_tid": "tid"}
+            pd.DataFrame(
+                {
+                    "parent_molregno": df_dti["parent_molregno"].to_numpy()[rows],
+                    "tid": related_tids,
+                }
             ),
         ]
     ).drop_duplicates()
@@ -292,7 +285,9 @@ def add_dm_filtering_columns(dataset: Dataset):
     ] = True
 
 
-def add_drug_mechanism_ct_pairs(dataset: Dataset, chembl_con: sqlite3.Connection):
+def add_drug_mechanism_ct_pairs(
+    dataset: Dataset, chembl_con: sqlite3.Connection, args: CalculationArgs
+):
     """
     Add compound-target pairs from the drug_mechanism table
     that are not in the dataset based on the initial ChEMBL query.
@@ -306,13 +301,13 @@ def add_drug_mechanism_ct_pairs(dataset: Dataset, chembl_con: sqlite3.Connection
     :type dataset: Dataset
     :param chembl_con: Sqlite3 connection to ChEMBL database.
     :type chembl_con: sqlite3.Connection
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
     """
-    cpd_target_pairs = get_drug_mechanism_ct_pairs(chembl_con)
-    dataset.drug_mechanism_pairs_set = set(
-        f"{a}_{b}"
-        for a, b in zip(cpd_target_pairs["parent_molregno"], cpd_target_pairs["tid"])
-    )
-    dataset.drug_mechanism_targets_set = set(cpd_target_pairs["tid"])
+    cpd_target_pairs = get_drug_mechanism_ct_pairs(chembl_con, args)
+    # sorted arrays of unique int64 keys, see pair_keys
+    dataset.drug_mechanism_pairs_set = np.unique(cpd_target_pairs["cpd_target_pair"])
+    dataset.drug_mechanism_targets_set = np.unique(cpd_target_pairs["tid"])
 
     ##### Limit the drug_mechanism pairs to the ones that are not yet in the dataset. #####
     # Mutation annotations are taken into account.
@@ -322,7 +317,7 @@ def add_drug_mechanism_ct_pairs(dataset: Dataset, chembl_con: sqlite3.Connection
     cpd_target_pairs = cpd_target_pairs[
         ~(
             cpd_target_pairs["cpd_target_pair_mutation"].isin(
-                set(dataset.df_result["cpd_target_pair_mutation"])
+                dataset.df_result["cpd_target_pair_mutation"].unique()
             )
         )
     ].copy()
@@ -333,7 +328,14 @@ def add_drug_mechanism_ct_pairs(dataset: Dataset, chembl_con: sqlite3.Connection
     )
 
     # Combined data of existing query with new compound-target pairs.
-    dataset.df_result = pd.concat([dataset.df_result, cpd_target_pairs])
+    # Compound and target attributes are added to the dimension tables.
+    cpd_target_pairs, df_compounds, df_targets = star_schema.split_dimensions(
+        cpd_target_pairs
+    )
+    dataset.df_result = pd.concat(
+        [dataset.df_result, cpd_target_pairs], ignore_index=True
+    )
+    star_schema.add_dimension_rows(dataset, df_compounds, df_targets)
 
     add_dm_filtering_columns(dataset)
 
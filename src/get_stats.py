@@ -6,6 +6,7 @@ import logging
 import pandas as pd
 
 from dataset import Dataset
+import star_schema
 
 
 ##### Logging Stats #####
@@ -135,6 +136,13 @@ def add_dataset_sizes(
     :param label: Description of pipeline step (e.g., initial query).
     :type label: str
     """
+    if "DTI" not in df.columns and "max_phase" not in df.columns:
+        # max_phase is part of the compound dimension table, see star_schema
+        df = df.assign(
+            max_phase=star_schema.get_dimension_values(
+                df, dataset.df_compounds, "parent_molregno", ["max_phase"]
+            )["max_phase"]
+        )
     df_stats = get_dataset_sizes(df, label)
 
     dataset.df_sizes_all = pd.concat([dataset.df_sizes_all, df_stats])
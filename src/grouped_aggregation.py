@@ -0,0 +1,346 @@
+"""
+Sort-based aggregation of DataFrame columns into one row per group.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    """
+    Specification of one aggregated column.
+
+    - name:         Name of the aggregated column in the output
+    - column:       Column of the input DataFrame that is aggregated
+    - statistic:    Name of the statistic, see STATISTICS
+    - where:        Optional name of a boolean column of the input DataFrame. \
+                    If set, only rows for which it is True are aggregated.
+    """
+
+    name: str
+    column: str
+    statistic: str
+    where: Optional[str] = None
+
+
+########### Segment Reductions ###########
+# All statistics get the values of a column sorted by group (values),
+# a boolean array with the values that should be taken into account (valid,
+# i.e., not null and not excluded by Aggregation.where),
+# and the start positions of the groups in the sorted arrays (starts).
+# Within a group, values are sorted in ascending order
+# if the statistic needs sorted values (see SORTED_STATISTICS).
+def _count(_values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.add.reduceat(valid.astype("int64"), starts)
+
+
+def _sum(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.add.reduceat(np.where(valid, values, 0.0), starts)
+
+
+def _mean(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    count = _count(values, valid, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, _sum(values, valid, starts) / count, np.nan)
+
+
+def _max(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    result = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+    return np.where(_count(values, valid, starts) > 0, result, np.nan)
+
+
+def _min(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    result = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+    return np.where(_count(values, valid, starts) > 0, result, np.nan)
+
+
+def _std(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # sample standard deviation (ddof=1) as in pandas
+    count = _count(values, valid, starts)
+    mean = _mean(values, valid, starts)
+    lengths = np.diff(np.append(starts, len(values)))
+    deviations = np.where(valid, values - np.repeat(mean, lengths), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(
+            count > 1,
+            np.sqrt(np.add.reduceat(deviations**2, starts) / (count - 1)),
+            np.nan,
+        )
+
+
+def _median(values: np.ndarray, valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # The k-th valid value of a group is at the first position
+    # where the cumulative number of valid values reaches
+    # (number of valid values before the group) + k.
+    count = _count(values, valid, starts)
+    cumulative_valid = np.cumsum(valid)
+    valid_before = cumulative_valid[starts] - valid[starts]
+    last = len(values) - 1
+    lower = np.minimum(
+        np.searchsorted(cumulative_valid, valid_before + (count - 1) // 2 + 1), last
+    )
+    upper = np.minimum(
+        np.searchsorted(cumulative_valid, valid_before + count // 2 + 1), last
+    )
+    return np.where(count > 0, (values[lower] + values[upper]) / 2, np.nan)
+
+
+STATISTICS: dict[str, Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]] = {
+    "count": _count,
+    "sum": _sum,
+    "mean": _mean,
+    "max": _max,
+    "min": _min,
+    "std": _std,
+    "median": _median,
+}
+SORTED_STATISTICS = {"median"}
+
+
+########### Aggregation ###########
+def get_sort_key(column: pd.Series) -> np.ndarray:
+    """
+    Get an array that can be used as a key for np.lexsort.
+    Numeric columns are used as they are, other columns are factorized.
+
+    :param column: Column of a DataFrame
+    :type column: pd.Series
+    :return: Numeric array with the same order of groups as the column
+    :rtype: np.ndarray
+    """
+    if pd.api.types.is_numeric_dtype(column) and not column.hasnans:
+        return column.to_numpy()
+    return pd.factorize(column)[0]
+
+
+def sort_groups(
+    df: pd.DataFrame, keys: list[str], value_column: Optional[str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sort the rows of df by the key columns (and by value_column within a group).
+
+    :param df: Pandas DataFrame that should be sorted
+    :type df: pd.DataFrame
+    :param keys: Columns to group by
+    :type keys: list[str]
+    :param value_column: Column to sort by within a group, not used if None
+    :type value_column: Optional[str]
+    :return: Indices that sort df and a boolean array
+        that is True for the first row of a group in the sorted order
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    key_arrays = [get_sort_key(df[key]) for key in keys]
+    # np.lexsort sorts by the last key first
+    sort_keys = key_arrays[::-1]
+    if value_column is not None:
+        sort_keys = [
+            df[value_column].to_numpy(dtype="float64", na_value=np.nan)
+        ] + sort_keys
+    order = np.lexsort(sort_keys)
+
+    is_start = np.zeros(len(df), dtype=bool)
+    is_start[:1] = True
+    for key_array in key_arrays:
+        sorted_key = key_array[order]
+        is_start[1:] |= sorted_key[1:] != sorted_key[:-1]
+
+    return order, is_start
+
+
+def aggregate_column(
+    df: pd.DataFrame,
+    aggregation: Aggregation,
+    order: np.ndarray,
+    is_start: np.ndarray,
+    values_sorted: bool,
+) -> np.ndarray:
+    """
+    Calculate one aggregation for all groups.
+
+    :param df: Pandas DataFrame with the columns that should be aggregated
+    :type df: pd.DataFrame
+    :param aggregation: Specification of the aggregated column
+    :type aggregation: Aggregation
+    :param order: Indices that sort df by group, see sort_groups
+    :type order: np.ndarray
+    :param is_start: True for the first row of a group in the sorted order, see sort_groups
+    :type is_start: np.ndarray
+    :param values_sorted: True if the values of the aggregated column
+        are already sorted within their groups in order
+    :type values_sorted: bool
+    :return: Aggregated values in the sorted order of the groups
+    :rtype: np.ndarray
+    """
+    if len(df) == 0:
+        return np.array([], dtype="float64")
+
+    values = df[aggregation.column].to_numpy(dtype="float64", na_value=np.nan)
+    if aggregation.statistic in SORTED_STATISTICS and not values_sorted:
+        # sort the values within their groups
+        order = order[np.lexsort((values[order], np.cumsum(is_start)))]
+    values = values[order]
+    valid = ~np.isnan(values)
+    if aggregation.where is not None:
+        valid &= df[aggregation.where].to_numpy(dtype=bool)[order]
+    return STATISTICS[aggregation.statistic](values, valid, np.flatnonzero(is_start))
+
+
+def aggregate(
+    df: pd.DataFrame,
+    keys: list[str],
+    aggregations: list[Aggregation],
+    first_columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """
+    Aggregate df into one row per unique combination of the key columns.
+
+    The rows are sorted once by the keys with np.lexsort.
+    All aggregations are then calculated as reductions over the segments of
+    the sorted arrays (e.g., np.add.reduceat).
+    If statistics need sorted values (e.g., the median),
+    the values of the first such column are included as the last sort key
+    so that they do not need an additional sort.
+    Therefore, adding more aggregations to the list does not require
+    additional passes over the keys.
+
+    Null values are ignored. Aggregations for groups
+    without any valid values are null (with the exception of count which is 0).
+    Values are aggregated as float64.
+    Groups are returned in the order of their first appearance in df.
+
+    :param df: Pandas DataFrame with the columns that should be aggregated
+    :type df: pd.DataFrame
+    :param keys: Columns to group by
+    :type keys: list[str]
+    :param aggregations: Specifications of the aggregated columns
+    :type aggregations: list[Aggregation]
+    :param first_columns: Columns that are constant within a group.
+        They are taken as they are from the first row of each group
+        (keeping their data type), defaults to None
+    :type first_columns: Optional[list[str]], optional
+    :raises ValueError: If an aggregation uses an unknown statistic
+    :return: Pandas DataFrame with the key columns, one column per aggregation
+        and the first_columns
+    :rtype: pd.DataFrame
+    """
+    for aggregation in aggregations:
+        if aggregation.statistic not in STATISTICS:
+            raise ValueError(
+                f"Unknown statistic {aggregation.statistic} for {aggregation.name}. "
+                f"Options: {', '.join(STATISTICS)}"
+            )
+
+    sorted_columns = [
+        aggregation.column
+        for aggregation in aggregations
+        if aggregation.statistic in SORTED_STATISTICS
+    ]
+    order, is_start = sort_groups(
+        df, keys, sorted_columns[0] if sorted_columns else None
+    )
+    starts = np.flatnonzero(is_start)
+
+    # groups in order of first appearance
+    if len(df) > 0:
+        group_order = np.argsort(np.minimum.reduceat(order, starts), kind="stable")
+    else:
+        group_order = np.array([], dtype="int64")
+    first_rows = order[starts][group_order]
+    df_aggregated = df[keys].iloc[first_rows].reset_index(drop=True)
+
+    for aggregation in aggregations:
+        df_aggregated[aggregation.name] = aggregate_column(
+            df,
+            aggregation,
+            order,
+            is_start,
+            values_sorted=bool(sorted_columns)
+            and aggregation.column == sorted_columns[0],
+        )[group_order]
+
+    if first_columns:
+        df_aggregated = pd.concat(
+            [df_aggregated, df[first_columns].iloc[first_rows].reset_index(drop=True)],
+            axis=1,
+        )
+
+    return df_aggregated
+
+
+########### Label Aggregation ###########
+@dataclass(frozen=True)
+class LabelAggregation:
+    """
+    Specification of a column with joined labels.
+
+    - name:                   Name of the column with the joined labels in the output
+    - column:                 Column of the input DataFrame with the labels
+    - separator:              Separator between labels (e.g., '|')
+    - exclude_from_multiple:  Labels that are discarded if a key has other labels as well \
+                                (e.g., 'Unclassified protein')
+    """
+
+    name: str
+    column: str
+    separator: str
+    exclude_from_multiple: frozenset[str] = frozenset()
+
+
+def join_labels(
+    df: pd.DataFrame, key: str, label_aggregation: LabelAggregation
+) -> pd.DataFrame:
+    """
+    Combine all labels of a key into one string,
+    i.e., the unique labels of a key are sorted alphabetically
+    and joined with the separator.
+    Null labels are ignored.
+
+    The rows are sorted once by key and label and the labels of a group
+    are concatenated with one segment reduction over the sorted labels
+    (np.add.reduceat), i.e., no Python function is called per group.
+
+    :param df: Pandas DataFrame with one row per label of a key
+    :type df: pd.DataFrame
+    :param key: Column to group by (e.g., tid)
+    :type key: str
+    :param label_aggregation: Specification of the joined labels
+    :type label_aggregation: LabelAggregation
+    :return: Pandas DataFrame with one row per key (sorted by key)
+        and the joined labels
+    :rtype: pd.DataFrame
+    """
+    label = label_aggregation.column
+    df_labels = (
+        df[[key, label]]
+        .dropna()
+        .drop_duplicates()
+        .sort_values([key, label], kind="stable")
+    )
+    keys = df_labels[key].to_numpy()
+    labels = df_labels[label].to_numpy(dtype=object)
+
+    if label_aggregation.exclude_from_multiple:
+        is_start = np.ones(len(keys), dtype=bool)
+        is_start[1:] = keys[1:] != keys[:-1]
+        lengths = np.diff(np.append(np.flatnonzero(is_start), len(keys)))
+        keep = ~(
+            np.isin(labels, list(label_aggregation.exclude_from_multiple))
+            & (np.repeat(lengths, lengths) > 1)
+        )
+        keys, labels = keys[keep], labels[keep]
+
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(is_start)
+    if len(keys) == 0:
+        joined = np.array([], dtype=object)
+    else:
+        joined = np.add.reduceat(
+            np.where(is_start, labels, label_aggregation.separator + labels), starts
+        )
+
+    return pd.DataFrame({key: keys[starts], label_aggregation.name: joined})
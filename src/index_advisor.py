@@ -0,0 +1,593 @@
+"""
+Build indexes for the pipeline queries on a working copy of ChEMBL.
+
+The stock ChEMBL SQLite indexes do not serve some of the filters and joins
+used by the pipeline queries (e.g., pchembl_value is not null,
+potential_duplicate = 0 or docs.src_id = 1).
+The index advisor runs EXPLAIN QUERY PLAN on every pipeline query,
+builds the missing covering or partial indexes on a local working copy of ChEMBL
+(never on the original database) and reports the query times
+before and after adding the indexes.
+"""
+
+from dataclasses import dataclass
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Optional
+
+import pandas as pd
+
+import add_chembl_compound_properties
+import add_chembl_target_class_annotations
+from arguments import CalculationArgs
+import clean_dataset
+import get_activity_ct_pairs
+import get_drug_mechanism_ct_pairs
+import key_tables
+import target_relations
+
+# table in the working copy with the source the copy was made from
+WORKING_COPY_SOURCE_TABLE = "ctpd_working_copy_source"
+
+
+@dataclass(frozen=True)
+class IndexCandidate:
+    """
+    Index that can be built to serve the pipeline queries.
+
+    - name:       Name of the index
+    - table:      Table the index is built on
+    - columns:    Indexed columns, including the columns needed to cover the queries
+    - where:      Optional condition for a partial index
+    """
+
+    name: str
+    table: str
+    columns: tuple[str, ...]
+    where: Optional[str] = None
+
+    def get_sql(self) -> str:
+        """
+        Get the SQL statement that creates the index.
+
+        :return: CREATE INDEX statement
+        :rtype: str
+        """
+        sql = (
+            f"CREATE INDEX IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({', '.join(self.columns)})"
+        )
+        if self.where is not None:
+            sql += f" WHERE {self.where}"
+        return sql
+
+
+INDEX_CANDIDATES = [
+    # activities with a valid pchembl value
+    # (see get_activity_ct_pairs.get_compound_target_pairs_with_pchembl_query)
+    IndexCandidate(
+        "ctpd_activities_pchembl",
+        "activities",
+        ("assay_id", "molregno", "doc_id", "pchembl_value"),
+        "pchembl_value IS NOT NULL AND potential_duplicate = 0 "
+        "AND standard_relation = '=' AND data_validity_comment IS NULL",
+    ),
+    IndexCandidate("ctpd_docs_src", "docs", ("doc_id", "src_id", "year")),
+    IndexCandidate(
+        "ctpd_assays_target", "assays", ("assay_id", "assay_type", "tid", "variant_id")
+    ),
+    IndexCandidate(
+        "ctpd_compound_records_molregno", "compound_records", ("molregno", "doc_id")
+    ),
+    IndexCandidate(
+        "ctpd_molecule_hierarchy_salt",
+        "molecule_hierarchy",
+        ("molregno", "parent_molregno"),
+    ),
+    IndexCandidate(
+        "ctpd_molecule_hierarchy_parent",
+        "molecule_hierarchy",
+        ("parent_molregno", "molregno"),
+    ),
+    IndexCandidate(
+        "ctpd_molecule_atc_molregno",
+        "molecule_atc_classification",
+        ("molregno", "level5"),
+    ),
+    IndexCandidate(
+        "ctpd_drug_mechanism_efficacy",
+        "drug_mechanism",
+        ("molregno", "tid"),
+        "disease_efficacy = 1 AND tid IS NOT NULL",
+    ),
+    IndexCandidate(
+        "ctpd_target_relations",
+        "target_relations",
+        ("tid", "relationship", "related_tid"),
+    ),
+    IndexCandidate(
+        "ctpd_component_class",
+        "component_class",
+        ("protein_class_id", "component_id"),
+    ),
+    IndexCandidate(
+        "ctpd_target_components",
+        "target_components",
+        ("component_id", "tid"),
+    ),
+    IndexCandidate(
+        "ctpd_protein_classification_parent",
+        "protein_classification",
+        ("parent_id", "protein_class_id", "class_level", "pref_name"),
+    ),
+]
+
+
+########### Pipeline Queries ###########
+def get_pipeline_queries(args: CalculationArgs) -> dict[str, str]:
+    """
+    Get the SQL queries that are run when calculating the dataset.
+
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
+    :return: Dictionary from the name of the query to the SQL query
+    :rtype: dict[str, str]
+    """
+    if args.aggregation_mode == "sql":
+        get_activities_query = (
+            get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl_query
+        )
+    else:
+        get_activities_query = (
+            get_activity_ct_pairs.get_compound_target_pairs_with_pchembl_query
+        )
+    return {
+        "activities": get_activities_query(args.limit_to_literature),
+        "drug_mechanisms": get_drug_mechanism_ct_pairs.get_drug_mechanisms_interactions_query(),
+        "target_relations": target_relations.get_target_relations_query(),
+        "compound_info": get_drug_mechanism_ct_pairs.get_compound_info_query(),
+        "target_info": get_drug_mechanism_ct_pairs.get_target_info_query(),
+        "first_publication_cpd": (
+            add_chembl_compound_properties.get_first_publication_cpd_date_query(
+                args.limit_to_literature
+            )
+        ),
+        "compound_properties": (
+            add_chembl_compound_properties.get_chembl_properties_and_structures_query()
+        ),
+        "atc_classification": add_chembl_compound_properties.get_atc_classification_query(),
+        "mixture_validation": clean_dataset.get_mixture_validation_query(),
+        "target_classes": add_chembl_target_class_annotations.get_target_classes_query(),
+        "target_class_hierarchy": (
+            add_chembl_target_class_annotations.get_target_class_hierarchy_query()
+        ),
+    }
+
+
+########### Representative Keys ###########
+def get_representative_compounds_query() -> str:
+    """
+    Get the SQL query for the compounds the keyed queries are run for,
+    i.e., the parent compounds of activities with a pchembl value
+    and of drug mechanisms.
+
+    :return: SQL query
+    :rtype: str
+    """
+    return """
+    SELECT mh.parent_molregno AS id
+    FROM activities act
+    INNER JOIN molecule_hierarchy mh
+        ON act.molregno = mh.molregno
+    WHERE act.pchembl_value IS NOT NULL
+    UNION
+    SELECT mh.parent_molregno AS id
+    FROM drug_mechanism dm
+    INNER JOIN molecule_hierarchy mh
+        ON dm.molregno = mh.molregno
+    """
+
+
+def get_representative_targets_query() -> str:
+    """
+    Get the SQL query for the targets the keyed queries are run for,
+    i.e., the targets of activities with a pchembl value
+    and of drug mechanisms.
+
+    :return: SQL query
+    :rtype: str
+    """
+    return """
+    SELECT ass.tid AS id
+    FROM activities act
+    INNER JOIN assays ass
+        ON act.assay_id = ass.assay_id
+    WHERE act.pchembl_value IS NOT NULL
+    UNION
+    SELECT dm.tid AS id
+    FROM drug_mechanism dm
+    WHERE dm.tid IS NOT NULL
+    """
+
+
+def stage_representative_keys(chembl_con: sqlite3.Connection):
+    """
+    Fill the key tables (see key_tables) with representative compounds and targets
+    so that the query plans and times of the keyed queries
+    reflect a run of the pipeline rather than empty key tables.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    """
+    for table, sql in [
+        (key_tables.COMPOUND_KEYS, get_representative_compounds_query()),
+        (key_tables.TARGET_KEYS, get_representative_targets_query()),
+    ]:
+        keys = pd.read_sql_query(sql, con=chembl_con)["id"]
+        logging.debug("Staging %d representative keys in %s", len(keys), table)
+        key_tables.stage_keys(chembl_con, table, keys)
+
+
+def clear_keys(chembl_con: sqlite3.Connection):
+    """
+    Empty the key tables (see key_tables).
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    """
+    for table in key_tables.KEY_TABLES:
+        key_tables.stage_keys(chembl_con, table, [])
+
+
+########### Query Plans ###########
+def get_query_plan(chembl_con: sqlite3.Connection, sql: str) -> list[str]:
+    """
+    Get the steps of the query plan of sql.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param sql: SQL query
+    :type sql: str
+    :return: List with the detail column of EXPLAIN QUERY PLAN
+    :rtype: list[str]
+    """
+    return [row[-1] for row in chembl_con.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def get_table_aliases(sql: str) -> dict[str, str]:
+    """
+    Get the tables used in the FROM and JOIN clauses of sql by their alias.
+    Tables without an alias are included with their name as alias.
+
+    :param sql: SQL query
+    :type sql: str
+    :return: Dictionary from alias to table name
+    :rtype: dict[str, str]
+    """
+    aliases = {}
+    keywords = {
+        "on",
+        "where",
+        "inner",
+        "left",
+        "join",
+        "group",
+        "order",
+        "window",
+        "union",
+    }
+    for table, alias in re.findall(
+        r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, flags=re.IGNORECASE
+    ):
+        if not alias or alias.lower() in keywords:
+            alias = table
+        aliases[alias] = table
+    return aliases
+
+
+def get_unserved_tables(plan: list[str], aliases: dict[str, str]) -> set[str]:
+    """
+    Get the tables that are not served well by the existing indexes, i.e.,
+    tables that are scanned completely, searched with an index
+    that does not cover the query (additional lookups in the table)
+    or searched with an automatic index that SQLite builds for the query.
+
+    :param plan: Steps of the query plan, see get_query_plan
+    :type plan: list[str]
+    :param aliases: Dictionary from alias to table name, see get_table_aliases
+    :type aliases: dict[str, str]
+    :return: Set of table names
+    :rtype: set[str]
+    """
+    tables = set()
+    for step in plan:
+        match = re.match(
+            r"(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(?: USING (.*))?", step
+        )
+        if match is None:
+            continue
+        _, name, alias, access = match.groups()
+        table = aliases.get(alias or name, name)
+        if (
+            access is None
+            or access.startswith("INDEX")
+            or access.startswith("AUTOMATIC")
+        ):
+            tables.add(table)
+    return tables
+
+
+def get_missing_indexes(
+    chembl_con: sqlite3.Connection, queries: dict[str, str]
+) -> list[IndexCandidate]:
+    """
+    Get the index candidates for tables that are not served well
+    by the existing indexes in at least one of the queries.
+    Candidates that already exist are not included.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param queries: Dictionary from the name of the query to the SQL query
+    :type queries: dict[str, str]
+    :return: List of index candidates that should be built
+    :rtype: list[IndexCandidate]
+    """
+    existing_tables = {
+        row[0].lower()
+        for row in chembl_con.execute("SELECT name FROM sqlite_master")
+        if row[0] is not None
+    }
+    unserved_tables = set()
+    for name, sql in queries.items():
+        tables = get_unserved_tables(
+            get_query_plan(chembl_con, sql), get_table_aliases(sql)
+        )
+        logging.debug("Tables not served by indexes in %s: %s", name, tables)
+        unserved_tables |= tables
+
+    return [
+        candidate
+        for candidate in INDEX_CANDIDATES
+        if candidate.table in unserved_tables
+        and candidate.name.lower() not in existing_tables
+    ]
+
+
+########### Working Copy ###########
+def get_database_path(chembl_con: sqlite3.Connection) -> str:
+    """
+    Get the path of the main database of the connection.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :return: Path to the database file (empty for in-memory databases)
+    :rtype: str
+    """
+    for _, name, path in chembl_con.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return ""
+
+
+def get_source_info(
+    chembl_con: sqlite3.Connection, chembl_version: str
+) -> dict[str, str]:
+    """
+    Get the information that identifies the original ChEMBL database,
+    i.e., the ChEMBL version and the path, size and modification time
+    of the database file.
+
+    :param chembl_con: Sqlite3 connection to the original ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param chembl_version: Version of ChEMBL
+    :type chembl_version: str
+    :return: Dictionary from the name of the information to its value
+    :rtype: dict[str, str]
+    """
+    source_info = {"chembl_version": str(chembl_version)}
+    original_path = get_database_path(chembl_con)
+    if original_path:
+        stat = os.stat(original_path)
+        source_info["path"] = os.path.abspath(original_path)
+        source_info["size"] = str(stat.st_size)
+        source_info["mtime_ns"] = str(stat.st_mtime_ns)
+    return source_info
+
+
+def write_source_info(working_con: sqlite3.Connection, source_info: dict[str, str]):
+    """
+    Record the source of the working copy in WORKING_COPY_SOURCE_TABLE.
+
+    :param working_con: Sqlite3 connection to the working copy
+    :type working_con: sqlite3.Connection
+    :param source_info: Information about the original ChEMBL database,
+        see get_source_info
+    :type source_info: dict[str, str]
+    """
+    # the original database may itself be a working copy
+    working_con.execute(f"DROP TABLE IF EXISTS {WORKING_COPY_SOURCE_TABLE}")
+    working_con.execute(
+        f"CREATE TABLE {WORKING_COPY_SOURCE_TABLE} (name TEXT PRIMARY KEY, value TEXT)"
+    )
+    working_con.executemany(
+        f"INSERT INTO {WORKING_COPY_SOURCE_TABLE} (name, value) VALUES (?, ?)",
+        source_info.items(),
+    )
+    working_con.commit()
+
+
+def read_source_info(working_con: sqlite3.Connection) -> Optional[dict[str, str]]:
+    """
+    Read the source of the working copy from WORKING_COPY_SOURCE_TABLE.
+
+    :param working_con: Sqlite3 connection to the working copy
+    :type working_con: sqlite3.Connection
+    :return: Information about the original ChEMBL database (see get_source_info),
+        None if the source was not recorded
+    :rtype: Optional[dict[str, str]]
+    """
+    if (
+        working_con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (WORKING_COPY_SOURCE_TABLE,),
+        ).fetchone()
+        is None
+    ):
+        return None
+    return dict(
+        working_con.execute(f"SELECT name, value FROM {WORKING_COPY_SOURCE_TABLE}")
+    )
+
+
+def get_working_copy(
+    chembl_con: sqlite3.Connection, working_copy_path: str, chembl_version: str
+) -> sqlite3.Connection:
+    """
+    Connect to the working copy of ChEMBL.
+    If it does not exist yet, ChEMBL is copied to working_copy_path first
+    and the source of the copy is recorded (see get_source_info).
+    An existing working copy is only reused if it was copied from the same
+    ChEMBL database (same version, path, size and modification time),
+    otherwise it is copied again.
+
+    :param chembl_con: Sqlite3 connection to the original ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param working_copy_path: Path to the working copy
+    :type working_copy_path: str
+    :param chembl_version: Version of ChEMBL
+    :type chembl_version: str
+    :raises ValueError: If working_copy_path is the original database
+        or an existing file that is not a working copy
+    :return: Sqlite3 connection to the working copy
+    :rtype: sqlite3.Connection
+    """
+    original_path = get_database_path(chembl_con)
+    if (
+        original_path
+        and os.path.exists(working_copy_path)
+        and os.path.samefile(original_path, working_copy_path)
+    ):
+        raise ValueError(
+            f"The working copy ({working_copy_path}) has to be different "
+            f"from the original ChEMBL database ({original_path})."
+        )
+
+    source_info = get_source_info(chembl_con, chembl_version)
+    if os.path.exists(working_copy_path):
+        working_con = sqlite3.connect(working_copy_path)
+        copy_source_info = read_source_info(working_con)
+        if copy_source_info == source_info:
+            logging.info("Using existing working copy of ChEMBL: %s", working_copy_path)
+            return working_con
+        working_con.close()
+        if copy_source_info is None:
+            raise ValueError(
+                f"{working_copy_path} exists but is not a working copy of ChEMBL "
+                f"(no {WORKING_COPY_SOURCE_TABLE} table). "
+                "Please remove it or choose a different path."
+            )
+        logging.warning(
+            "Working copy %s was copied from a different ChEMBL database (%s), "
+            "copying ChEMBL again.",
+            working_copy_path,
+            copy_source_info,
+        )
+        os.remove(working_copy_path)
+
+    logging.info("Copying ChEMBL to %s", working_copy_path)
+    working_con = sqlite3.connect(working_copy_path)
+    chembl_con.backup(working_con)
+    write_source_info(working_con, source_info)
+    return working_con
+
+
+def time_query(chembl_con: sqlite3.Connection, sql: str) -> float:
+    """
+    Run the query and return the time it took to fetch all rows.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param sql: SQL query
+    :type sql: str
+    :return: Time in seconds
+    :rtype: float
+    """
+    start = time.perf_counter()
+    for _ in chembl_con.execute(sql):
+        pass
+    return time.perf_counter() - start
+
+
+def prepare_working_copy(
+    chembl_con: sqlite3.Connection, working_copy_path: str, args: CalculationArgs
+) -> tuple[sqlite3.Connection, pd.DataFrame]:
+    """
+    Get a working copy of ChEMBL with the indexes
+    that are missing for the pipeline queries.
+    The queries that join the key tables (see key_tables) are planned and timed
+    with representative compounds and targets (see stage_representative_keys),
+    the key tables are empty again afterwards.
+
+    :param chembl_con: Sqlite3 connection to the original ChEMBL database.
+        The original database is not modified.
+    :type chembl_con: sqlite3.Connection
+    :param working_copy_path: Path to the working copy
+    :type working_copy_path: str
+    :param args: Arguments related to how to calculate the dataset
+    :type args: CalculationArgs
+    :return: Sqlite3 connection to the working copy and
+        Pandas DataFrame with the query times before and after adding the indexes
+    :rtype: tuple[sqlite3.Connection, pd.DataFrame]
+    """
+    working_con = get_working_copy(chembl_con, working_copy_path, args.chembl_version)
+    # key tables used by keyed queries, see key_tables
+    stage_representative_keys(working_con)
+    queries = get_pipeline_queries(args)
+
+    seconds_before = {
+        name: time_query(working_con, sql) for name, sql in queries.items()
+    }
+
+    missing_indexes = get_missing_indexes(working_con, queries)
+    for candidate in missing_indexes:
+        logging.info("Creating index: %s", candidate.get_sql())
+        working_con.execute(candidate.get_sql())
+    if missing_indexes:
+        # update the statistics used by the query planner
+        working_con.execute("ANALYZE")
+    working_con.commit()
+
+    index_names = {candidate.name for candidate in missing_indexes}
+    report = []
+    for name, sql in queries.items():
+        used_indexes = sorted(
+            index_name
+            for index_name in index_names
+            if any(index_name in step for step in get_query_plan(working_con, sql))
+        )
+        report.append(
+            [
+                name,
+                seconds_before[name],
+                time_query(working_con, sql),
+                "|".join(used_indexes),
+            ]
+        )
+    clear_keys(working_con)
+    df_report = pd.DataFrame(
+        report,
+        columns=["query", "seconds_before", "seconds_after", "new_indexes_used"],
+    )
+    for _, row in df_report.iterrows():
+        logging.info(
+            "Query %s: %.3f s before, %.3f s after adding indexes (used: %s)",
+            row["query"],
+            row["seconds_before"],
+            row["seconds_after"],
+            row["new_indexes_used"] or "-",
+        )
+
+    return working_con, df_report
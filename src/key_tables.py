@@ -0,0 +1,78 @@
+"""
+Temporary key tables for keyed lookups in ChEMBL.
+
+Instead of reading a whole ChEMBL table and filtering it in pandas,
+the keys that are needed (e.g., the compound ids of a DataFrame)
+are staged in a TEMP table and joined inside SQLite,
+i.e., only the matching rows are read.
+TEMP tables only exist for the current connection
+and do not modify the ChEMBL database.
+"""
+
+import sqlite3
+from typing import Iterable
+
+import pandas as pd
+
+# names of the key tables, used in the SQL queries
+COMPOUND_KEYS = "ctpd_compound_keys"
+TARGET_KEYS = "ctpd_target_keys"
+KEY_TABLES = [COMPOUND_KEYS, TARGET_KEYS]
+
+
+def create_key_tables(chembl_con: sqlite3.Connection):
+    """
+    Create all (empty) key tables, e.g., to get the query plans of keyed queries.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    """
+    for table in KEY_TABLES:
+        chembl_con.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)"
+        )
+
+
+def stage_keys(chembl_con: sqlite3.Connection, table: str, keys: Iterable[int]):
+    """
+    Replace the content of the key table with the unique keys.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param table: Name of the key table, one of KEY_TABLES
+    :type table: str
+    :param keys: Integer keys, e.g., compound or target ids
+    :type keys: Iterable[int]
+    """
+    assert table in KEY_TABLES, f"Unknown key table {table}"
+    create_key_tables(chembl_con)
+    chembl_con.execute(f"DELETE FROM {table}")
+    chembl_con.executemany(
+        f"INSERT INTO {table} (id) VALUES (?)",
+        [(key,) for key in pd.unique(pd.Series(keys, dtype="int64")).tolist()],
+    )
+    # only the TEMP table is changed
+    chembl_con.commit()
+
+
+def read_keyed_query(
+    chembl_con: sqlite3.Connection, sql: str, table: str, keys: Iterable[int]
+) -> pd.DataFrame:
+    """
+    Stage the keys in the key table and read the query that joins it.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param sql: SQL query that joins the key table
+    :type sql: str
+    :param table: Name of the key table, one of KEY_TABLES
+    :type table: str
+    :param keys: Integer keys, e.g., compound or target ids
+    :type keys: Iterable[int]
+    :return: Pandas DataFrame with the result of the query
+    :rtype: pd.DataFrame
+    """
+    stage_keys(chembl_con, table, keys)
+    df = pd.read_sql_query(sql, con=chembl_con)
+    stage_keys(chembl_con, table, [])
+    return df
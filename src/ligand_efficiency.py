@@ -0,0 +1,147 @@
+"""
+Registry of ligand efficiency metrics.
+
+A metric combines an aggregated pchembl value of a compound-target pair
+(e.g., pchembl_value_mean_BF) with a property of the compound (e.g., heavy_atoms).
+Every registered metric is calculated for every assay type suffix (BF and B)
+and written to the column <name>_<suffix>.
+Additional metrics (e.g., based on the median pchembl value)
+can be added with register_metric.
+"""
+
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+# assay type suffixes of the aggregated pchembl values
+SUFFIXES = ["BF", "B"]
+
+
+@dataclass(frozen=True)
+class LEMetric:
+    """
+    Specification of a ligand efficiency metric.
+
+    - name:               Name of the metric, used as column prefix (<name>_<suffix>)
+    - property_column:    Compound property used in the formula
+    - formula:            Function from the pchembl values and the compound property \
+                            to the metric
+    - pchembl_statistic:  Aggregated pchembl value used in the formula \
+                            (pchembl_value_<statistic>_<suffix>)
+    - zero_is_null:       True if the metric is null for a compound property of 0 \
+                            (e.g., if the formula divides by the property)
+    """
+
+    name: str
+    property_column: str
+    formula: Callable[[np.ndarray, np.ndarray], np.ndarray]
+    pchembl_statistic: str = "mean"
+    zero_is_null: bool = True
+
+
+METRICS: dict[str, LEMetric] = {}
+
+
+def register_metric(metric: LEMetric):
+    """
+    Add a metric to the registry.
+
+    :param metric: Ligand efficiency metric
+    :type metric: LEMetric
+    :raises ValueError: If a metric with the same name is already registered
+    """
+    if metric.name in METRICS:
+        raise ValueError(f"A metric with the name {metric.name} is already registered.")
+    METRICS[metric.name] = metric
+
+
+########### Default Metrics ###########
+register_metric(
+    LEMetric(
+        "LE",
+        "heavy_atoms",
+        lambda pchembl, heavy_atoms: pchembl / heavy_atoms * (2.303 * 298 * 0.00199),
+    )
+)
+register_metric(LEMetric("BEI", "mw_freebase", lambda pchembl, mw: pchembl * 1000 / mw))
+register_metric(LEMetric("SEI", "psa", lambda pchembl, psa: pchembl * 100 / psa))
+register_metric(
+    LEMetric("LLE", "alogp", lambda pchembl, alogp: pchembl - alogp, zero_is_null=False)
+)
+
+
+########### Calculation ###########
+def get_metric_columns(suffix: str) -> list[str]:
+    """
+    Get the names of the metric columns for an assay type suffix.
+
+    :param suffix: Assay type suffix, see SUFFIXES
+    :type suffix: str
+    :return: List of column names in the order of registration
+    :rtype: list[str]
+    """
+    return [f"{name}_{suffix}" for name in METRICS]
+
+
+def get_property_columns() -> list[str]:
+    """
+    Get the compound properties used by the registered metrics.
+
+    :return: List of compound property columns
+    :rtype: list[str]
+    """
+    return list(dict.fromkeys(metric.property_column for metric in METRICS.values()))
+
+
+def get_pchembl_column(metric: LEMetric, suffix: str) -> str:
+    """
+    Get the name of the aggregated pchembl column used by the metric.
+
+    :param metric: Ligand efficiency metric
+    :type metric: LEMetric
+    :param suffix: Assay type suffix, see SUFFIXES
+    :type suffix: str
+    :return: Column name
+    :rtype: str
+    """
+    return f"pchembl_value_{metric.pchembl_statistic}_{suffix}"
+
+
+def calculate_metrics(
+    df_result: pd.DataFrame, df_props: pd.DataFrame
+) -> dict[str, np.ndarray]:
+    """
+    Calculate all registered metrics for all suffixes.
+    Every input column is converted to a float64 array once.
+    Metrics with zero_is_null are null if the compound property is 0.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+        and aggregated pchembl values
+    :type df_result: pd.DataFrame
+    :param df_props: Compound properties, aligned with df_result
+        (see star_schema.get_compound_values)
+    :type df_props: pd.DataFrame
+    :return: Dictionary from the metric column to its values
+    :rtype: dict[str, np.ndarray]
+    """
+    arrays = {}
+    for col in get_property_columns():
+        arrays[col] = df_props[col].to_numpy(dtype="float64", na_value=np.nan)
+
+    metric_values = {}
+    for suffix in SUFFIXES:
+        for metric in METRICS.values():
+            pchembl_col = get_pchembl_column(metric, suffix)
+            if pchembl_col not in arrays:
+                arrays[pchembl_col] = df_result[pchembl_col].to_numpy(
+                    dtype="float64", na_value=np.nan
+                )
+            prop = arrays[metric.property_column]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = metric.formula(arrays[pchembl_col], prop)
+            if metric.zero_is_null:
+                values = np.where(prop != 0, values, np.nan)
+            metric_values[f"{metric.name}_{suffix}"] = values
+    return metric_values
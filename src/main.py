@@ -2,13 +2,56 @@
 Get the compound-target pairs dataset from ChEMBL using the given arguments.
 """
 
+import argparse
+import contextlib
 import logging
+import os
 import sqlite3
 
 import chembl_downloader
 
 import arguments
 import get_dataset
+import index_advisor
+import output
+
+
+def calculate_dataset(
+    chembl_con: sqlite3.Connection,
+    args: argparse.Namespace,
+    calc_args: arguments.CalculationArgs,
+    output_args: arguments.OutputArgs,
+):
+    """
+    Calculate the dataset based on chembl_con or,
+    if args.working_copy_path is set, based on a working copy of ChEMBL
+    with additional indexes for the pipeline queries.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database
+    :type chembl_con: sqlite3.Connection
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :param calc_args: Arguments related to how to calculate the dataset
+    :type calc_args: arguments.CalculationArgs
+    :param output_args: Arguments related to how to output the dataset
+    :type output_args: arguments.OutputArgs
+    """
+    if args.working_copy_path is None:
+        get_dataset.get_ct_pair_dataset(chembl_con, calc_args, output_args)
+        return
+
+    working_con, df_report = index_advisor.prepare_working_copy(
+        chembl_con, args.working_copy_path, calc_args
+    )
+    # sqlite3 connections only commit / roll back as context managers,
+    # the connection to the working copy is closed explicitly
+    with contextlib.closing(working_con):
+        output.write_output(
+            df_report,
+            os.path.join(output_args.output_path, "index_advisor_report"),
+            output_args,
+        )
+        get_dataset.get_ct_pair_dataset(working_con, calc_args, output_args)
 
 
 def main():
@@ -28,22 +71,14 @@ def main():
         )
         assert args.chembl, "Please provide a ChEMBL version."
         with sqlite3.connect(args.sqlite) as chembl_con:
-            get_dataset.get_ct_pair_dataset(
-                chembl_con,
-                calc_args,
-                output_args,
-            )
+            calculate_dataset(chembl_con, args, calc_args, output_args)
     else:
         logging.info("Using chembl_downloader to connect to ChEMBL.")
         if args.chembl_version is None:
             args.chembl_version = chembl_downloader.latest()
 
         with chembl_downloader.connect(version=args.chembl_version) as chembl_con:
-            get_dataset.get_ct_pair_dataset(
-                chembl_con,
-                calc_args,
-                output_args,
-            )
+            calculate_dataset(chembl_con, args, calc_args, output_args)
 
 
 if __name__ == "__main__":
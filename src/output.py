@@ -3,21 +3,172 @@ Write the dataset, subsets and related statistics to files
 and to the command line.
 """
 
+import contextlib
+import dataclasses
 import logging
 import os
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
 import pandas as pd
 import sanity_checks
 
 from arguments import OutputArgs, CalculationArgs
+import column_schema
+import content_hashes
 from dataset import Dataset
+import dtype_policy
+import export_scheduler
 import get_stats
+import pair_keys
+import parquet_files
+import star_schema
 
 
 ##### Writing Output #####
+def get_output_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert df to the representation that is written to the output files.
+
+    :param df: Pandas DataFrame with compound-target pairs
+    :type df: pd.DataFrame
+    :return: df with string keys and output data types
+    :rtype: pd.DataFrame
+    """
+    # int64 pair keys are only converted to strings for the output
+    df = pair_keys.materialise_key_columns(df)
+    # memory-lean data types are converted to the types read back from the files
+    return dtype_policy.get_output_types(df)
+
+
+def select(
+    df: pd.DataFrame,
+    positions: Optional[np.ndarray],
+    columns: Optional[list[str]],
+) -> pd.DataFrame:
+    """
+    Select rows and columns of df by position and name.
+
+    :param df: Pandas DataFrame
+    :type df: pd.DataFrame
+    :param positions: Positions of the selected rows, all rows if None
+    :type positions: Optional[np.ndarray]
+    :param columns: Selected columns, all columns if None
+    :type columns: Optional[list[str]]
+    :return: Selected part of df (df itself if everything is selected)
+    :rtype: pd.DataFrame
+    """
+    if positions is None and columns is None:
+        return df
+    row_indexer = slice(None) if positions is None else positions
+    column_indexer = slice(None) if columns is None else df.columns.get_indexer(columns)
+    return df.iloc[row_indexer, column_indexer]
+
+
+def get_chunks(df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    """
+    Split df into chunks of content_hashes.CHUNK_SIZE rows.
+    At least one (possibly empty) chunk is returned.
+
+    :param df: Pandas DataFrame
+    :type df: pd.DataFrame
+    :return: Iterator over the chunks
+    :rtype: Iterator[pd.DataFrame]
+    """
+    for start in range(0, max(len(df), 1), content_hashes.CHUNK_SIZE):
+        yield df.iloc[start : start + content_hashes.CHUNK_SIZE]
+
+
+def get_output_chunks(
+    dataset: Dataset,
+    positions: Optional[np.ndarray] = None,
+    columns: Optional[list[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Get the selected rows and columns of the dataset
+    in chunks of content_hashes.CHUNK_SIZE rows
+    in their output representation (see get_output_frame).
+    The compound and target attributes are joined onto every chunk
+    (see star_schema.join_dimensions).
+    Only the current chunk is copied, i.e., the selection is never copied as a whole.
+    At least one (possibly empty) chunk is returned.
+
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
+    :param positions: Positions of the selected rows of dataset.df_result,
+        all rows if None, defaults to None
+    :type positions: Optional[np.ndarray], optional
+    :param columns: Selected columns, all columns (see star_schema.get_columns)
+        if None, defaults to None
+    :type columns: Optional[list[str]], optional
+    :return: Iterator over the chunks
+    :rtype: Iterator[pd.DataFrame]
+    """
+    if positions is None:
+        positions = np.arange(len(dataset.df_result))
+    dimension_positions = star_schema.get_dimension_positions(dataset)
+    for start in range(0, max(len(positions), 1), content_hashes.CHUNK_SIZE):
+        yield get_output_frame(
+            star_schema.join_dimensions(
+                dataset,
+                positions[start : start + content_hashes.CHUNK_SIZE],
+                columns,
+                dimension_positions,
+            )
+        )
+
+
+def write_chunks(
+    df_chunks: Iterable[pd.DataFrame],
+    filename: str,
+    out: OutputArgs,
+    content_hash: Optional[content_hashes.ContentHash],
+    file_type_list: list[str],
+):
+    """
+    Write the chunks of a DataFrame to <filename>.csv and / or <filename>.parquet
+    in one pass. If content_hash is set, the rows are added to the content hash
+    while they are written.
+
+    :param df_chunks: Consecutive chunks of the Pandas Dataframe to write to output file,
+        at least one (possibly empty) chunk is required for the header.
+    :type df_chunks: Iterable[pd.DataFrame]
+    :param filename: Filename to write the output to (without the file extension)
+    :type filename: str
+    :param out: Arguments related to how to output the dataset
+    :type out: OutputArgs
+    :param content_hash: Content hash to update with the written rows, not used if None
+    :type content_hash: Optional[content_hashes.ContentHash]
+    :param file_type_list: List of file extensions to write to. Options: csv, parquet
+    :type file_type_list: list[str]
+    """
+    with contextlib.ExitStack() as stack:
+        csv_file = None
+        if "csv" in file_type_list:
+            csv_file = stack.enter_context(
+                open(f"{filename}.csv", "w", encoding="utf-8", newline="")
+            )
+        parquet_writer = None
+        for i, df_chunk in enumerate(df_chunks):
+            if i == 0 and "parquet" in file_type_list:
+                parquet_writer = stack.enter_context(
+                    parquet_files.ParquetWriter(
+                        filename, df_chunk.columns.tolist(), out.parquet_partition
+                    )
+                )
+            if csv_file is not None:
+                df_chunk.to_csv(csv_file, sep=out.delimiter, index=False, header=i == 0)
+            if parquet_writer is not None:
+                parquet_writer.write(df_chunk)
+            if content_hash is not None:
+                content_hash.update(df_chunk)
+
+
 def write_output(
     df: pd.DataFrame,
     filename: str,
     out: OutputArgs,
+    content_hash: Optional[content_hashes.ContentHash] = None,
 ) -> list[str]:
     """
     Write DataFrame df to output file named <filename>.
@@ -28,13 +179,14 @@ def write_output(
     :type filename: bool
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
+    :param content_hash: Content hash to update with the rows of df
+        while they are written, not used if None, defaults to None
+    :type content_hash: Optional[content_hashes.ContentHash], optional
     :return: Returns list of types of files that was written to (csv and/or xlsx)
     :rtype: list[str]
     """
-    file_type_list = []
-    if out.write_to_csv:
-        df.to_csv(f"{filename}.csv", sep=out.delimiter, index=False)
-        file_type_list.append("csv")
+    file_type_list = ["csv"] if out.write_to_csv else []
+    write_chunks(get_chunks(df), filename, out, content_hash, file_type_list)
     if out.write_to_excel:
         try:
             with pd.ExcelWriter(f"{filename}.xlsx", engine="xlsxwriter") as writer:
@@ -90,35 +242,190 @@ def output_stats(
     )
 
 
-def write_and_check_output(
-    df: pd.DataFrame,
+def write_and_check_dataset(
+    dataset: Dataset,
     filename: str,
-    assay_type: str,
-    args: CalculationArgs,
     out: OutputArgs,
+    rows: Optional[np.ndarray] = None,
+    columns: Optional[list[str]] = None,
 ):
     """
-    Write df to file and check that writing was successful.
+    Write the dataset (or the selected rows and columns of the dataset)
+    with the compound and target attributes (see star_schema) and its schema sidecar
+    (see column_schema) to file and check that writing was successful,
+    either by reading the file back (see sanity_checks.test_equality)
+    or by comparing content hashes (see sanity_checks.check_content_hash).
+    The written files are added to the manifest (see content_hashes).
 
-    :param df: Pandas Dataframe to write to output file.
-    :type df: pd.DataFrame
+    If the files are checked with content hashes and not written to excel,
+    the selection is written to csv and parquet chunk by chunk in one pass
+    without copying it as a whole.
+    Otherwise, the selection is copied once in its output representation.
+    Parquet files (see parquet_files) are always checked with content hashes.
+
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
     :param filename: Filename to write the output to (should not include the file extension)
     :type filename: bool
-    :param assay_type: Types of assays current_df contains information about. \
-        Options: "BF" (binding+functional), 
-        "B" (binding), 
-        "all" (contains both BF and B information)
-    :type assay_type: str
-    :param args: Arguments related to how to calculate the dataset
-    :type args: CalculationArgs
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
+    :param rows: Boolean mask of the rows of dataset.df_result that are written,
+        all rows if None, defaults to None
+    :type rows: Optional[np.ndarray], optional
+    :param columns: Columns that are written, all columns (see star_schema.get_columns)
+        if None, defaults to None
+    :type columns: Optional[list[str]], optional
+    """
+    positions = None if rows is None else np.flatnonzero(rows)
+    if columns is None:
+        columns = star_schema.get_columns(dataset)
+    parquet_type_list = ["parquet"] if out.write_to_parquet else []
+    content_hash = content_hashes.ContentHash()
+    if out.verification == "hash" and not out.write_to_excel:
+        file_type_list = ["csv"] if out.write_to_csv else []
+        write_chunks(
+            get_output_chunks(dataset, positions, columns),
+            filename,
+            out,
+            content_hash,
+            file_type_list + parquet_type_list,
+        )
+    else:
+        df_output = get_output_frame(
+            star_schema.join_dimensions(dataset, positions, columns)
+        )
+        file_type_list = write_output(df_output, filename, out, content_hash)
+        write_chunks(get_chunks(df_output), filename, out, None, parquet_type_list)
+    column_schema.write_schema(columns, filename, out.delimiter)
+
+    if out.verification == "hash":
+        sanity_checks.check_content_hash(
+            filename, file_type_list + parquet_type_list, content_hash
+        )
+    else:
+        sanity_checks.test_equality(df_output, filename, file_type_list)
+        # parquet files are always checked with content hashes
+        sanity_checks.check_content_hash(filename, parquet_type_list, content_hash)
+    file_type_list += parquet_type_list
+    content_hashes.add_to_manifest(filename, file_type_list, content_hash)
+
+
+def write_dataset_stats(
+    dataset: Dataset,
+    filename: str,
+    out: OutputArgs,
+    rows: Optional[np.ndarray] = None,
+    columns: Optional[list[str]] = None,
+):
+    """
+    Write the stats of the dataset (or the selected rows and columns of the dataset)
+    to <filename>_stats (see output_stats).
+
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
+    :param filename: Filename of the dataset (should not include the file extension)
+    :type filename: str
+    :param out: Arguments related to how to output the dataset
+    :type out: OutputArgs
+    :param rows: Boolean mask of the selected rows of dataset.df_result,
+        all rows if None, defaults to None
+    :type rows: Optional[np.ndarray], optional
+    :param columns: Selected columns, all columns if None, defaults to None
+    :type columns: Optional[list[str]], optional
+    """
+    positions = None if rows is None else np.flatnonzero(rows)
+    if columns is None:
+        columns = dataset.df_result.columns.tolist()
+    # the statistics only need the key columns (part of the fact table)
+    stats_columns = get_stats.get_stats_columns()[0] + ["DTI"]
+    output_stats(
+        select(
+            dataset.df_result,
+            positions,
+            [col for col in columns if col in stats_columns],
+        ),
+        f"{filename}_stats",
+        out,
+    )
+
+
+def copy_tables(dataset: Dataset) -> Dataset:
+    """
+    Get a copy of the dataset with shallow copies of the fact and dimension tables,
+    i.e., the data is not copied but pandas-internal state of the tables
+    is not shared with the copy.
+
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
+    :return: Copy of the dataset
+    :rtype: Dataset
     """
-    file_type_list = write_output(df, filename, out)
-    sanity_checks.test_equality(
-        df, filename, assay_type, file_type_list, args.calculate_rdkit
+    return dataclasses.replace(
+        dataset,
+        df_result=dataset.df_result.copy(deep=False),
+        df_compounds=dataset.df_compounds.copy(deep=False),
+        df_targets=dataset.df_targets.copy(deep=False),
     )
-    output_stats(df, f"{filename}_stats", out)
+
+
+def schedule_write_and_check_output(
+    scheduler: export_scheduler.ExportScheduler,
+    dataset: Dataset,
+    filename: str,
+    out: OutputArgs,
+    selection: tuple[Optional[np.ndarray], Optional[list[str]]] = (None, None),
+):
+    """
+    Schedule writing and checking the dataset (see write_and_check_dataset)
+    and writing its stats (see write_dataset_stats) as two independent tasks.
+    Every task gets its own shallow copy of the tables of the dataset
+    (see copy_tables), i.e., the data is not copied but pandas-internal state
+    is not shared between threads.
+
+    :param scheduler: Scheduler that runs the tasks
+    :type scheduler: export_scheduler.ExportScheduler
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
+    :param filename: Filename to write the output to (should not include the file extension)
+    :type filename: str
+    :param out: Arguments related to how to output the dataset
+    :type out: OutputArgs
+    :param selection: Boolean mask of the rows of dataset.df_result and list of the columns
+        that are written (all rows / columns if None), defaults to (None, None)
+    :type selection: tuple[Optional[np.ndarray], Optional[list[str]]], optional
+    """
+    for task in [write_and_check_dataset, write_dataset_stats]:
+        scheduler.submit(task, copy_tables(dataset), filename, out, *selection)
+
+
+def write_and_check_output(
+    dataset: Dataset,
+    filename: str,
+    out: OutputArgs,
+    rows: Optional[np.ndarray] = None,
+    columns: Optional[list[str]] = None,
+):
+    """
+    Write and check the dataset and write its stats
+    (see write_and_check_dataset and write_dataset_stats),
+    concurrently if out.export_workers > 1.
+
+    :param dataset: Dataset with compound-target pairs
+    :type dataset: Dataset
+    :param filename: Filename to write the output to (should not include the file extension)
+    :type filename: str
+    :param out: Arguments related to how to output the dataset
+    :type out: OutputArgs
+    :param rows: Boolean mask of the rows of dataset.df_result that are written,
+        all rows if None, defaults to None
+    :type rows: Optional[np.ndarray], optional
+    :param columns: Columns that are written, all columns if None, defaults to None
+    :type columns: Optional[list[str]], optional
+    """
+    with export_scheduler.ExportScheduler(out.export_workers) as scheduler:
+        schedule_write_and_check_output(
+            scheduler, dataset, filename, out, (rows, columns)
+        )
 
 
 ##### Output Specific Results #####
@@ -137,13 +444,12 @@ def write_full_dataset_to_file(
     :param out: Arguments related to how to output the dataset
     :type out: OutputArgs
     """
-    desc = "all"
     if out.write_full_dataset:
         name_all = os.path.join(
             out.output_path,
             f"ChEMBL{args.chembl_version}_CTI_{args.limited_flag}_full_dataset",
         )
-        write_and_check_output(dataset.df_result, name_all, desc, args, out)
+        write_and_check_output(dataset, name_all, out)
 
 
 def write_debug_sizes(
@@ -177,3 +483,11 @@ def write_debug_sizes(
         name_pchembl_df_sizes,
         out,
     )
+
+    # Memory usage of columns before and after applying the data type policy.
+    name_memory_usage = os.path.join(out.output_path, "debug_memory_usage")
+    write_output(
+        dataset.df_memory_usage,
+        name_memory_usage,
+        out,
+    )
@@ -0,0 +1,253 @@
+"""
+Integer keys for compounds, targets and compound-target pairs.
+
+The columns tid_mutation, cpd_target_pair and cpd_target_pair_mutation
+are carried through the calculation as int64 keys
+and are only converted to their string representation
+(e.g., '<parent_molregno>_<tid>_<mutation>') when writing the output.
+
+A key is packed from the following bits (from most to least significant):
+
++-------------------+---------+--------------------------------------------------+
+| parent_molregno   | 27 bits | 0 for tid_mutation                               |
++-------------------+---------+--------------------------------------------------+
+| tid               | 20 bits |                                                  |
++-------------------+---------+--------------------------------------------------+
+| mutation id       | 16 bits | 0 without mutation, always 0 for cpd_target_pair |
++-------------------+---------+--------------------------------------------------+
+
+Therefore, the cpd_target_pair_mutation key of a pair without a mutation
+is equal to its cpd_target_pair key.
+"""
+
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+MUTATION_BITS = 16
+TID_BITS = 20
+MOLREGNO_BITS = 27
+
+
+########### Packing Keys ###########
+def check_key_range(values: np.ndarray, bits: int, name: str):
+    """
+    Check that all values can be represented with the given number of bits.
+
+    :param values: Values that should be packed into a key
+    :type values: np.ndarray
+    :param bits: Number of bits available for the values
+    :type bits: int
+    :param name: Name of the values, used in the error message
+    :type name: str
+    :raises ValueError: If a value is negative or too large
+    """
+    if len(values) > 0 and (values.min() < 0 or values.max() >= 1 << bits):
+        raise ValueError(
+            f"Values of {name} have to be between 0 and {(1 << bits) - 1} "
+            f"to be packed into compound-target pair keys."
+        )
+
+
+def encode_mutations(mutation: pd.Series, mutation_ids: dict[str, int]) -> np.ndarray:
+    """
+    Get the mutation id for every entry of mutation.
+    Null values are encoded as 0.
+    Mutations that are not in mutation_ids yet are added with the next free id,
+    i.e., the same dictionary can be used to encode several DataFrames consistently.
+
+    :param mutation: Mutation annotations
+    :type mutation: pd.Series
+    :param mutation_ids: Dictionary from mutation to mutation id.
+        Will be updated to include new mutations.
+    :type mutation_ids: dict[str, int]
+    :return: Array with mutation ids
+    :rtype: np.ndarray
+    """
+    for new_mutation in mutation.dropna().unique():
+        if new_mutation not in mutation_ids:
+            mutation_ids[new_mutation] = len(mutation_ids) + 1
+    ids = mutation.map(mutation_ids).fillna(0).to_numpy(dtype="int64")
+    check_key_range(ids, MUTATION_BITS, "mutation ids")
+    return ids
+
+
+def get_tid_mutation_keys(
+    tid: pd.Series, mutation_ids: Union[np.ndarray, int]
+) -> np.ndarray:
+    """
+    Pack target ids and mutation ids into tid_mutation keys.
+
+    :param tid: Target ids
+    :type tid: pd.Series
+    :param mutation_ids: Mutation ids, see encode_mutations.
+        Use 0 for targets without mutations.
+    :type mutation_ids: Union[np.ndarray, int]
+    :return: Array with tid_mutation keys
+    :rtype: np.ndarray
+    """
+    tid = tid.to_numpy(dtype="int64")
+    check_key_range(tid, TID_BITS, "tid")
+    return (tid << MUTATION_BITS) | mutation_ids
+
+
+def get_cpd_target_pair_keys(
+    parent_molregno: pd.Series, tid_mutation: Union[pd.Series, np.ndarray]
+) -> np.ndarray:
+    """
+    Pack compound ids and tid_mutation keys into compound-target pair keys.
+    Use the tid_mutation keys to get cpd_target_pair_mutation keys
+    and the tid_mutation keys without mutations (see get_tid_mutation_keys)
+    to get cpd_target_pair keys.
+
+    :param parent_molregno: Compound ids
+    :type parent_molregno: pd.Series
+    :param tid_mutation: tid_mutation keys
+    :type tid_mutation: Union[pd.Series, np.ndarray]
+    :return: Array with compound-target pair keys
+    :rtype: np.ndarray
+    """
+    parent_molregno = parent_molregno.to_numpy(dtype="int64")
+    check_key_range(parent_molregno, MOLREGNO_BITS, "parent_molregno")
+    return (parent_molregno << (TID_BITS + MUTATION_BITS)) | np.asarray(
+        tid_mutation, dtype="int64"
+    )
+
+
+def add_key_columns(df: pd.DataFrame, mutation_ids: dict[str, int]):
+    """
+    Add the key columns tid_mutation, cpd_target_pair and cpd_target_pair_mutation
+    based on parent_molregno, tid and mutation.
+
+    :param df: Pandas DataFrame with compound-target pairs.
+        Will be updated to include the key columns.
+    :type df: pd.DataFrame
+    :param mutation_ids: Dictionary from mutation to mutation id, see encode_mutations.
+    :type mutation_ids: dict[str, int]
+    """
+    df["tid_mutation"] = get_tid_mutation_keys(
+        df["tid"], encode_mutations(df["mutation"], mutation_ids)
+    )
+    df["cpd_target_pair"] = get_cpd_target_pair_keys(
+        df["parent_molregno"], get_tid_mutation_keys(df["tid"], 0)
+    )
+    df["cpd_target_pair_mutation"] = get_cpd_target_pair_keys(
+        df["parent_molregno"], df["tid_mutation"]
+    )
+
+
+########### String Representation ###########
+def get_tid_mutation_strings(df: pd.DataFrame, rows: np.ndarray) -> np.ndarray:
+    """
+    Get the string representation of the tid_mutation keys in the given rows of df,
+    i.e., '<tid>_<mutation>' or '<tid>' if there is no mutation.
+
+    :param df: Pandas DataFrame with the columns tid and mutation
+    :type df: pd.DataFrame
+    :param rows: Positions of the rows in df
+    :type rows: np.ndarray
+    :return: Array with the string representation of tid_mutation
+    :rtype: np.ndarray
+    """
+    tids = df["tid"].iloc[rows].astype("int64").astype("str")
+    mutations = df["mutation"].iloc[rows]
+    return np.where(mutations.notnull(), tids + "_" + mutations, tids)
+
+
+def get_unique_values(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the position of the first occurrence of every unique value
+    and the position of the unique value for every entry in values.
+
+    :param values: Array of values
+    :type values: np.ndarray
+    :return: Positions of first occurrences, inverse (see np.unique)
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    _, first_rows, inverse = np.unique(values, return_index=True, return_inverse=True)
+    return first_rows, inverse.reshape(-1)
+
+
+def materialise_key_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Replace the int64 keys in tid_mutation, cpd_target_pair and cpd_target_pair_mutation
+    with their string representation.
+    DataFrames that already contain the string representation are returned as they are.
+
+    :param df: Pandas DataFrame with key columns
+    :type df: pd.DataFrame
+    :return: Copy of df with the string representation of the keys
+    :rtype: pd.DataFrame
+    """
+    if "cpd_target_pair_mutation" not in df.columns or not (
+        pd.api.types.is_integer_dtype(df["cpd_target_pair_mutation"])
+    ):
+        return df
+
+    # tid_mutation strings are only built once per unique key
+    first_rows, inverse = get_unique_values(df["tid_mutation"].to_numpy())
+    tid_mutation = pd.Series(
+        get_tid_mutation_strings(df, first_rows)[inverse], index=df.index, dtype=object
+    )
+    parent_molregno = df["parent_molregno"].astype("int64").astype("str")
+    return df.assign(
+        tid_mutation=tid_mutation,
+        cpd_target_pair=parent_molregno + "_" + df["tid"].astype("int64").astype("str"),
+        cpd_target_pair_mutation=parent_molregno + "_" + tid_mutation,
+    )
+
+
+def get_string_ranks(
+    first_rows: np.ndarray, inverse: np.ndarray, strings: np.ndarray
+) -> np.ndarray:
+    """
+    Get the rank of every entry based on the alphabetical order of
+    the string representation of the unique values.
+
+    :param first_rows: Positions of the first occurrence of every unique value,
+        see get_unique_values
+    :type first_rows: np.ndarray
+    :param inverse: Position of the unique value for every entry, see get_unique_values
+    :type inverse: np.ndarray
+    :param strings: String representation of the unique values (in the order of first_rows)
+    :type strings: np.ndarray
+    :return: Array with the rank of every entry
+    :rtype: np.ndarray
+    """
+    ranks = np.empty(len(first_rows), dtype="int64")
+    ranks[np.argsort(strings)] = np.arange(len(first_rows))
+    return ranks[inverse]
+
+
+def get_cpd_target_pair_mutation_order(df: pd.DataFrame) -> np.ndarray:
+    """
+    Get the positions that sort df by the string representation of
+    cpd_target_pair_mutation ('<parent_molregno>_<tid_mutation>')
+    without building the strings for every row.
+
+    Since '_' comes after all digits, the order of
+    '<parent_molregno>_' determines the order of two different compounds.
+    Therefore, rows are sorted by the rank of '<parent_molregno>_'
+    and then by the rank of the string representation of tid_mutation,
+    both of which are only built once per unique value.
+
+    :param df: Pandas DataFrame with compound-target pairs
+    :type df: pd.DataFrame
+    :return: Positions that sort df by cpd_target_pair_mutation
+    :rtype: np.ndarray
+    """
+    parent_molregno = df["parent_molregno"].to_numpy(dtype="int64")
+    first_rows, inverse = get_unique_values(parent_molregno)
+    molregno_ranks = get_string_ranks(
+        first_rows,
+        inverse,
+        np.array([f"{molregno}_" for molregno in parent_molregno[first_rows]]),
+    )
+
+    first_rows, inverse = get_unique_values(df["tid_mutation"].to_numpy())
+    tid_mutation_ranks = get_string_ranks(
+        first_rows, inverse, get_tid_mutation_strings(df, first_rows)
+    )
+
+    return np.lexsort((tid_mutation_ranks, molregno_ranks))
@@ -0,0 +1,306 @@
+"""
+Parquet output of the dataset and its subsets.
+
+The columns are written with the data types in the column schema (see column_schema),
+text columns are dictionary encoded.
+Every chunk of the dataset (see content_hashes.CHUNK_SIZE) is written as one row group
+with min / max statistics, i.e., readers can skip row groups based on
+the values in a column (e.g., a filtering column such as BF_100).
+Optionally, the dataset is partitioned by one column (see PARTITION_COLUMNS)
+into a directory <filename>.parquet with one subdirectory per value
+(<column>=<value>, hive partitioning).
+
+Parquet output requires pyarrow, which is an optional dependency
+(pip install .[parquet]).
+"""
+
+import os
+import shutil
+from typing import Iterator, Optional
+
+import pandas as pd
+
+import column_schema
+import content_hashes
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.parquet as pq
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# columns the dataset can be partitioned by
+PARTITION_COLUMNS = ["DTI", "target_type", "target_class_l1"]
+
+
+########### Arrow Schema ###########
+def get_arrow_type(dtype: str) -> "pa.DataType":
+    """
+    Get the Arrow data type of a data type in the column schema.
+    Text columns are dictionary encoded.
+
+    :param dtype: Data type in the column schema
+    :type dtype: str
+    :raises ValueError: If there is no Arrow data type for dtype
+    :return: Arrow data type
+    :rtype: pa.DataType
+    """
+    arrow_types = {
+        "str": pa.dictionary(pa.int32(), pa.string()),
+        "Int64": pa.int64(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+    }
+    if dtype not in arrow_types:
+        raise ValueError(f"Data type {dtype} can not be written to parquet.")
+    return arrow_types[dtype]
+
+
+def get_arrow_schema(dtypes: dict[str, str]) -> "pa.Schema":
+    """
+    Get the Arrow schema of the columns.
+
+    :param dtypes: Dictionary from the column name to the data type,
+        see column_schema.get_dtypes
+    :type dtypes: dict[str, str]
+    :return: Arrow schema
+    :rtype: pa.Schema
+    """
+    return pa.schema([(name, get_arrow_type(dtype)) for name, dtype in dtypes.items()])
+
+
+########### Writing ###########
+def get_write_options() -> "pa_dataset.ParquetFileWriteOptions":
+    """
+    Get the options for writing partitioned parquet files.
+
+    :return: Dictionary encoding and row group statistics are enabled
+    :rtype: pa_dataset.ParquetFileWriteOptions
+    """
+    return pa_dataset.ParquetFileFormat().make_write_options(
+        use_dictionary=True, write_statistics=True, compression="snappy"
+    )
+
+
+class ParquetWriter:
+    """
+    Write a dataset to <filename>.parquet chunk by chunk.
+    Every chunk is written as one row group.
+    If partition_column is set, <filename>.parquet is a directory
+    with one subdirectory per value of the partition column
+    and one file per chunk and value.
+    The rows of a partition keep the order of the dataset.
+
+    Use as context manager::
+
+        with ParquetWriter(filename, columns, partition_column) as writer:
+            for df_chunk in df_chunks:
+                writer.write(df_chunk)
+    """
+
+    def __init__(
+        self, filename: str, columns: list[str], partition_column: Optional[str]
+    ):
+        """
+        :param filename: Name of the dataset file without the file extension
+        :type filename: str
+        :param columns: Columns of the dataset
+        :type columns: list[str]
+        :param partition_column: Column to partition the dataset by,
+            not partitioned if None
+        :type partition_column: Optional[str]
+        """
+        if partition_column is not None:
+            assert (
+                partition_column in columns
+            ), f"Partition column {partition_column} is not in the dataset."
+        self.path = f"{filename}.parquet"
+        self.schema = get_arrow_schema(column_schema.get_dtypes(columns))
+        self.partition_column = partition_column
+        self.nof_chunks = 0
+        self._writer = None
+
+    def __enter__(self):
+        # remove files of earlier runs
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+        if self.partition_column is None:
+            self._writer = pq.ParquetWriter(
+                self.path,
+                self.schema,
+                use_dictionary=True,
+                write_statistics=True,
+                compression="snappy",
+            )
+        else:
+            os.makedirs(self.path)
+        return self
+
+    def write(self, df_chunk: pd.DataFrame):
+        """
+        Write the next chunk of the dataset.
+
+        :param df_chunk: Next rows of the dataset in the output representation
+        :type df_chunk: pd.DataFrame
+        """
+        table = pa.Table.from_pandas(df_chunk, schema=self.schema, preserve_index=False)
+        if self._writer is not None:
+            self._writer.write_table(table, row_group_size=max(len(df_chunk), 1))
+        else:
+            pa_dataset.write_dataset(
+                table,
+                self.path,
+                format="parquet",
+                partitioning=[self.partition_column],
+                partitioning_flavor="hive",
+                basename_template=f"part-{self.nof_chunks:05d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=get_write_options(),
+                max_rows_per_group=max(len(df_chunk), 1),
+                preserve_order=True,
+                use_threads=False,
+            )
+        self.nof_chunks += 1
+
+    def __exit__(self, *exc_info):
+        if self._writer is not None:
+            self._writer.close()
+
+
+########### Reading ###########
+def is_partitioned(filename: str) -> bool:
+    """
+    Check if the parquet output of a dataset is partitioned.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: True if <filename>.parquet is a directory of partitions
+    :rtype: bool
+    """
+    return os.path.isdir(f"{filename}.parquet")
+
+
+def get_pandas_dtypes(dtypes: dict[str, str]) -> dict[str, str]:
+    """
+    Get the pandas data types of the columns read from parquet files,
+    i.e., text columns are read as objects.
+
+    :param dtypes: Dictionary from the column name to the data type,
+        see column_schema.read_schema
+    :type dtypes: dict[str, str]
+    :return: Dictionary from the column name to the pandas data type
+    :rtype: dict[str, str]
+    """
+    return {
+        name: "object" if dtype == "str" else dtype for name, dtype in dtypes.items()
+    }
+
+
+def get_frame(batch: "pa.RecordBatch", dtypes: dict[str, str]) -> pd.DataFrame:
+    """
+    Convert rows read from a parquet file to a DataFrame
+    with the data types in the column schema.
+
+    :param batch: Rows read from a parquet file
+    :type batch: pa.RecordBatch
+    :param dtypes: Dictionary from the column name to the data type,
+        see column_schema.read_schema
+    :type dtypes: dict[str, str]
+    :return: Pandas DataFrame with the rows
+    :rtype: pd.DataFrame
+    """
+    return batch.to_pandas().astype(get_pandas_dtypes(dtypes))
+
+
+def iter_parquet(
+    filename: str, chunk_size: int = content_hashes.CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Read the parquet output of a dataset in chunks
+    with the data types in its schema sidecar (see column_schema).
+    The rows of a partitioned dataset are grouped by partition.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :param chunk_size: Maximum number of rows read at once,
+        defaults to content_hashes.CHUNK_SIZE
+    :type chunk_size: int, optional
+    :return: Iterator over the chunks
+    :rtype: Iterator[pd.DataFrame]
+    """
+    dtypes, _ = column_schema.read_schema(filename)
+    if is_partitioned(filename):
+        # subdirectories are named <partition column>=<value>
+        partitions = os.listdir(f"{filename}.parquet")
+        schema = get_arrow_schema(dtypes)
+        partitioning = None
+        if partitions:
+            partition_field = pa.field(partitions[0].split("=")[0], pa.string())
+            # values of the partition column are read from the directory names
+            schema = schema.set(
+                schema.get_field_index(partition_field.name), partition_field
+            )
+            partitioning = pa_dataset.partitioning(
+                pa.schema([partition_field]), flavor="hive"
+            )
+        batches = pa_dataset.dataset(
+            f"{filename}.parquet",
+            format="parquet",
+            schema=schema,
+            partitioning=partitioning,
+        ).to_batches(batch_size=chunk_size)
+    else:
+        batches = pq.ParquetFile(f"{filename}.parquet").iter_batches(
+            batch_size=chunk_size
+        )
+    for batch in batches:
+        yield get_frame(batch, dtypes)
+
+
+def read_parquet(filename: str) -> pd.DataFrame:
+    """
+    Read the parquet output of a dataset
+    with the data types in its schema sidecar (see column_schema).
+    The rows of a partitioned dataset are grouped by partition.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: Pandas DataFrame with the dataset
+    :rtype: pd.DataFrame
+    """
+    dtypes, _ = column_schema.read_schema(filename)
+    df_chunks = list(iter_parquet(filename))
+    if not df_chunks:
+        return pd.DataFrame(
+            {
+                name: pd.Series(dtype=dtype)
+                for name, dtype in get_pandas_dtypes(dtypes).items()
+            }
+        )
+    return pd.concat(df_chunks, ignore_index=True)
+
+
+def get_parquet_content_hash(filename: str) -> content_hashes.ContentHash:
+    """
+    Calculate the content hash of the parquet output of a dataset
+    by reading it in chunks.
+    For partitioned datasets, only the order-independent digest
+    (see content_hashes.ContentHash.unordered_hexdigest) is comparable
+    to the content hash of the dataset.
+
+    :param filename: Name of the dataset file without the file extension
+    :type filename: str
+    :return: Content hash of the file
+    :rtype: content_hashes.ContentHash
+    """
+    content_hash = content_hashes.ContentHash()
+    for df_chunk in iter_parquet(filename):
+        content_hash.update(df_chunk)
+    return content_hash
@@ -1,13 +1,155 @@
 """
 Perform sanity checks on the dataset.
+
+How thoroughly the dataset is checked is set with :func:`configure_checks`:
+
+- full:     all rows are checked
+- sample:   a deterministic random sample of rows is checked
+- off:      no checks are run
+
+The time every check took is logged.
 """
 
+from dataclasses import dataclass
+import functools
+import logging
+import time
+from typing import Callable, Optional
+
+import numpy as np
 import pandas as pd
 
+import column_schema
+import content_hashes
 from dataset import Dataset
+import ligand_efficiency
+import pair_keys
+import parquet_files
+
+
+########### Check Levels ###########
+CHECK_LEVELS = ["off", "sample", "full"]
+
+
+@dataclass
+class CheckSettings:
+    """
+    Settings for the sanity checks.
+
+    - level:          How thoroughly the dataset is checked, see CHECK_LEVELS
+    - sample_size:    Number of rows that are checked if level is "sample"
+    - seed:           Seed for drawing the sample
+    """
+
+    level: str = "full"
+    sample_size: int = 10000
+    seed: int = 0
+
+
+SETTINGS = CheckSettings()
+
+
+def configure_checks(level: str, sample_size: int):
+    """
+    Set how thoroughly the dataset is checked.
+
+    :param level: Check level, see CHECK_LEVELS
+    :type level: str
+    :param sample_size: Number of rows that are checked if level is "sample"
+    :type sample_size: int
+    :raises ValueError: If the level is unknown
+    """
+    if level not in CHECK_LEVELS:
+        raise ValueError(
+            f"Unknown check level {level}. Options: {', '.join(CHECK_LEVELS)}"
+        )
+    SETTINGS.level = level
+    SETTINGS.sample_size = sample_size
+
+
+def sanity_check(check: Callable) -> Callable:
+    """
+    Decorator for sanity checks.
+    The check is skipped if the check level is "off"
+    and the time it took is logged otherwise.
+
+    :param check: Sanity check
+    :type check: Callable
+    :return: Sanity check that respects the check level
+    :rtype: Callable
+    """
+
+    @functools.wraps(check)
+    def run_check(*args, **kwargs):
+        if SETTINGS.level == "off":
+            return
+        start = time.perf_counter()
+        check(*args, **kwargs)
+        logging.info(
+            "Sanity check %s (%s): %.3f s",
+            check.__name__,
+            SETTINGS.level,
+            time.perf_counter() - start,
+        )
+
+    return run_check
+
+
+def get_sample_positions(nof_rows: int) -> Optional[np.ndarray]:
+    """
+    Get the positions of the rows that are checked.
+    The sample is deterministic, i.e., the same for the same number of rows.
+
+    :param nof_rows: Number of rows of the DataFrame that is checked
+    :type nof_rows: int
+    :return: Sorted positions of the sampled rows,
+        None if all rows are checked
+    :rtype: Optional[np.ndarray]
+    """
+    if SETTINGS.level != "sample" or nof_rows <= SETTINGS.sample_size:
+        return None
+    rng = np.random.default_rng(SETTINGS.seed)
+    return np.sort(rng.choice(nof_rows, size=SETTINGS.sample_size, replace=False))
+
+
+def get_sample(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get the rows of df that are checked (see :func:`get_sample_positions`).
+
+    :param df: Pandas DataFrame that is checked
+    :type df: pd.DataFrame
+    :return: Sampled rows of df (df itself if all rows are checked)
+    :rtype: pd.DataFrame
+    """
+    positions = get_sample_positions(len(df))
+    if positions is None:
+        return df
+    return df.iloc[positions]
 
 
 ########### Sanity checks during assignments ###########
+# The checks compare boolean masks (e.g., the null mask of a column
+# with the mask of rows that are expected to be null)
+# instead of filtered copies of the DataFrame.
+def is_null_where_expected(column: pd.Series, expected_null: pd.Series) -> bool:
+    """
+    Check that a column is null exactly in the rows in which it is expected to be null.
+
+    :param column: Column of a DataFrame
+    :type column: pd.Series
+    :param expected_null: Boolean mask that is True if the value is expected to be null,
+        in the same order as column. Missing values in the mask count as False.
+    :type expected_null: pd.Series
+    :return: True if the null mask of the column is equal to expected_null
+    :rtype: bool
+    """
+    return np.array_equal(
+        column.isnull().to_numpy(),
+        expected_null.to_numpy(dtype=bool, na_value=False),
+    )
+
+
+@sanity_check
 def check_pairs_without_pchembl_are_in_drug_mechanisms(df_result: pd.DataFrame):
     """
     Check that rows without a pchembl value based on binding+functional assays (pchembl_x_BF)
@@ -17,19 +159,63 @@ def check_pairs_without_pchembl_are_in_drug_mechanisms(df_result: pd.DataFrame):
     but no data based on binding assays.
     All pchembl_value_x_BF columns without a pchembl should be in the dm table.
     """
+    df_result = get_sample(df_result)
     for pchembl_col in [
         "pchembl_value_mean_BF",
         "pchembl_value_max_BF",
         "pchembl_value_median_BF",
     ]:
-        assert df_result[(df_result[pchembl_col].isnull())].equals(
-            df_result[
-                (df_result["pair_mutation_in_dm_table"])
-                & (df_result[pchembl_col].isnull())
-            ]
-        ), f"Missing pchembl value in column {pchembl_col}"
+        assert not (
+            df_result[pchembl_col].isnull() & ~df_result["pair_mutation_in_dm_table"]
+        ).any(), f"Missing pchembl value in column {pchembl_col}"
+
+
+@sanity_check
+def check_aggregated_pchembl_values(df_result: pd.DataFrame, df_expected: pd.DataFrame):
+    """
+    Check that two versions of the compound-target pairs aggregated from activities
+    (e.g., calculated with different aggregation modes) contain the same pairs
+    and the same aggregated values.
+    Numeric values are compared up to rounding errors
+    since the order of summation may differ.
+    Pair keys are compared based on their string representation
+    since mutation ids depend on the order in which mutations were read.
+    """
+    df_result = pair_keys.materialise_key_columns(df_result)
+    df_expected = pair_keys.materialise_key_columns(df_expected)
+    assert set(df_result.columns) == set(
+        df_expected.columns
+    ), "Aggregated compound-target pairs have different columns."
+    assert len(df_result) == len(
+        df_expected
+    ), "Different number of aggregated compound-target pairs."
+
+    df_result = df_result.sort_values(by=["cpd_target_pair_mutation"]).reset_index(
+        drop=True
+    )
+    df_expected = df_expected.sort_values(by=["cpd_target_pair_mutation"]).reset_index(
+        drop=True
+    )[df_result.columns]
+    for col in df_result.columns:
+        if pd.api.types.is_numeric_dtype(
+            df_result[col]
+        ) and pd.api.types.is_numeric_dtype(df_expected[col]):
+            assert np.allclose(
+                df_result[col].astype("float64"),
+                df_expected[col].astype("float64"),
+                equal_nan=True,
+            ), f"Values in {col} are not equal."
+        else:
+            assert (
+                df_result[col].isnull().equals(df_expected[col].isnull())
+                and (
+                    df_result[col][df_result[col].notnull()].astype(str)
+                    == df_expected[col][df_expected[col].notnull()].astype(str)
+                ).all()
+            ), f"Values in {col} are not equal."
 
 
+@sanity_check
 def check_compound_props(df_result: pd.DataFrame, df_cpd_props: pd.DataFrame):
     """
     Check that compound props are only null if
@@ -37,69 +223,47 @@ def check_compound_props(df_result: pd.DataFrame, df_cpd_props: pd.DataFrame):
     - the property in the parent_molregno is not in df_cpd_props
     - or if the value in the compound props table is null.
     """
-    # missing values because the parent_molregno is not in the compound props table
-    no_cpd_prop_info = len(
-        df_result[
-            ~df_result["parent_molregno"].isin(set(df_cpd_props["parent_molregno"]))
-        ]
+    df_result = get_sample(df_result)
+    # Null values of all properties per compound in one grouped pass.
+    # Properties are missing if the compound props query returns null
+    # (exists but is null) or if the parent_molregno is not in the compound props table.
+    prop_columns = [col for col in df_cpd_props.columns if col != "parent_molregno"]
+    expected_null = (
+        df_cpd_props[prop_columns]
+        .isnull()
+        .groupby(df_cpd_props["parent_molregno"])
+        .any()
+        .reindex(df_result["parent_molregno"].to_numpy(), fill_value=True)
     )
-
-    for col in df_cpd_props.columns:
-        if col != "parent_molregno":
-            # missing values because the compound props query returns null (exists but is null)
-            missing_values = len(
-                df_result[
-                    df_result["parent_molregno"].isin(
-                        set(df_cpd_props[df_cpd_props[col].isnull()]["parent_molregno"])
-                    )
-                ]
-            )
-            null_values = no_cpd_prop_info + missing_values
-            assert null_values == len(
-                df_result[df_result[col].isnull()]
-            ), f"Too many null values in {col}"
+    for col in prop_columns:
+        assert is_null_where_expected(
+            df_result[col], expected_null[col]
+        ), f"Unexpected null values in {col}"
 
 
-def check_ligand_efficiency_metrics(df_result: pd.DataFrame):
+@sanity_check
+def check_ligand_efficiency_metrics(df_result: pd.DataFrame, df_props: pd.DataFrame):
     """
     Check that ligand efficiency metrics are only null
-    when at least one of the values used to calculate them is null.
-    Ligand efficiency metrics are only null when at least
-    one of the values used to calculate them is null.
-    """
-    for suffix in ["BF", "B"]:
-        assert df_result[(df_result[f"LE_{suffix}"].isnull())].equals(
-            df_result[
-                (df_result[f"pchembl_value_mean_{suffix}"].isnull())
-                | (df_result["heavy_atoms"].isnull())
-                | (df_result["heavy_atoms"] == 0)
-            ]
-        ), f"Missing LE value in LE_{suffix}"
-
-        assert df_result[(df_result[f"BEI_{suffix}"].isnull())].equals(
-            df_result[
-                (df_result[f"pchembl_value_mean_{suffix}"].isnull())
-                | (df_result["mw_freebase"].isnull())
-                | (df_result["mw_freebase"] == 0)
-            ]
-        ), f"Missing BEI value in BEI_{suffix}"
-
-        assert df_result[(df_result[f"SEI_{suffix}"].isnull())].equals(
-            df_result[
-                (df_result[f"pchembl_value_mean_{suffix}"].isnull())
-                | (df_result["psa"].isnull())
-                | (df_result["psa"] == 0)
-            ]
-        ), f"Missing SEI value in SEI_{suffix}"
-
-        assert df_result[(df_result[f"LLE_{suffix}"].isnull())].equals(
-            df_result[
-                (df_result[f"pchembl_value_mean_{suffix}"].isnull())
-                | (df_result["alogp"].isnull())
-            ]
-        ), f"Missing LLE value in LLE_{suffix}"
-
-
+    when at least one of the values used to calculate them is null
+    (or the compound property is 0 for metrics that divide by it).
+    The compound properties (df_props) are aligned with df_result.
+    """
+    df_result = get_sample(df_result).join(df_props)
+    for suffix in ligand_efficiency.SUFFIXES:
+        for metric in ligand_efficiency.METRICS.values():
+            expected_null = (
+                df_result[ligand_efficiency.get_pchembl_column(metric, suffix)].isnull()
+            ) | (df_result[metric.property_column].isnull())
+            if metric.zero_is_null:
+                expected_null |= df_result[metric.property_column] == 0
+            column = f"{metric.name}_{suffix}"
+            assert is_null_where_expected(
+                df_result[column], expected_null
+            ), f"Missing {metric.name} value in {column}"
+
+
+@sanity_check
 def check_atc(
     df_result: pd.DataFrame,
     atc_levels: pd.DataFrame,
@@ -108,14 +272,15 @@ def check_atc(
     Check that atc_level1 information is only null
     if the parent_molregno is not in the respective table.
     """
-    assert df_result[(df_result["atc_level1"].isnull())].equals(
-        df_result[
-            ~df_result["parent_molregno"].isin(set(atc_levels["parent_molregno"]))
-        ]
+    df_result = get_sample(df_result)
+    assert is_null_where_expected(
+        df_result["atc_level1"],
+        ~df_result["parent_molregno"].isin(atc_levels["parent_molregno"]),
     ), "Null values in atc_level1 are not exclusively \
         because the parent_molregno is not in the atc_classification table."
 
 
+@sanity_check
 def check_target_classes(
     df_result: pd.DataFrame,
     target_classes_level1: pd.DataFrame,
@@ -125,80 +290,146 @@ def check_target_classes(
     Check that target class information is only null
     if the target id is not in the respective table.
     """
-    assert df_result[(df_result["target_class_l1"].isnull())].equals(
-        df_result[~df_result["tid"].isin(set(target_classes_level1["tid"]))]
+    df_result = get_sample(df_result)
+    assert is_null_where_expected(
+        df_result["target_class_l1"],
+        ~df_result["tid"].isin(target_classes_level1["tid"]),
     ), "Null values in target_class_l1 are not exclusively \
         because the tid is not in the protein_classification table."
 
-    assert df_result[(df_result["target_class_l2"].isnull())].equals(
-        df_result[~df_result["tid"].isin(set(target_classes_level2["tid"]))]
+    assert is_null_where_expected(
+        df_result["target_class_l2"],
+        ~df_result["tid"].isin(target_classes_level2["tid"]),
     ), "Null values in target_class_l2 are not exclusively \
         because the tid is not in the protein_classification table."
 
 
+@sanity_check
 def check_rdkit_props(df_result: pd.DataFrame):
     """
     Check that columns set by the RDKit are only null
     if there is no canonical SMILES for the molecule.
-    Scaffolds are excluded from this test because
+    Scaffolds (text columns) are excluded from this test because
     they can be None if the molecule is acyclic.
     """
+    df_result = get_sample(df_result)
     for col in [
-        "fraction_csp3",
-        "num_aliphatic_carbocycles",
-        "num_aliphatic_heterocycles",
-        "num_aliphatic_rings",
-        "num_aromatic_carbocycles",
-        "num_aromatic_heterocycles",
-        "num_aromatic_rings",
-        "num_heteroatoms",
-        "num_saturated_carbocycles",
-        "num_saturated_heterocycles",
-        "num_saturated_rings",
-        "ring_count",
-        "num_stereocentres",
-        "aromatic_atoms",
-        "aromatic_c",
-        "aromatic_n",
-        "aromatic_hetero",
+        column.name
+        for column in column_schema.get_columns(calculate_rdkit=True)
+        if column.rdkit_only and column.dtype != "str"
     ]:
-        assert len(df_result[df_result[col].isnull()]) == len(
-            df_result[df_result["canonical_smiles"].isnull()].copy()
+        assert is_null_where_expected(
+            df_result[col], df_result["canonical_smiles"].isnull()
         ), f"Missing value in {col} despite a smiles being available."
 
 
+@sanity_check
+def check_filtering_column(
+    target_codes: np.ndarray, parent: np.ndarray, subset: np.ndarray, col_name: str
+):
+    """
+    Check that the filtering column <col_name> selects whole targets of its parent subset,
+    i.e., it only selects rows of the parent subset and
+    for every target either all or none of its rows in the parent subset.
+
+    :param target_codes: Integer code of the target of every row
+    :type target_codes: np.ndarray
+    :param parent: Boolean mask of the rows of the parent subset
+    :type parent: np.ndarray
+    :param subset: Values of the filtering column
+    :type subset: np.ndarray
+    :param col_name: Name of the filtering column
+    :type col_name: str
+    """
+    assert not (subset & ~parent).any(), f"Filtering is not accurate for {col_name}."
+    nof_targets = target_codes.max() + 1 if len(target_codes) > 0 else 0
+    parent_counts = np.bincount(target_codes[parent], minlength=nof_targets)
+    subset_counts = np.bincount(target_codes[subset], minlength=nof_targets)
+    assert (
+        (subset_counts == 0) | (subset_counts == parent_counts)
+    ).all(), f"Filtering is not accurate for {col_name}."
+
+
 ########### Final sanity checks for the dataset ###########
-def check_null_values(df_result: pd.DataFrame):
+# string representations of null values that are not recognised as null values
+HIDDEN_NULL_VALUES = ["nan", "null"]
+
+
+def is_text_column(column: pd.Series) -> bool:
     """
-    Check if any columns contain nan or null which aren't recognised as null values.
+    Check if a column can contain text values,
+    i.e., if it has an object, string or categorical data type.
+    Values in numeric or boolean columns can not be hidden null values or mixed types.
+
+    :param column: Column of the dataset
+    :type column: pd.Series
+    :return: True if the column can contain text values
+    :rtype: bool
     """
-    for col in df_result.columns:
-        col_as_str = set(df_result[df_result[col].notnull()][col].astype(str))
-        assert (
-            "nan" not in col_as_str
-        ), f"Problem with unrecognised nan value in column {col}"
-        assert (
-            "null" not in col_as_str
-        ), f"Problem with unrecognised null value in column {col}"
+    return (
+        pd.api.types.is_object_dtype(column.dtype)
+        or pd.api.types.is_string_dtype(column.dtype)
+        or isinstance(column.dtype, pd.CategoricalDtype)
+    )
 
 
-def check_for_mixed_types(df_result: pd.DataFrame):
+def check_null_values(df_result: pd.DataFrame) -> pd.DataFrame:
     """
-    Check that there are no mixed types in columns with dtype=object.
+    Count the values in text columns which are nan or null
+    but aren't recognised as null values (e.g., the string 'nan').
+    Only object, string and categorical columns are checked.
+    For categorical columns, only the categories are compared.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :return: Pandas DataFrame with one row per checked column
+        (columns column, dtype, hidden_null_values)
+    :rtype: pd.DataFrame
     """
-    for col, dtype in df_result.dtypes.to_dict().items():
-        if dtype == object:
-            col_original = set(df_result[df_result[col].notnull()][col])
-            col_as_str = set(df_result[df_result[col].notnull()][col].astype(str))
-            # is there a difference in the two sets (ignoring null values)
-            assert (
-                len(col_original - col_as_str) == 0
-            ), f"Mixed types in colum {col}: {col_original-col_as_str}"
-            assert (
-                len(col_as_str - col_original) == 0
-            ), f"Mixed types in colum {col}: {col_as_str-col_original}"
+    report = []
+    for col in df_result.columns:
+        column = df_result[col]
+        if not is_text_column(column):
+            continue
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            is_hidden_null = column.cat.categories.astype(str).isin(HIDDEN_NULL_VALUES)
+            hidden_null_values = int(
+                np.isin(column.cat.codes, np.flatnonzero(is_hidden_null)).sum()
+            )
+        else:
+            hidden_null_values = int(column.isin(HIDDEN_NULL_VALUES).sum())
+        report.append([col, str(column.dtype), hidden_null_values])
+    return pd.DataFrame(report, columns=["column", "dtype", "hidden_null_values"])
 
 
+def check_for_mixed_types(df_result: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get the type of the values in columns with dtype=object and in categorical columns.
+    A column has mixed types if its non-null values are not all strings.
+    For categorical columns, only the categories that are used are checked.
+
+    :param df_result: Pandas DataFrame with compound-target pairs
+    :type df_result: pd.DataFrame
+    :return: Pandas DataFrame with one row per object or categorical column
+        (columns column, inferred_type, mixed_types)
+    :rtype: pd.DataFrame
+    """
+    report = []
+    for col in df_result.columns:
+        column = df_result[col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+            values = column.cat.categories[np.unique(codes[codes >= 0])]
+        elif column.dtype == object:
+            values = column
+        else:
+            continue
+        inferred_type = pd.api.types.infer_dtype(values, skipna=True)
+        report.append([col, inferred_type, inferred_type not in ("string", "empty")])
+    return pd.DataFrame(report, columns=["column", "inferred_type", "mixed_types"])
+
+
+@sanity_check
 def sanity_checks(
     dataset: Dataset,
 ):
@@ -206,128 +437,108 @@ def sanity_checks(
     Check basic assumptions about the finished dataset, specifically:
 
     - no columns contain nan or null values which aren't recognised as null values
-    - there are no mixed types in columns with dtype=object
+    - there are no mixed types in columns with dtype=object or categorical columns
+
+    The fact and dimension tables (see star_schema) are checked separately,
+    i.e., the compound and target attributes are not joined
+    onto the compound-target pairs for the checks.
 
     :param dataset: Dataset with compound-target pairs.
     :type dataset: Dataset
-    :param calculate_rdkit: True if the DataFrame contains RDKit-based compound properties
-    :type calculate_rdkit: bool
     """
-    check_null_values(dataset.df_result)
-    check_for_mixed_types(dataset.df_result)
+    tables = [
+        get_sample(df)
+        for df in [dataset.df_result, dataset.df_compounds, dataset.df_targets]
+    ]
+    df_null_values = pd.concat([check_null_values(df) for df in tables])
+    df_null_values = df_null_values[df_null_values["hidden_null_values"] > 0]
+    assert df_null_values.empty, "Problem with unrecognised nan or null values:\n" + (
+        df_null_values.to_string(index=False)
+    )
+
+    df_mixed_types = pd.concat([check_for_mixed_types(df) for df in tables])
+    df_mixed_types = df_mixed_types[df_mixed_types["mixed_types"]]
+    assert df_mixed_types.empty, "Mixed types in columns:\n" + (
+        df_mixed_types.to_string(index=False)
+    )
 
 
 ########### Sanity checks for writing and reading a dataset ###########
+@sanity_check
 def test_equality(
     current_df: pd.DataFrame,
     read_file_name: str,
-    assay_type: str,
     file_type_list: list[str],
-    calculate_rdkit: bool,
 ):
     """
-    Check that the file that was written to <read_file_name> 
+    Check that the file that was written to <read_file_name>
     is identical to the DataFrame <current_df> it was based on.
+    The file is read with the data types in its schema sidecar (see column_schema).
+    If the check level is "sample", only the sampled rows are read and compared.
 
     :param current_df: Pandas DataFrame that was written to read_file_name
     :type current_df: pd.DataFrame
     :param read_file_name: Name of the file current_df was written to
     :type read_file_name: str
-    :param assay_type: Types of assays current_df contains information about. \
-        Options:    "BF" (binding+functional), 
-                    "B" (binding), 
-                    "all" (contains both BF and B information)
-    :type assay_type: str
     :param file_type_list: List of file extensions used with read_file_name. Options: csv, xlsx
     :type file_type_list: list[str]
-    :param calculate_rdkit: If True, current_df contains RDKit-based columns
-    :type calculate_rdkit: bool
     """
-    current_df_copy = current_df.copy().reset_index(drop=True)
+    positions = get_sample_positions(len(current_df))
+    if positions is None:
+        current_df_copy = current_df.copy().reset_index(drop=True)
+    else:
+        current_df_copy = current_df.iloc[positions].reset_index(drop=True)
 
     for file_type in file_type_list:
-        if file_type == "csv":
-            try:
-                read_file = pd.read_csv(
-                    read_file_name + ".csv",
-                    sep=";",
-                    dtype={
-                        "mutation": "str",
-                        "tid_mutation": "str",
-                        "atc_level1": "str",
-                        "target_class_l2": "str",
-                        "ro3_pass": "str",
-                        "molecular_species": "str",
-                        "full_molformula": "str",
-                        "standard_inchi": "str",
-                        "standard_inchi_key": "str",
-                        "canonical_smiles": "str",
-                        "scaffold_w_stereo": "str",
-                        "scaffold_wo_stereo": "str",
-                    },
-                )
-            except FileNotFoundError:
-                print("{read_file_name}.{file_type} not found")
-                continue
-        elif file_type == "xlsx":
-            try:
-                read_file = pd.read_excel(read_file_name + ".xlsx")
-            except FileNotFoundError:
-                print("{read_file_name}.{file_type} not found")
-                continue
-
-        if assay_type in ("BF", "all"):
-            read_file = read_file.astype(
-                {
-                    "first_publication_cpd_target_pair_BF": "Int64",
-                    "first_publication_cpd_target_pair_w_pchembl_BF": "Int64",
-                }
-            )
-        if assay_type in ("B", "all"):
-            read_file = read_file.astype(
-                {
-                    "first_publication_cpd_target_pair_B": "Int64",
-                    "first_publication_cpd_target_pair_w_pchembl_B": "Int64",
-                }
-            )
-        read_file = read_file.astype(
-            {
-                "first_approval": "Int64",
-                "usan_year": "Int64",
-                "first_publication_cpd": "Int64",
-                "hba": "Int64",
-                "hbd": "Int64",
-                "rtb": "Int64",
-                "num_ro5_violations": "Int64",
-                "aromatic_rings": "Int64",
-                "heavy_atoms": "Int64",
-                "hba_lipinski": "Int64",
-                "hbd_lipinski": "Int64",
-                "num_lipinski_ro5_violations": "Int64",
-            }
-        )
-        if calculate_rdkit:
-            read_file = read_file.astype(
-                {
-                    "num_aliphatic_carbocycles": "Int64",
-                    "num_aliphatic_heterocycles": "Int64",
-                    "num_aliphatic_rings": "Int64",
-                    "num_aromatic_carbocycles": "Int64",
-                    "num_aromatic_heterocycles": "Int64",
-                    "num_aromatic_rings": "Int64",
-                    "num_heteroatoms": "Int64",
-                    "num_saturated_carbocycles": "Int64",
-                    "num_saturated_heterocycles": "Int64",
-                    "num_saturated_rings": "Int64",
-                    "ring_count": "Int64",
-                    "num_stereocentres": "Int64",
-                    "aromatic_atoms": "Int64",
-                    "aromatic_c": "Int64",
-                    "aromatic_n": "Int64",
-                    "aromatic_hetero": "Int64",
-                }
-            )
+        try:
+            if file_type == "csv":
+                read_file = column_schema.read_csv(read_file_name, positions)
+            else:
+                read_file = column_schema.read_excel(read_file_name, positions)
+        except FileNotFoundError:
+            print(f"{read_file_name}.{file_type} not found")
+            continue
 
         assert read_file.equals(
             current_df_copy
         ), f"File {read_file_name}.{file_type} is not equal to the dataset it was based on."
+
+
+@sanity_check
+def check_content_hash(
+    read_file_name: str,
+    file_type_list: list[str],
+    content_hash: content_hashes.ContentHash,
+):
+    """
+    Check that the files that were written to <read_file_name>
+    have the content hash that was calculated while writing them.
+    CSV and parquet files are read back in chunks, i.e., memory usage does not depend
+    on the size of the file. All rows are checked independent of the check level.
+    The rows of partitioned parquet files are grouped by partition,
+    i.e., they are compared with the order-independent digest.
+
+    :param read_file_name: Name of the file the dataset was written to
+    :type read_file_name: str
+    :param file_type_list: List of file extensions used with read_file_name.
+        Options: csv, xlsx, parquet
+    :type file_type_list: list[str]
+    :param content_hash: Content hash calculated while writing the dataset
+    :type content_hash: content_hashes.ContentHash
+    """
+    for file_type in file_type_list:
+        if file_type == "csv":
+            read_hash = content_hashes.get_csv_content_hash(read_file_name)
+        elif file_type == "parquet":
+            read_hash = parquet_files.get_parquet_content_hash(read_file_name)
+        else:
+            read_hash = content_hashes.get_excel_content_hash(read_file_name)
+        if file_type == "parquet" and parquet_files.is_partitioned(read_file_name):
+            equal_content = (
+                read_hash.unordered_hexdigest() == content_hash.unordered_hexdigest()
+            )
+        else:
+            equal_content = read_hash.hexdigest() == content_hash.hexdigest()
+        assert (
+            read_hash.nof_rows == content_hash.nof_rows and equal_content
+        ), f"File {read_file_name}.{file_type} is not equal to the dataset it was based on."
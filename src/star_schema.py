@@ -0,0 +1,289 @@
+"""
+Star schema of the dataset:
+a narrow fact table with one row per compound-target pair (Dataset.df_result),
+a compound dimension table with one row per compound (Dataset.df_compounds)
+and a target dimension table with one row per target (Dataset.df_targets).
+
+Compound and target annotations are added to the dimension tables
+and are only joined onto the compound-target pairs
+when the dataset is written, chunk by chunk (see output.get_output_chunks).
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import column_schema
+from dataset import Dataset
+
+# compound and target attributes of the initial compound-target pairs
+COMPOUND_COLUMNS = [
+    "parent_chemblid",
+    "parent_pref_name",
+    "max_phase",
+    "first_approval",
+    "usan_year",
+    "black_box_warning",
+    "prodrug",
+    "oral",
+    "parenteral",
+    "topical",
+]
+TARGET_COLUMNS = [
+    "target_chembl_id",
+    "target_pref_name",
+    "target_type",
+    "organism",
+]
+
+
+########### Fact and Dimension Tables ###########
+def split_dimensions(
+    df: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Split a wide DataFrame with compound-target pairs into
+    the fact table and the compound and target dimension tables.
+    Dimension tables are in order of the first appearance of the compound / target.
+
+    :param df: Pandas DataFrame with compound-target pairs
+        including the compound and target attributes
+    :type df: pd.DataFrame
+    :return: Fact table, compound dimension table, target dimension table
+    :rtype: tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+    """
+    df_compounds = (
+        df[["parent_molregno"] + COMPOUND_COLUMNS]
+        .drop_duplicates(subset=["parent_molregno"])
+        .reset_index(drop=True)
+    )
+    df_targets = (
+        df[["tid"] + TARGET_COLUMNS]
+        .drop_duplicates(subset=["tid"])
+        .reset_index(drop=True)
+    )
+    df_fact = df.drop(columns=COMPOUND_COLUMNS + TARGET_COLUMNS)
+    return df_fact, df_compounds, df_targets
+
+
+def add_dimension_rows(
+    dataset: Dataset, df_compounds: pd.DataFrame, df_targets: pd.DataFrame
+):
+    """
+    Add the compounds and targets that are not in the dimension tables yet.
+
+    :param dataset: Dataset with compound-target pairs.
+        Will be updated to include the new compounds and targets.
+    :type dataset: Dataset
+    :param df_compounds: Compound dimension table with new compounds
+    :type df_compounds: pd.DataFrame
+    :param df_targets: Target dimension table with new targets
+    :type df_targets: pd.DataFrame
+    """
+    dataset.df_compounds = pd.concat(
+        [
+            dataset.df_compounds,
+            df_compounds[
+                ~df_compounds["parent_molregno"].isin(
+                    dataset.df_compounds["parent_molregno"]
+                )
+            ],
+        ]
+    ).reset_index(drop=True)
+    dataset.df_targets = pd.concat(
+        [
+            dataset.df_targets,
+            df_targets[~df_targets["tid"].isin(dataset.df_targets["tid"])],
+        ]
+    ).reset_index(drop=True)
+
+
+def prune_dimensions(dataset: Dataset):
+    """
+    Remove compounds and targets from the dimension tables
+    that are not part of any compound-target pair anymore.
+
+    :param dataset: Dataset with compound-target pairs.
+        Will be updated to only include compounds and targets of the fact table.
+    :type dataset: Dataset
+    """
+    dataset.df_compounds = dataset.df_compounds[
+        dataset.df_compounds["parent_molregno"].isin(
+            dataset.df_result["parent_molregno"].unique()
+        )
+    ].reset_index(drop=True)
+    dataset.df_targets = dataset.df_targets[
+        dataset.df_targets["tid"].isin(dataset.df_result["tid"].unique())
+    ].reset_index(drop=True)
+
+
+########### Lookups ###########
+def get_dimension_values(
+    df_fact: pd.DataFrame, df_dimension: pd.DataFrame, key: str, columns: list[str]
+) -> pd.DataFrame:
+    """
+    Look up columns of a dimension table for every row of the fact table.
+
+    :param df_fact: Fact table
+    :type df_fact: pd.DataFrame
+    :param df_dimension: Dimension table with one row per key
+    :type df_dimension: pd.DataFrame
+    :param key: Column that links the fact and the dimension table
+    :type key: str
+    :param columns: Columns of the dimension table
+    :type columns: list[str]
+    :return: Pandas DataFrame with the columns, aligned with the index of df_fact
+    :rtype: pd.DataFrame
+    """
+    return (
+        df_dimension.set_index(key)[columns]
+        .reindex(df_fact[key].to_numpy())
+        .set_axis(df_fact.index)
+    )
+
+
+def get_compound_values(dataset: Dataset, columns: list[str]) -> pd.DataFrame:
+    """
+    Look up compound attributes for every compound-target pair.
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :param columns: Columns of the compound dimension table
+    :type columns: list[str]
+    :return: Pandas DataFrame with the columns, aligned with dataset.df_result
+    :rtype: pd.DataFrame
+    """
+    return get_dimension_values(
+        dataset.df_result, dataset.df_compounds, "parent_molregno", columns
+    )
+
+
+def get_ordered_targets(dataset: Dataset) -> pd.DataFrame:
+    """
+    Get the target dimension table restricted to the targets in the fact table
+    in order of their first appearance in the fact table.
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :return: Target dimension table
+    :rtype: pd.DataFrame
+    """
+    return (
+        dataset.df_targets.set_index("tid")
+        .loc[dataset.df_result["tid"].unique()]
+        .reset_index()
+    )
+
+
+########### Wide Table ###########
+def get_columns(dataset: Dataset) -> list[str]:
+    """
+    Get the columns of the wide table (compound-target pairs
+    with all compound and target attributes) in the output order, i.e.,
+    the columns in the column schema (see column_schema) in their order
+    followed by the other columns of the fact table (e.g., filtering columns for subsets).
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :return: List of columns of the wide table
+    :rtype: list[str]
+    """
+    columns = set(dataset.df_result.columns)
+    columns.update(dataset.df_compounds.columns)
+    columns.update(dataset.df_targets.columns)
+    schema_columns = [
+        column.name
+        for column in column_schema.get_columns(calculate_rdkit=True)
+        if column.name in columns
+    ]
+    return schema_columns + [
+        col for col in dataset.df_result.columns if col not in schema_columns
+    ]
+
+
+def get_dimension_positions(dataset: Dataset) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the position of the compound and of the target of every compound-target pair
+    in the dimension tables.
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :return: Positions in the compound and in the target dimension table,
+        aligned with dataset.df_result
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    compound_positions = pd.Index(dataset.df_compounds["parent_molregno"]).get_indexer(
+        dataset.df_result["parent_molregno"]
+    )
+    target_positions = pd.Index(dataset.df_targets["tid"]).get_indexer(
+        dataset.df_result["tid"]
+    )
+    assert (compound_positions >= 0).all() and (
+        target_positions >= 0
+    ).all(), (
+        "Compounds or targets of compound-target pairs are not in the dimension tables."
+    )
+    return compound_positions, target_positions
+
+
+def join_dimensions(
+    dataset: Dataset,
+    positions: Optional[np.ndarray] = None,
+    columns: Optional[list[str]] = None,
+    dimension_positions: Optional[tuple[np.ndarray, np.ndarray]] = None,
+) -> pd.DataFrame:
+    """
+    Join the compound and target attributes onto the compound-target pairs
+    (or the selected compound-target pairs).
+    The order of the compound-target pairs is kept.
+    Only the selected rows and columns are copied,
+    i.e., the wide table can be built chunk by chunk.
+
+    :param dataset: Dataset with compound-target pairs.
+    :type dataset: Dataset
+    :param positions: Positions of the selected rows of dataset.df_result,
+        all rows if None, defaults to None
+    :type positions: Optional[np.ndarray], optional
+    :param columns: Selected columns of the wide table,
+        all columns (see get_columns) if None, defaults to None
+    :type columns: Optional[list[str]], optional
+    :param dimension_positions: Positions of the compounds and targets
+        in the dimension tables (see get_dimension_positions),
+        calculated if None, defaults to None
+    :type dimension_positions: Optional[tuple[np.ndarray, np.ndarray]], optional
+    :return: Pandas DataFrame with one row per selected compound-target pair
+        and the selected columns
+    :rtype: pd.DataFrame
+    """
+    if columns is None:
+        columns = get_columns(dataset)
+    if positions is None:
+        positions = np.arange(len(dataset.df_result))
+    if dimension_positions is None:
+        dimension_positions = get_dimension_positions(dataset)
+
+    df_fact = dataset.df_result
+    tables = [
+        df_fact.iloc[
+            positions,
+            df_fact.columns.get_indexer(
+                [col for col in columns if col in df_fact.columns]
+            ),
+        ].reset_index(drop=True)
+    ]
+    for df_dimension, dimension_rows in zip(
+        [dataset.df_compounds, dataset.df_targets], dimension_positions
+    ):
+        dimension_columns = [
+            col
+            for col in columns
+            if col in df_dimension.columns and col not in df_fact.columns
+        ]
+        tables.append(
+            df_dimension.iloc[
+                dimension_rows[positions],
+                df_dimension.columns.get_indexer(dimension_columns),
+            ].reset_index(drop=True)
+        )
+    return pd.concat(tables, axis=1)[columns]
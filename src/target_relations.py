@@ -0,0 +1,309 @@
+"""
+Graph index of related targets based on the ChEMBL target_relations table.
+
+Edges are selected with (target type, relationship, target type) rules
+and stored as a compact adjacency structure
+(sorted source target ids, offsets into the concatenated related target ids).
+Optionally, the graph is closed over several hops.
+The graph can be cached on disk, one file per ChEMBL version and configuration.
+"""
+
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class EdgeRule:
+    """
+    Rule for edges of the target relation graph:
+    *target_type_1 -[relationship]-> target_type_2*.
+
+    - target_type_1:  Target type of the target (tid)
+    - relationship:   Relationship in the target_relations table (e.g., SUPERSET OF)
+    - target_type_2:  Target type of the related target (related_tid)
+    """
+
+    target_type_1: str
+    relationship: str
+    target_type_2: str
+
+
+DEFAULT_EDGE_RULES = (
+    EdgeRule("PROTEIN FAMILY", "SUPERSET OF", "SINGLE PROTEIN"),
+    EdgeRule("PROTEIN COMPLEX", "SUPERSET OF", "SINGLE PROTEIN"),
+    EdgeRule("PROTEIN COMPLEX GROUP", "SUPERSET OF", "SINGLE PROTEIN"),
+    EdgeRule("SINGLE PROTEIN", "EQUIVALENT TO", "SINGLE PROTEIN"),
+    EdgeRule("CHIMERIC PROTEIN", "SUPERSET OF", "SINGLE PROTEIN"),
+    EdgeRule("PROTEIN-PROTEIN INTERACTION", "SUPERSET OF", "SINGLE PROTEIN"),
+)
+
+
+def parse_edge_rule(rule: str) -> EdgeRule:
+    """
+    Parse an edge rule of the form '<target type>,<relationship>,<target type>',
+    e.g., 'PROTEIN FAMILY,SUPERSET OF,SINGLE PROTEIN'.
+
+    :param rule: String representation of the edge rule
+    :type rule: str
+    :raises ValueError: If the rule does not consist of three comma-separated parts
+    :return: Parsed edge rule
+    :rtype: EdgeRule
+    """
+    parts = [part.strip().upper() for part in rule.split(",")]
+    if len(parts) != 3 or not all(parts):
+        raise ValueError(
+            f"Invalid edge rule '{rule}'. "
+            "Expected '<target type>,<relationship>,<target type>'."
+        )
+    return EdgeRule(*parts)
+
+
+########### Graph ###########
+@dataclass(frozen=True)
+class TargetRelationGraph:
+    """
+    Adjacency structure of related targets.
+    The related targets of tids[i] are related_tids[offsets[i]:offsets[i + 1]].
+
+    - tids:           Sorted array of target ids with at least one related target
+    - offsets:        Array of length len(tids) + 1 with offsets into related_tids
+    - related_tids:   Concatenated arrays of related target ids
+    """
+
+    tids: np.ndarray
+    offsets: np.ndarray
+    related_tids: np.ndarray
+
+    def get_related_tids(self, tid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the related targets of every entry of tid.
+
+        :param tid: Array of target ids
+        :type tid: np.ndarray
+        :return: Position of the entry in tid for every related target,
+            array of related target ids.
+            Related targets are in the order of the entries in tid.
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        tid = np.asarray(tid, dtype="int64")
+        if len(self.tids) == 0:
+            return np.array([], dtype="int64"), np.array([], dtype="int64")
+
+        positions = np.minimum(np.searchsorted(self.tids, tid), len(self.tids) - 1)
+        found = self.tids[positions] == tid
+        starts = self.offsets[positions]
+        counts = np.where(found, self.offsets[positions + 1] - starts, 0)
+
+        rows = np.repeat(np.arange(len(tid)), counts)
+        # position of every related target within the related targets of its entry
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, self.related_tids[starts[rows] + within]
+
+
+def build_graph(sources: np.ndarray, targets: np.ndarray) -> TargetRelationGraph:
+    """
+    Build the adjacency structure from a list of edges.
+    Duplicate edges are removed, the order of the related targets
+    of a target is the order of their first edge.
+
+    :param sources: Target ids of the edges
+    :type sources: np.ndarray
+    :param targets: Related target ids of the edges
+    :type targets: np.ndarray
+    :return: Target relation graph
+    :rtype: TargetRelationGraph
+    """
+    sources = np.asarray(sources, dtype="int64")
+    targets = np.asarray(targets, dtype="int64")
+    is_first = ~pd.MultiIndex.from_arrays([sources, targets]).duplicated()
+    sources, targets = sources[is_first], targets[is_first]
+
+    order = np.argsort(sources, kind="stable")
+    tids, counts = np.unique(sources[order], return_counts=True)
+    return TargetRelationGraph(
+        tids=tids,
+        offsets=np.concatenate([[0], np.cumsum(counts)]).astype("int64"),
+        related_tids=targets[order],
+    )
+
+
+def get_closure(graph: TargetRelationGraph, max_hops: int) -> TargetRelationGraph:
+    """
+    Close the graph over up to max_hops hops, i.e.,
+    a target is related to all targets that can be reached with at most max_hops edges.
+    Targets are not related to themselves.
+
+    :param graph: Graph with the direct relations (one hop)
+    :type graph: TargetRelationGraph
+    :param max_hops: Maximum number of hops
+    :type max_hops: int
+    :return: Closed target relation graph
+    :rtype: TargetRelationGraph
+    """
+    counts = np.diff(graph.offsets)
+    sources = np.repeat(graph.tids, counts)
+    targets = graph.related_tids
+    frontier_sources, frontier_targets = sources, targets
+    for _ in range(max_hops - 1):
+        rows, next_targets = graph.get_related_tids(frontier_targets)
+        next_sources = frontier_sources[rows]
+        is_new = (next_sources != next_targets) & ~pd.MultiIndex.from_arrays(
+            [next_sources, next_targets]
+        ).isin(pd.MultiIndex.from_arrays([sources, targets]))
+        frontier = np.unique(
+            np.stack([next_sources[is_new], next_targets[is_new]], axis=1), axis=0
+        )
+        if len(frontier) == 0:
+            break
+        frontier_sources, frontier_targets = frontier[:, 0], frontier[:, 1]
+        sources = np.concatenate([sources, frontier_sources])
+        targets = np.concatenate([targets, frontier_targets])
+    return build_graph(sources, targets)
+
+
+########### Target Relations in ChEMBL ###########
+def get_target_relations_query() -> str:
+    """
+    Get the SQL query for related targets in the target_relations table
+    (see :func:`get_target_relation_edges`).
+
+    :return: SQL query
+    :rtype: str
+    """
+    sql = """
+    SELECT DISTINCT tr.tid, tr.relationship, tr.related_tid,
+        td1.target_type as target_type_1, td2.target_type as target_type_2
+    FROM target_relations tr
+    INNER JOIN target_dictionary td1
+        ON tr.tid = td1.tid
+    INNER JOIN target_dictionary td2
+        ON tr.related_tid = td2.tid
+    """
+
+    return sql
+
+
+def get_target_relation_edges(
+    chembl_con: sqlite3.Connection, rules: tuple[EdgeRule, ...]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the edges from target ids to related target ids
+    in the target_relations table that match one of the rules.
+    Edges are in the order of the rules.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param rules: Rules for the edges
+    :type rules: tuple[EdgeRule, ...]
+    :return: Target ids, related target ids
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    sql = get_target_relations_query()
+    df_related_targets = pd.read_sql_query(sql, con=chembl_con)
+
+    df_rules = pd.DataFrame(
+        [[rule.target_type_1, rule.relationship, rule.target_type_2] for rule in rules],
+        columns=["target_type_1", "relationship", "target_type_2"],
+    )
+    df_rules["rule"] = np.arange(len(df_rules))
+    df_edges = df_related_targets.merge(
+        df_rules, on=["target_type_1", "relationship", "target_type_2"], how="inner"
+    ).sort_values("rule", kind="stable")
+    return (
+        df_edges["tid"].to_numpy(dtype="int64"),
+        df_edges["related_tid"].to_numpy(dtype="int64"),
+    )
+
+
+########### Cache ###########
+def get_cache_file(
+    cache_path: str,
+    chembl_version: str,
+    rules: tuple[EdgeRule, ...],
+    max_hops: int,
+) -> str:
+    """
+    Get the name of the cache file for a ChEMBL version and graph configuration.
+
+    :param cache_path: Directory with cached graphs
+    :type cache_path: str
+    :param chembl_version: Version of ChEMBL
+    :type chembl_version: str
+    :param rules: Rules for the edges
+    :type rules: tuple[EdgeRule, ...]
+    :param max_hops: Maximum number of hops
+    :type max_hops: int
+    :return: Path to the cache file
+    :rtype: str
+    """
+    configuration = hashlib.sha256(repr((rules, max_hops)).encode()).hexdigest()
+    return os.path.join(
+        cache_path,
+        f"ChEMBL{chembl_version}_target_relation_graph_{configuration[:16]}.npz",
+    )
+
+
+def get_target_relation_graph(
+    chembl_con: sqlite3.Connection,
+    chembl_version: str,
+    rules: tuple[EdgeRule, ...],
+    max_hops: int,
+    cache_path: Optional[str],
+) -> TargetRelationGraph:
+    """
+    Get the graph of related targets.
+    If cache_path is set, the graph is loaded from the cache if possible
+    and written to the cache otherwise.
+
+    :param chembl_con: Sqlite3 connection to ChEMBL database.
+    :type chembl_con: sqlite3.Connection
+    :param chembl_version: Version of ChEMBL, used for the name of the cache file
+    :type chembl_version: str
+    :param rules: Rules for the edges
+    :type rules: tuple[EdgeRule, ...]
+    :param max_hops: Maximum number of hops
+    :type max_hops: int
+    :param cache_path: Directory with cached graphs,
+        no cache is used if None or if the ChEMBL version is unknown
+    :type cache_path: Optional[str]
+    :return: Target relation graph
+    :rtype: TargetRelationGraph
+    """
+    assert max_hops >= 1, "The target relation graph needs at least one hop."
+
+    cache_file = None
+    if cache_path is not None and chembl_version is None:
+        logging.warning(
+            "The target relation graph is not cached because the ChEMBL version is unknown."
+        )
+    elif cache_path is not None:
+        cache_file = get_cache_file(cache_path, chembl_version, rules, max_hops)
+        if os.path.exists(cache_file):
+            logging.debug("Loading target relation graph from %s", cache_file)
+            with np.load(cache_file) as cached:
+                return TargetRelationGraph(
+                    tids=cached["tids"],
+                    offsets=cached["offsets"],
+                    related_tids=cached["related_tids"],
+                )
+
+    graph = build_graph(*get_target_relation_edges(chembl_con, rules))
+    if max_hops > 1:
+        graph = get_closure(graph, max_hops)
+
+    if cache_file is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        np.savez(
+            cache_file,
+            tids=graph.tids,
+            offsets=graph.offsets,
+            related_tids=graph.related_tids,
+        )
+    return graph
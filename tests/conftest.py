@@ -0,0 +1,8 @@
+"""
+The modules in src are imported as top-level modules (as when running src/main.py).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,201 @@
+"""
+Tests for the aggregation of activities into compound-target pairs.
+"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import get_activity_ct_pairs
+
+SCHEMA = """
+CREATE TABLE molecule_dictionary (molregno INTEGER PRIMARY KEY, chembl_id TEXT, pref_name TEXT,
+  max_phase NUMERIC, first_approval INTEGER, usan_year INTEGER, black_box_warning INTEGER,
+  prodrug INTEGER, oral INTEGER, parenteral INTEGER, topical INTEGER);
+CREATE TABLE molecule_hierarchy (molregno INTEGER PRIMARY KEY, parent_molregno INTEGER,
+  active_molregno INTEGER);
+CREATE TABLE target_dictionary (tid INTEGER PRIMARY KEY, target_type TEXT, pref_name TEXT,
+  organism TEXT, chembl_id TEXT);
+CREATE TABLE variant_sequences (variant_id INTEGER PRIMARY KEY, mutation TEXT);
+CREATE TABLE docs (doc_id INTEGER PRIMARY KEY, year INTEGER, src_id INTEGER);
+CREATE TABLE assays (assay_id INTEGER PRIMARY KEY, assay_type TEXT, tid INTEGER,
+  variant_id INTEGER);
+CREATE TABLE activities (activity_id INTEGER PRIMARY KEY, assay_id INTEGER, doc_id INTEGER,
+  molregno INTEGER, pchembl_value NUMERIC, potential_duplicate INTEGER,
+  standard_relation TEXT, data_validity_comment TEXT);
+"""
+
+MOLECULES = [
+    (1, "CHEMBL1", "cpd 1", 4, 1990, 1985, 0, 0, 1, 0, 0),
+    (2, "CHEMBL2", None, 2, None, None, 0, 0, 0, 1, 0),
+    (3, "CHEMBL3", "cpd 3", None, None, 2001, 1, 1, 1, 1, 0),
+]
+# salt form 11 of parent 1
+HIERARCHY = [(1, 1, 1), (2, 2, 2), (3, 3, 3), (11, 1, 11)]
+TARGETS = [
+    (10, "SINGLE PROTEIN", "target 10", "Homo sapiens", "CHEMBL10"),
+    (20, "PROTEIN COMPLEX", "target 20", "Mus musculus", "CHEMBL20"),
+    (30, "CELL-LINE", "target 30", "Homo sapiens", "CHEMBL30"),
+]
+VARIANTS = [(1, "V600E"), (2, "T790M")]
+# docs 3 and 5 are not from the literature (src_id != 1), docs 4 and 5 have no year
+DOCS = [(1, 2000, 1), (2, 1995, 1), (3, 2010, 2), (4, None, 1), (5, None, 2)]
+ASSAYS = [
+    (100, "B", 10, None),
+    (101, "F", 10, None),
+    (102, "B", 10, 1),
+    (103, "B", 20, None),
+    (104, "F", 20, 2),
+    (105, "A", 10, None),
+    (106, "B", 30, None),
+]
+# (activity_id, assay_id, doc_id, molregno, pchembl_value)
+# The pairs first appear in a different order than their GROUP BY order.
+# Pairs have odd and even numbers of values (median of one or two values)
+# and pchembl values have two decimal places as in ChEMBL,
+# i.e., they are not exactly representable as floats
+# and their mean depends on the order of summation.
+ACTIVITIES = [
+    (1, 103, 1, 3, 4.74),
+    (2, 100, 2, 2, 8.66),
+    (3, 100, 1, 11, 8.2),
+    (4, 101, 4, 1, 5.4),
+    (5, 102, 3, 1, 6.72),
+    (6, 100, 3, 1, 6.47),
+    (7, 104, 2, 3, 7.58),
+    (8, 103, 2, 3, 8.34),
+    (9, 100, 1, 2, 4.52),
+    (10, 101, 2, 1, 4.16),
+    (11, 105, 1, 1, 5.0),  # ADMET assay, not aggregated
+    (12, 106, 1, 1, 5.0),  # not a protein target
+    (13, 102, 1, 1, 8.6),
+    (14, 103, 3, 3, 6.38),
+    (15, 101, 1, 2, 8.19),
+    (16, 100, 4, 1, 4.01),
+    (17, 103, 5, 2, 6.45),  # pair without a publication year
+]
+# activities that are not considered
+EXCLUDED_ACTIVITIES = [
+    (18, 100, 1, 3, None, 0, "=", None),
+    (19, 100, 1, 3, 9.5, 1, "=", None),
+    (20, 100, 1, 3, 9.5, 0, ">", None),
+    (21, 100, 1, 3, 9.5, 0, "=", "Outside typical range"),
+]
+
+
+@pytest.fixture(name="chembl_con")
+def fixture_chembl_con():
+    """
+    Small ChEMBL-like SQLite database with compound-target pairs
+    with several activities, binding and functional assays, mutations,
+    salt forms and activities that are not considered.
+    """
+    chembl_con = sqlite3.connect(":memory:")
+    chembl_con.executescript(SCHEMA)
+    chembl_con.executemany(
+        "INSERT INTO molecule_dictionary VALUES (?,?,?,?,?,?,?,?,?,?,?)", MOLECULES
+    )
+    chembl_con.executemany("INSERT INTO molecule_hierarchy VALUES (?,?,?)", HIERARCHY)
+    chembl_con.executemany("INSERT INTO target_dictionary VALUES (?,?,?,?,?)", TARGETS)
+    chembl_con.executemany("INSERT INTO variant_sequences VALUES (?,?)", VARIANTS)
+    chembl_con.executemany("INSERT INTO docs VALUES (?,?,?)", DOCS)
+    chembl_con.executemany("INSERT INTO assays VALUES (?,?,?,?)", ASSAYS)
+    chembl_con.executemany(
+        "INSERT INTO activities VALUES (?,?,?,?,?,0,'=',NULL)", ACTIVITIES
+    )
+    chembl_con.executemany(
+        "INSERT INTO activities VALUES (?,?,?,?,?,?,?,?)", EXCLUDED_ACTIVITIES
+    )
+    yield chembl_con
+    chembl_con.close()
+
+
+def assert_aggregations_equal(df_result: pd.DataFrame, df_expected: pd.DataFrame):
+    """
+    Assert that two aggregations of the activities are equal.
+    Aggregated pchembl values are compared up to floating-point rounding
+    since the values may be summed in a different order.
+    Everything else (keys, years, row order and data types) is compared exactly.
+    """
+    pchembl_columns = [
+        col for col in df_expected.columns if col.startswith("pchembl_value")
+    ]
+    pd.testing.assert_frame_equal(
+        df_result.drop(columns=pchembl_columns),
+        df_expected.drop(columns=pchembl_columns),
+        check_exact=True,
+    )
+    pd.testing.assert_frame_equal(
+        df_result[pchembl_columns],
+        df_expected[pchembl_columns],
+        check_exact=False,
+        rtol=1e-12,
+    )
+
+
+@pytest.mark.parametrize("limit_to_literature", [False, True])
+def test_sql_aggregation_equals_pandas_aggregation(chembl_con, limit_to_literature):
+    """
+    Aggregating the activities in SQLite results in the same pairs
+    and row order as aggregating them in memory,
+    the aggregated pchembl values are equal up to floating-point rounding.
+    """
+    df_expected = (
+        get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl(
+            chembl_con, limit_to_literature
+        )
+    )
+    df_result = (
+        get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl_sql(
+            chembl_con, limit_to_literature
+        )
+    )
+
+    assert_aggregations_equal(df_result, df_expected)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5])
+@pytest.mark.parametrize("limit_to_literature", [False, True])
+def test_streaming_aggregation_equals_pandas_aggregation(
+    chembl_con, limit_to_literature, chunk_size
+):
+    """
+    Aggregating the activities in chunks results in the same pairs,
+    row order and data types as aggregating them in memory,
+    also if the values of a pair (with odd and even numbers of values for the median)
+    are spread across chunks or a chunk contains no binding or functional activities.
+    The aggregated pchembl values are equal up to floating-point rounding.
+    """
+    df_expected = (
+        get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl(
+            chembl_con, limit_to_literature
+        )
+    )
+    df_result = get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl_streaming(
+        chembl_con, limit_to_literature, chunk_size
+    )
+
+    assert_aggregations_equal(df_result, df_expected)
+
+
+def test_sql_aggregation_keeps_first_appearance_order(chembl_con):
+    """
+    Compound-target pairs are returned in the order of their first activity.
+    """
+    df_result = (
+        get_activity_ct_pairs.get_aggregated_compound_target_pairs_with_pchembl_sql(
+            chembl_con, False
+        )
+    )
+
+    assert list(
+        zip(df_result["parent_molregno"], df_result["tid"], df_result["mutation"])
+    ) == [
+        (3, 20, None),
+        (2, 10, None),
+        (1, 10, None),
+        (1, 10, "V600E"),
+        (3, 20, "T790M"),
+        (2, 20, None),
+    ]